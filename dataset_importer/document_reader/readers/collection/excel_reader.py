@@ -1,18 +1,34 @@
+import itertools
 import xlrd
 from collection_reader import CollectionReader
 from datetime import datetime, timedelta, date
 from dataset_importer.utils import HandleDatasetImportException
+from texta.settings import DATASET_IMPORTER
+
+try:
+	import openpyxl
+except ImportError:
+	openpyxl = None
+
+# Cell type codes of xlrd, also used for the cells of openpyxl
+EMPTY, TEXT, NUMBER, DATE, BOOLEAN = xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_TEXT, xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_DATE, xlrd.XL_CELL_BOOLEAN
 
 
 class ExcelReader(CollectionReader):
-	empty_and_blank_codes = {0}
+	"""Reads the rows of every sheet of XLS and XLSX workbooks as documents, the first row of a sheet holding the feature names.
+
+	Workbooks are read a row at a time: XLSX files with openpyxl in read-only mode, XLS files with xlrd loading one sheet
+	at a time. Column converters are inferred from the first DATASET_IMPORTER['excel_reader']['sample_rows'] rows of a sheet,
+	the values of later rows which they can not convert are stored as strings.
+	"""
+	empty_and_blank_codes = {EMPTY, xlrd.XL_CELL_BLANK}
 
 	converters = {
 		'text':    lambda string: string if string else '',
-		'date':    lambda date: ExcelReader.from_excel_ordinal(date) if date else None,
-		'bool':    lambda boolean_int: bool(boolean_int) if boolean_int in {0, 1} else None,
+		'date':    lambda date: ExcelReader.to_date(date) if date else None,
+		'bool':    lambda boolean_int: ExcelReader.to_bool(boolean_int),
 		'float':   lambda float_: float_,
-		'int':     lambda float_: int(float_) if str(float_).isdigit() else None,
+		'int':     lambda number: ExcelReader.to_int(number),
 		'default': lambda val: str(val)
 	}
 
@@ -24,23 +40,14 @@ class ExcelReader(CollectionReader):
 			for file_path in ExcelReader.get_file_list(directory, file_extension):
 
 				try:
-					book = xlrd.open_workbook(file_path)
-					sheet = book.sheet_by_index(0)
-
-					feature_labels = [cell.value if isinstance(cell.value, str) else str(cell.value) for cell in sheet.row(0)]
-					feature_converters = []
-
-					for column_idx in range(sheet.ncols):
-						col_types = list(
-							{col_type for col_type in sheet.col_types(column_idx)[1:]  # TODO [1:] will go out of range
-							 if col_type not in ExcelReader.empty_and_blank_codes})
-						col_values = sheet.col_values(column_idx)
-						feature_converters.append(ExcelReader.get_column_converter(col_types, col_values))
-
-					for row_idx, excel_row in ((row_idx, sheet.row(row_idx)) for row_idx in range(1, sheet.nrows)):
-						document = {feature_labels[col_idx]: feature_converters[col_idx](cell.value) for col_idx, cell in enumerate(excel_row)}
-						document['_texta_id'] = '{0}_{1}'.format(file_path, row_idx)
-						yield document
+					for sheet_idx, sheet_name, rows in ExcelReader.get_sheets(file_path):
+						for row_idx, document in ExcelReader.get_sheet_documents(rows):
+							# Documents of the first sheet keep the IDs of the readers which only read the first sheet
+							if sheet_idx == 0:
+								document['_texta_id'] = '{0}_{1}'.format(file_path, row_idx)
+							else:
+								document['_texta_id'] = '{0}_{1}_{2}'.format(file_path, sheet_name, row_idx)
+							yield document
 
 				except Exception as e:
 					HandleDatasetImportException(kwargs, e, file_path=file_path)
@@ -53,32 +60,133 @@ class ExcelReader(CollectionReader):
 
 		for file_extension in ['xls', 'xlsx']:
 			for file_path in ExcelReader.get_file_list(directory, file_extension):
-				book = xlrd.open_workbook(file_path)
-				sheet = book.sheet_by_index(0)
-				total_documents += max(0, sheet.nrows - 1)
+				total_documents += ExcelReader.count_file_documents(file_path)
 
 		return total_documents
 
+	@staticmethod
+	def count_file_documents(file_path):
+		if ExcelReader.uses_openpyxl(file_path):
+			book = openpyxl.load_workbook(file_path, read_only=True)
+			try:
+				total_documents = 0
+				for sheet in book.worksheets:
+					# Sizes are read from the dimensions of the sheet, only sheets without them are counted row by row
+					if sheet.max_row is not None:
+						total_documents += max(0, sheet.max_row - sheet.min_row)
+					else:
+						total_documents += max(0, sum(1 for row in sheet.iter_rows(values_only=True)) - 1)
+				return total_documents
+			finally:
+				book.close()
+
+		book = xlrd.open_workbook(file_path, on_demand=True)
+		try:
+			total_documents = 0
+			for sheet_idx in range(book.nsheets):
+				total_documents += max(0, book.sheet_by_index(sheet_idx).nrows - 1)
+				book.unload_sheet(sheet_idx)
+			return total_documents
+		finally:
+			book.release_resources()
+
+	@staticmethod
+	def uses_openpyxl(file_path):
+		# xlrd 2 reads only XLS files
+		return openpyxl is not None and file_path.lower().endswith('.xlsx')
+
+	@staticmethod
+	def get_sheets(file_path):
+		"""Yields the (index, name, rows) of the workbook's sheets, the rows being an iterator of (type code, value) lists.
+		"""
+		if ExcelReader.uses_openpyxl(file_path):
+			book = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+			try:
+				for sheet_idx, sheet in enumerate(book.worksheets):
+					rows = ([ExcelReader.get_openpyxl_cell(value) for value in row] for row in sheet.iter_rows(values_only=True))
+					yield sheet_idx, sheet.title, rows
+			finally:
+				book.close()
+			return
+
+		book = xlrd.open_workbook(file_path, on_demand=True)
+		try:
+			for sheet_idx in range(book.nsheets):
+				sheet = book.sheet_by_index(sheet_idx)
+				rows = ([(cell.ctype, cell.value) for cell in sheet.row(row_idx)] for row_idx in range(sheet.nrows))
+				yield sheet_idx, sheet.name, rows
+				book.unload_sheet(sheet_idx)
+		finally:
+			book.release_resources()
+
+	@staticmethod
+	def get_openpyxl_cell(value):
+		if value is None or value == '':
+			return EMPTY, ''
+		elif isinstance(value, str):
+			return TEXT, value
+		elif isinstance(value, bool):
+			return BOOLEAN, int(value)
+		elif isinstance(value, (int, float)):
+			# xlrd reads all numbers as floats, kept so that the fields are mapped as before
+			return NUMBER, float(value)
+		elif isinstance(value, (datetime, date)):
+			return DATE, value
+		return TEXT, str(value)
+
+	@staticmethod
+	def get_sheet_documents(rows):
+		"""Yields the (row index, document) of the rows following the header row.
+		"""
+		header = next(rows, None)
+		if header is None:
+			return
+
+		feature_labels = [value if isinstance(value, str) else str(value) for code, value in header]
+
+		sample = list(itertools.islice(rows, DATASET_IMPORTER['excel_reader']['sample_rows']))
+		feature_converters = []
+
+		for column_idx in range(len(feature_labels)):
+			column = [row[column_idx] for row in sample if column_idx < len(row)]
+			col_types = list({code for code, value in column if code not in ExcelReader.empty_and_blank_codes})
+			feature_converters.append(ExcelReader.get_column_converter(col_types, [value for code, value in column]))
+
+		for row_idx, row in enumerate(itertools.chain(sample, rows), start=1):
+			document = {}
+			for col_idx, feature_label in enumerate(feature_labels):
+				value = row[col_idx][1] if col_idx < len(row) else ''
+				document[feature_label] = ExcelReader.convert(feature_converters[col_idx], value)
+			yield row_idx, document
+
+	@staticmethod
+	def convert(converter, value):
+		try:
+			return converter(value)
+		except (TypeError, ValueError, OverflowError):
+			# Values unlike the sampled ones of the column
+			return ExcelReader.converters['default'](value)
+
 	@staticmethod
 	def get_column_converter(value_types, values):
 		if len(value_types) == 1:
 			code = value_types[0]
-			if code == 1:
+			if code == TEXT:
 				return ExcelReader.converters['text']
-			elif code == 2:
-				if all(isinstance(value, int) for value in values):
+			elif code == NUMBER:
+				if all(isinstance(value, int) for value in values if value != ''):
 					return ExcelReader.converters['int']
 				else:
 					return ExcelReader.converters['float']
-			elif code == 3:
+			elif code == DATE:
 				return ExcelReader.converters['date']
-			elif code == 4:
+			elif code == BOOLEAN:
 				return ExcelReader.converters['bool']
 			else:
 				return ExcelReader.converters['default']
 		elif len(value_types) == 2:
-			if 2 in value_types and 4 in value_types:
-				if all(isinstance(value, int) for value in values):
+			if NUMBER in value_types and BOOLEAN in value_types:
+				if all(isinstance(value, int) for value in values if value != ''):
 					return ExcelReader.converters['int']
 				else:
 					return ExcelReader.converters['float']
@@ -87,6 +195,30 @@ class ExcelReader(CollectionReader):
 		else:
 			return ExcelReader.converters['default']
 
+	@staticmethod
+	def to_bool(value):
+		if value == '':
+			return None
+		if value not in {0, 1}:
+			raise ValueError('Not a boolean: {}'.format(value))
+		return bool(value)
+
+	@staticmethod
+	def to_int(value):
+		if value == '':
+			return None
+		if not isinstance(value, (int, float)) or not float(value).is_integer():
+			raise ValueError('Not an integer: {}'.format(value))
+		return int(value)
+
+	@staticmethod
+	def to_date(value):
+		if isinstance(value, datetime):
+			return value.date()
+		elif isinstance(value, date):
+			return value
+		return ExcelReader.from_excel_ordinal(value)
+
 	@staticmethod
 	def from_excel_ordinal(ordinal, epoch=date(1900, 1, 1)):
 
@@ -94,4 +226,4 @@ class ExcelReader(CollectionReader):
 			ordinal -= 1  # Excel leap year bug, 1900 is not a leap year
 		inDays = int(ordinal)
 
-		return epoch + timedelta(days=inDays - 1) # epoch is day 1
\ No newline at end of file
+		return epoch + timedelta(days=inDays - 1) # epoch is day 1
@@ -1,11 +1,73 @@
+import json
+
+from texta.settings import DATASET_IMPORTER
+from utils.es_transport import get_client
+from utils.sliced_scroll import SlicedScrollReader
+
+from dataset_importer.utils import HandleDatasetImportException
 
 
 class ElasticReader(object):
+    """Reads the documents of an existing Elasticsearch index, for example to copy it or to rebuild it with other analyzers.
+
+    Documents are read with a sliced scroll, every slice scrolling in its own thread, and keep their IDs in the new index.
+    """
 
     @staticmethod
     def get_features(**kwargs):
-        raise NotImplementedError()
+        try:
+            reader = SlicedScrollReader(
+                kwargs['elastic_source_index'],
+                ElasticReader.get_query(**kwargs),
+                n_slices=int(kwargs.get('elastic_source_slices') or DATASET_IMPORTER['elastic_reader']['slices']),
+                scroll_size=DATASET_IMPORTER['elastic_reader']['scroll_size'],
+                time_out=DATASET_IMPORTER['elastic_reader']['scroll_time_out'],
+                url=ElasticReader.get_url(**kwargs)
+            )
+
+            pages = iter(reader)
+            try:
+                for hits in pages:
+                    for hit in hits:
+                        features = hit.get('_source', {})
+                        features['elastic_id'] = hit['_id']
+                        yield features
+            finally:
+                # Stops the slices and clears their scroll contexts
+                pages.close()
+
+        except Exception as e:
+            HandleDatasetImportException(kwargs, e, file_path='')
 
     @staticmethod
     def count_total_documents(**kwargs):
-        raise NotImplementedError()
\ No newline at end of file
+        query = ElasticReader.get_query(**kwargs)
+        response = get_client(ElasticReader.get_url(**kwargs)).count(index=kwargs['elastic_source_index'], body={'query': query['query']})
+        return response['count']
+
+    @staticmethod
+    def get_url(**kwargs):
+        # Defaults to the instance the documents are imported to
+        return kwargs.get('elastic_source_url') or kwargs['texta_elastic_url']
+
+    @staticmethod
+    def get_query(**kwargs):
+        """Builds the scroll's search body from the optional query and list of read fields.
+
+        :param kwargs: may contain 'elastic_source_query', a JSON encoded Elasticsearch query, and 'elastic_source_fields',
+        a JSON encoded list of the read fields.
+        :rtype: dict
+        """
+        query = {'query': {'match_all': {}}}
+
+        if kwargs.get('elastic_source_query'):
+            query['query'] = json.loads(kwargs['elastic_source_query'])
+
+        if kwargs.get('elastic_source_fields'):
+            source_fields = [field for field in json.loads(kwargs['elastic_source_fields']) if field]
+            if source_fields:
+                query['_source'] = source_fields
+
+        # Scrolling in index order is the cheapest
+        query['sort'] = ['_doc']
+        return query
@@ -1,8 +1,42 @@
-from texta.settings import FACT_PROPERTIES, es_prefix
+from texta.settings import FACT_FIELD, FACT_PROPERTIES, es_prefix, DATASET_IMPORTER
+from utils import aggregation_cache
+from threading import Lock
 import requests
 import elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import streaming_bulk
 import json
+import os
+import time
+
+BULK_CONFIGURATION = {
+    'chunk_size': 500,
+    'max_chunk_bytes': 100 * 1024 * 1024,
+    'max_retries': 5,
+    'initial_backoff': 2,
+    'connection_pool_size': 10
+}
+BULK_CONFIGURATION.update(DATASET_IMPORTER.get('elastic_bulk', {}))
+
+# Clients and prepared indices are shared by all the storers of a process.
+_clients = {}
+_prepared_indices = set()
+_client_lock = Lock()
+
+
+def get_client(es_url, auth=None):
+    """Retrieves the process-wide Elasticsearch client of the given instance. Clients are thread-safe and keep a
+    pool of persistent connections, so every storer of a worker process reuses the same connections.
+
+    :param es_url: Elasticsearch instance's URL.
+    :param auth: optional HTTP authentication tuple.
+    :rtype: elasticsearch.Elasticsearch
+    """
+    key = (os.getpid(), es_url, auth)
+
+    with _client_lock:
+        if key not in _clients:
+            _clients[key] = elasticsearch.Elasticsearch(hosts=[es_url], http_auth=auth, maxsize=BULK_CONFIGURATION['connection_pool_size'])
+        return _clients[key]
 
 
 class ElasticStorer(object):
@@ -17,12 +51,25 @@ class ElasticStorer(object):
 
         self._headers = {'Content-Type': 'application/json; charset=utf-8'}
         self._request = requests.Session()
+        self._auth = None
 
         if 'elastic_auth' in connection_parameters:
-            self._request.auth = connection_parameters['elastic_auth']
-        self._create_index_if_not_exists(self._es_url, self._es_index, self._es_mapping,
-                                         connection_parameters['texta_elastic_not_analyzed'].split('\n'))
-        # json.loads(connection_parameters['texta_elastic_not_analyzed']))
+            self._auth = tuple(connection_parameters['elastic_auth'])
+            self._request.auth = self._auth
+
+        self._client = get_client(self._es_url, self._auth)
+
+        # Number of rejected documents and seconds spent storing the latest batch.
+        self.rejected_documents = 0
+        self.storing_seconds = 0.0
+
+        with _client_lock:
+            index_key = (os.getpid(), self._es_url, self._es_index)
+            if index_key not in _prepared_indices:
+                self._create_index_if_not_exists(self._es_url, self._es_index, self._es_mapping,
+                                                 connection_parameters['texta_elastic_not_analyzed'].split('\n'))
+                # json.loads(connection_parameters['texta_elastic_not_analyzed']))
+                _prepared_indices.add(index_key)
 
     def _correct_name(self, name):
         name = name.lower().replace(' ', '_')
@@ -63,11 +110,15 @@ class ElasticStorer(object):
             }
         }
 
-        # self._add_not_analyzed_declarations(index_creation_query['mappings'][mapping], not_analyzed_fields)
-        self._request.put("{url}/{index}".format(**{
+        index_url = "{url}/{index}".format(**{
             'url': url,
             'index': index,
-        }), data=json.dumps(index_creation_query), headers=self._headers)
+        })
+        if self._request.head(index_url).status_code == 200:
+            return
+
+        # self._add_not_analyzed_declarations(index_creation_query['mappings'][mapping], not_analyzed_fields)
+        self._request.put(index_url, data=json.dumps(index_creation_query), headers=self._headers)
 
     def _add_not_analyzed_declarations(self, mapping_dict, not_analyzed_fields):
         """Adds not analyzed fields to index creation schema.
@@ -94,46 +145,68 @@ class ElasticStorer(object):
             # current_dict['index'] = 'not_analyzed'
 
     def store(self, documents):
-        """Stores the provided documents to Elasticsearch'es appropriate index.
+        """Stores the provided documents to Elasticsearch'es appropriate index. Documents are sent in chunks limited by
+        both the number of documents and the size in bytes, chunks rejected with 429 are retried with exponential backoff.
 
         :param documents: documents waiting to be stored.
         :type documents: list of dicts
         :return: number of documents stored
         :rtype: int
         """
-        if not documents:
-            return
+        self.rejected_documents = 0
+        self.storing_seconds = 0.0
 
-        if not isinstance(documents, list):
-            documents = list(documents)
-
-        if 'elastic_id' in documents[0]:  # Use predefined ID value
-            batch_payload = []
-
-            for document in documents:
-                meta_data = {'_index': self._es_index, '_type': self._es_mapping, '_id': document['elastic_id']}
-                single_payload = {**meta_data, **document}
-                batch_payload.append(single_payload)
-
-            client = elasticsearch.Elasticsearch(hosts=[self._es_url])
-            response = bulk(client=client, actions=batch_payload, stats_only=True, raise_on_error=False)
-
-        else:  # Let Elasticsearch generate random ID value
-            batch_payload = []
-
-            for document in documents:
-                meta_data = {'_index': self._es_index, '_type': self._es_mapping}
-                single_payload = {**meta_data, **document}
-                batch_payload.append(single_payload)
+        if not documents:
+            return 0
+
+        start_time = time.time()
+        stored_documents = 0
+
+        for success, info in streaming_bulk(client=self._client, actions=self._get_actions(documents),
+                                            chunk_size=BULK_CONFIGURATION['chunk_size'],
+                                            max_chunk_bytes=BULK_CONFIGURATION['max_chunk_bytes'],
+                                            max_retries=BULK_CONFIGURATION['max_retries'],
+                                            initial_backoff=BULK_CONFIGURATION['initial_backoff'],
+                                            raise_on_error=False):
+            if success:
+                stored_documents += 1
+            else:
+                self.rejected_documents += 1
+
+        self.storing_seconds = time.time() - start_time
+        # Not refreshed per batch, results cached before the documents become searchable are dropped by refresh()
+        aggregation_cache.invalidate_indices([self._es_index], url=self._es_url, facts=any(FACT_FIELD in document for document in documents))
+
+        return stored_documents
+
+    def refresh(self):
+        """Makes the stored documents searchable and drops the aggregation results cached while they were not.
+        Called once when the import has finished.
+        """
+        self._client.indices.refresh(index=self._es_index)
+        aggregation_cache.invalidate_indices([self._es_index], url=self._es_url)
 
-            client = elasticsearch.Elasticsearch(hosts=[self._es_url])
-            response = bulk(client=client, actions=batch_payload)
+    def _get_actions(self, documents):
+        """Wraps documents into bulk actions. Uses predefined ID values from 'elastic_id', if present, otherwise lets
+        Elasticsearch generate random ID values.
 
-        return len(documents)
+        :param documents: documents waiting to be stored.
+        :rtype: dict generator
+        """
+        for document in documents:
+            meta_data = {'_index': self._es_index, '_type': self._es_mapping}
+            if 'elastic_id' in document:
+                # The ID is not stored as a field of the document
+                document = dict(document)
+                meta_data['_id'] = document.pop('elastic_id')
+            yield {**meta_data, **document}
 
     def remove(self):
         """Removes the Elasticsearch index.
         """
+        with _client_lock:
+            _prepared_indices.discard((os.getpid(), self._es_url, self._es_index))
+
         self._request.delete("{url}/{index}".format(**{
             'url': self._es_url,
             'index': self._es_index
@@ -9,21 +9,23 @@ import shutil
 import requests
 import json
 import logging
+import queue
 from django.conf import settings
 from django.db import connections
 from dataset_importer.document_storer.storer import DocumentStorer
 from dataset_importer.document_reader.reader import DocumentReader, entity_reader_map, collection_reader_map, database_reader_map
 
 from dataset_importer.archive_extractor.extractor import ArchiveExtractor, extractor_map
-from threading import Lock
-from multiprocessing.pool import ThreadPool as Pool
+from threading import Thread
 from dataset_importer.models import DatasetImport
 from dataset_importer.utils import HandleDatasetImportException
 
 if platform.system() == 'Windows':
     from threading import Thread as Process
+    from queue import Queue as ProcessQueue
 else:
     from multiprocessing import Process
+    from multiprocessing import Queue as ProcessQueue
 
 DAEMON_BASED_DATABASE_FORMATS = set(database_reader_map) - {'sqlite'}
 ARCHIVE_FORMATS = set(extractor_map)
@@ -48,6 +50,11 @@ class DatasetImporter(object):
         self._root_directory = configuration['directory']
         self._n_processes = configuration['import_processes']
         self._process_batch_size = configuration['process_batch_size']
+        self._pipeline_configuration = {
+            'worker_type': configuration.get('worker_type', 'thread'),
+            'batch_queue_size': configuration.get('batch_queue_size', 4),
+            'progress_interval': configuration.get('progress_interval', 5)
+        }
         self._index_sqlite_path = configuration['sync']['index_sqlite_path']
 
         self._dao = data_access_object
@@ -66,7 +73,8 @@ class DatasetImporter(object):
         parameters = self.django_request_to_import_parameters(request.POST)
         parameters = self._preprocess_import(parameters, request.user, request.FILES)
 
-        process = Process(target=_import_dataset, args=(parameters, self._n_processes, self._process_batch_size)).start()
+        process = Process(target=_import_dataset, args=(parameters, self._n_processes, self._process_batch_size, self._pipeline_configuration))
+        process.start()
         # process = None
         # _import_dataset(parameters, n_processes=self._n_processes, process_batch_size=self._process_batch_size)
 
@@ -83,7 +91,7 @@ class DatasetImporter(object):
         :type parameters: dict
         """
         parameters = self._preprocess_reimport(parameters=parameters)
-        Process(target=_import_dataset, args=(parameters, self._n_processes, self._process_batch_size)).start()
+        Process(target=_import_dataset, args=(parameters, self._n_processes, self._process_batch_size, self._pipeline_configuration)).start()
         # _import_dataset(parameters, n_processes=self._n_processes, process_batch_size=self._process_batch_size)
 
     def cancel_import_job(self, import_id):
@@ -281,15 +289,17 @@ class DatasetImporter(object):
             return ''
 
 
-def _import_dataset(parameter_dict, n_processes, process_batch_size):
+def _import_dataset(parameter_dict, n_processes, process_batch_size, pipeline_configuration=None):
     """Starts the import process from a parallel process.
 
     :param parameter_dict: dataset importer's parameters.
-    :param n_processes: size of the multiprocessing pool.
+    :param n_processes: number of storing workers.
     :param process_batch_size: the number of documents to process at any given time by a process.
+    :param pipeline_configuration: worker_type, batch_queue_size and progress_interval of the import pipeline.
     :type parameter_dict: dict
     :type n_processes: int
     :type process_batch_size: int
+    :type pipeline_configuration: dict
     """
     from django import db
     db.connections.close_all()
@@ -304,7 +314,8 @@ def _import_dataset(parameter_dict, n_processes, process_batch_size):
 
     reader = DocumentReader()
     _set_total_documents(parameter_dict=parameter_dict, reader=reader)
-    _run_processing_jobs(parameter_dict=parameter_dict, reader=reader, n_processes=n_processes, process_batch_size=process_batch_size)
+    _run_processing_jobs(parameter_dict=parameter_dict, reader=reader, n_processes=n_processes, process_batch_size=process_batch_size,
+                         **(pipeline_configuration or {}))
 
     # After import is done, remove files from disk
     tear_down_import_directory(parameter_dict['directory'])
@@ -340,13 +351,6 @@ def _extract_archives(parameter_dict):
         )
 
 
-def _init_pool(lock_):
-    """Hack to allow locks in a multiprocessing pool.
-    """
-    global lock
-    lock = lock_
-
-
 def _set_total_documents(parameter_dict, reader):
     """Updates total documents count in the database entry.
 
@@ -373,28 +377,110 @@ def _complete_import_job(parameter_dict):
     dataset_import.save()
 
 
-def _processing_job(documents, parameter_dict):
-    """A single processing job on a parallel node, which processes a batch of documents.
+def _fail_import_job(parameter_dict):
+    """Updates database entry to failed status.
+
+    :param parameter_dict: dataset import's parameters.
+    """
+    connections.close_all()
+    dataset_import = DatasetImport.objects.get(pk=parameter_dict['import_id'])
+    dataset_import.end_time = datetime.now()
+    dataset_import.status = 'Failed'
+    dataset_import.json_parameters = json.dumps(parameter_dict)
+    dataset_import.save()
+
+
+class StoringWorkersExited(Exception):
+    """Raised when the document batches can not be stored, as all the storing workers have exited.
+    """
+    pass
+
+
+def _processing_job(batch_queue, result_queue, parameter_dict):
+    """A storing worker which drains document batches from the batch queue until it receives None.
+
+    The worker keeps a single storer for its lifetime and reports the statistics of each batch to the result queue
+    instead of updating the database itself.
 
-    :param documents: batch of documents to process.
+    :param batch_queue: queue of document batches produced by the reader.
+    :param result_queue: queue where batch statistics are reported.
     :param parameter_dict: dataset import's parameters.
-    :type documents: list of dicts
     :type parameter_dict: dict
     """
     connections.close_all()
-    # dataset_name = '{0}_{1}'.format(parameter_dict['texta_elastic_index'], parameter_dict['texta_elastic_mapping'])
-    try:
-        storer = DocumentStorer.get_storer(**parameter_dict)
-        stored_documents_count = storer.store(documents)
+    storer = None
 
-        if documents:
-            with lock:
-                dataset_import = DatasetImport.objects.get(pk=parameter_dict['import_id'])
-                dataset_import.processed_documents += stored_documents_count
-                dataset_import.save()
+    for documents in iter(batch_queue.get, None):
+        batch_statistics = {'stored': 0, 'rejected': 0, 'seconds': 0.0}
+        start_time = time.time()
 
-    except Exception as e:
-        HandleDatasetImportException(parameter_dict, e)
+        try:
+            if storer is None:
+                storer = DocumentStorer.get_storer(**parameter_dict)
+            batch_statistics['stored'] = storer.store(documents) or 0
+            batch_statistics['rejected'] = getattr(storer, 'rejected_documents', 0)
+
+        except Exception as e:
+            HandleDatasetImportException(parameter_dict, e)
+
+        batch_statistics['seconds'] = time.time() - start_time
+        result_queue.put(batch_statistics)
+
+
+class ImportProgress(object):
+    """Aggregates batch statistics reported by the storing workers and writes them to the DatasetImport entry
+    at most once per interval.
+    """
+
+    def __init__(self, import_id, result_queue, interval):
+        self._import_id = import_id
+        self._result_queue = result_queue
+        self._interval = interval
+
+        self.processed_documents = 0
+        self.rejected_documents = 0
+        self.storing_seconds = 0.0
+        self.pending_batches = 0
+        self._last_update = time.time()
+
+    def collect(self, timeout=None):
+        """Consumes the reported statistics. Blocks for at most timeout seconds for the first report, if timeout is given.
+
+        :param timeout: seconds to wait for a report, None for not waiting.
+        :type timeout: float
+        """
+        try:
+            while self.pending_batches:
+                if timeout is None:
+                    batch_statistics = self._result_queue.get_nowait()
+                else:
+                    batch_statistics = self._result_queue.get(timeout=timeout)
+                    timeout = None
+
+                self.processed_documents += batch_statistics['stored']
+                self.rejected_documents += batch_statistics['rejected']
+                self.storing_seconds += batch_statistics['seconds']
+                self.pending_batches -= 1
+
+                logging.getLogger(settings.INFO_LOGGER).info('Stored dataset import batch.', extra={
+                    'import_id': self._import_id, **batch_statistics
+                })
+        except queue.Empty:
+            pass
+
+        if time.time() - self._last_update >= self._interval:
+            self.flush()
+
+    def flush(self):
+        """Writes the current statistics to the database.
+        """
+        connections.close_all()
+        DatasetImport.objects.filter(pk=self._import_id).update(
+            processed_documents=self.processed_documents,
+            rejected_documents=self.rejected_documents,
+            storing_seconds=self.storing_seconds
+        )
+        self._last_update = time.time()
 
 
 def _remove_existing_dataset(parameter_dict):
@@ -407,16 +493,39 @@ def _remove_existing_dataset(parameter_dict):
     storer.remove()
 
 
-def _run_processing_jobs(parameter_dict, reader, n_processes, process_batch_size):
-    """Creates document batches and dispatches them to processing nodes.
+def _refresh_dataset(parameter_dict):
+    """Makes the imported documents searchable once all the batches are stored.
+
+    :param parameter_dict: dataset import's parameters
+    :type parameter_dict: dict
+    """
+    try:
+        storer = DocumentStorer.get_storer(**parameter_dict)
+        if hasattr(storer, 'refresh'):
+            storer.refresh()
+    except Exception as e:
+        HandleDatasetImportException(parameter_dict, e)
+
+
+def _run_processing_jobs(parameter_dict, reader, n_processes, process_batch_size, worker_type='thread', batch_queue_size=4,
+                         progress_interval=5):
+    """Reads document batches into a bounded queue, which is drained concurrently by storing workers.
+
+    Reading is paused while the queue is full, so at most batch_queue_size + n_processes batches are held in memory.
 
     :param parameter_dict: dataset import's parameters.
     :param reader: dataset importer's document reader.
-    :param n_processes: size of the multiprocessing pool.
+    :param n_processes: number of storing workers.
     :param process_batch_size: the number of documents to process at any given time by a node.
+    :param worker_type: 'thread' or 'process'.
+    :param batch_queue_size: maximum number of batches waiting for a worker.
+    :param progress_interval: minimum number of seconds between progress updates in the database.
     :type parameter_dict: dict
     :type n_processes: int
     :type process_batch_size: int
+    :type worker_type: string
+    :type batch_queue_size: int
+    :type progress_interval: float
     """
     from django import db
     db.connections.close_all()
@@ -424,27 +533,91 @@ def _run_processing_jobs(parameter_dict, reader, n_processes, process_batch_size
     if parameter_dict.get('remove_existing_dataset', False):
         _remove_existing_dataset(parameter_dict)
 
-    import_job_lock = Lock()
+    if worker_type == 'process':
+        worker_class, queue_class = Process, ProcessQueue
+    else:
+        worker_class, queue_class = Thread, queue.Queue
+
+    batch_queue = queue_class(maxsize=max(1, batch_queue_size))
+    result_queue = queue_class()
+
+    workers = [worker_class(target=_processing_job, args=(batch_queue, result_queue, parameter_dict)) for _ in range(max(1, n_processes))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    progress = ImportProgress(parameter_dict['import_id'], result_queue, progress_interval)
 
-    process_pool = Pool(processes=n_processes, initializer=_init_pool, initargs=(import_job_lock,))
+    try:
+        for batch in _batch_documents(reader.read_documents(**parameter_dict), process_batch_size):
+            _put_batch(batch_queue, batch, progress, workers)
+
+        for worker in workers:
+            _put_batch(batch_queue, None, progress, workers)
+
+    except StoringWorkersExited as e:
+        HandleDatasetImportException(parameter_dict, e)
+        progress.flush()
+        _refresh_dataset(parameter_dict)
+        _fail_import_job(parameter_dict)
+        return
+
+    while progress.pending_batches and any(worker.is_alive() for worker in workers):
+        progress.collect(timeout=1)
+    progress.collect()
+
+    for worker in workers:
+        worker.join()
+
+    progress.flush()
+    _refresh_dataset(parameter_dict)
+    _complete_import_job(parameter_dict)
+
+
+def _batch_documents(documents, batch_size):
+    """Groups a document stream into lists of at most batch_size documents.
+
+    :param documents: documents from the reader.
+    :param batch_size: maximum number of documents in a batch.
+    :rtype: list of dicts generator
+    """
     batch = []
 
-    for document in reader.read_documents(**parameter_dict):
+    for document in documents:
         batch.append(document)
 
-        # Send documents when they reach their batch size and empty it.
-        if len(batch) == process_batch_size:
-            process_pool.apply(_processing_job, args=(batch, parameter_dict))
+        if len(batch) == batch_size:
+            yield batch
             batch = []
 
-    # Send the final documents that did not reach the batch size.
+    # The final documents that did not reach the batch size.
     if batch:
-        process_pool.apply(_processing_job, args=(batch, parameter_dict))
+        yield batch
 
-    process_pool.close()
-    process_pool.join()
 
-    _complete_import_job(parameter_dict)
+def _put_batch(batch_queue, batch, progress, workers):
+    """Puts a batch to the queue, collecting reported progress while waiting for a free slot.
+
+    :param batch_queue: bounded queue of document batches.
+    :param batch: list of documents or None to stop a worker.
+    :param progress: progress aggregator of the import.
+    :param workers: storing workers draining the queue.
+    :type progress: ImportProgress
+    :raises: StoringWorkersExited, if all the workers have exited while the queue is full.
+    """
+    while True:
+        try:
+            batch_queue.put(batch, timeout=1)
+            break
+        except queue.Full:
+            progress.collect()
+            # A full queue is never drained if the workers were killed, for example by running out of memory
+            if not any(worker.is_alive() for worker in workers):
+                raise StoringWorkersExited('All the storing workers of the import have exited.')
+
+    if batch is not None:
+        progress.pending_batches += 1
+    progress.collect()
 
 
 def download(url, target_directory, chunk_size=1024):
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.8 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataset_importer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetimport',
+            name='rejected_documents',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='datasetimport',
+            name='storing_seconds',
+            field=models.FloatField(default=0),
+        ),
+    ]
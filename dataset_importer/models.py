@@ -16,6 +16,8 @@ class DatasetImport(models.Model):
     status = models.CharField(max_length=32)
     processed_documents = models.BigIntegerField(default=0)
     total_documents = models.BigIntegerField(default=0)
+    rejected_documents = models.BigIntegerField(default=0)
+    storing_seconds = models.FloatField(default=0)
     finished = models.BooleanField(default=False)
     must_sync = models.BooleanField(default=False)
     json_parameters = models.CharField(max_length=1024, default='')
@@ -1,6 +1,130 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import json
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from dataset_importer.document_reader.readers.collection.excel_reader import ExcelReader
+from dataset_importer.document_reader.readers.database import elastic_reader
+from texta.settings import DATASET_IMPORTER
+from utils import sliced_scroll
+
+
+def get_rows(values):
+	return ([ExcelReader.get_openpyxl_cell(value) for value in row] for row in values)
+
+
+class ExcelReaderTest(SimpleTestCase):
+
+	@mock.patch.dict(DATASET_IMPORTER['excel_reader'], {'sample_rows': 3})
+	def test_rows_after_sample(self):
+		rows = get_rows([['number', 'flag', 'name'], [1, True, 'a'], [2, False, 'b'], [3, True, None], [4, False, 'd'], [2.5, 2, 'e'], [7, True, 'f']])
+		documents = [document for row_idx, document in ExcelReader.get_sheet_documents(rows)]
+
+		# Numbers are floats, like the numbers read by xlrd
+		self.assertEqual([document['number'] for document in documents], [1.0, 2.0, 3.0, 4.0, 2.5, 7.0])
+		self.assertEqual([document['flag'] for document in documents], [True, False, True, False, '2.0', True])
+		self.assertEqual([document['name'] for document in documents], ['a', 'b', '', 'd', 'e', 'f'])
+
+	def test_converters_fall_back_to_strings(self):
+		self.assertEqual(ExcelReader.convert(ExcelReader.converters['int'], 3.0), 3)
+		self.assertEqual(ExcelReader.convert(ExcelReader.converters['int'], 2.5), '2.5')
+		self.assertIsNone(ExcelReader.convert(ExcelReader.converters['int'], ''))
+		self.assertEqual(ExcelReader.convert(ExcelReader.converters['bool'], 2.0), '2.0')
+
+
+class FakeElasticsearch(object):
+	"""Single-node stand-in for the client methods used by SlicedScrollReader and ElasticReader.
+	"""
+
+	def __init__(self, documents):
+		self.documents = documents
+		self.searches = []
+		self.counts = []
+		self.pages = {}
+		self.cleared = []
+		self._lock = threading.Lock()
+
+	def search(self, index, body, scroll):
+		documents = list(enumerate(self.documents))
+		if 'slice' in body:
+			documents = [(position, document) for position, document in documents if position % body['slice']['max'] == body['slice']['id']]
+		hits = [{'_id': document['_id'], '_source': self._filter_source(document['_source'], body.get('_source'))} for position, document in documents]
+
+		with self._lock:
+			self.searches.append(body)
+			scroll_id = 'scroll_{}'.format(len(self.pages))
+			self.pages[scroll_id] = [hits[start:start + body['size']] for start in range(0, len(hits), body['size'])]
+		return self.scroll(scroll_id, scroll)
+
+	def scroll(self, scroll_id, scroll):
+		with self._lock:
+			pages = self.pages[scroll_id]
+			return {'_scroll_id': scroll_id, 'hits': {'hits': pages.pop(0) if pages else []}}
+
+	def clear_scroll(self, scroll_id, ignore=None):
+		with self._lock:
+			self.cleared.append(scroll_id)
+
+	def count(self, index, body):
+		self.counts.append(body)
+		return {'count': len(self.documents)}
+
+	@staticmethod
+	def _filter_source(source, fields):
+		return {field: value for field, value in source.items() if not fields or field in fields}
+
+
+@mock.patch.dict(DATASET_IMPORTER['elastic_reader'], {'slices': 3, 'scroll_size': 4})
+class ElasticReaderTest(SimpleTestCase):
+
+	def setUp(self):
+		self.client = FakeElasticsearch([{'_id': 'doc_{}'.format(i), '_source': {'title': 'title {}'.format(i), 'body': 'body {}'.format(i)}} for i in range(25)])
+		for module in (sliced_scroll, elastic_reader):
+			patcher = mock.patch.object(module, 'get_client', return_value=self.client)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def get_kwargs(self, **kwargs):
+		return dict({'elastic_source_index': 'source', 'texta_elastic_url': 'http://localhost:9200'}, **kwargs)
+
+	def wait_for_cleared_scrolls(self):
+		deadline = time.time() + 5
+		while set(self.client.cleared) != set(self.client.pages) and time.time() < deadline:
+			time.sleep(0.05)
+
+	def test_slices_are_merged_without_duplicates(self):
+		documents = list(elastic_reader.ElasticReader.get_features(**self.get_kwargs()))
+
+		self.assertEqual(sorted(document['elastic_id'] for document in documents), sorted(document['_id'] for document in self.client.documents))
+		self.assertEqual(sorted(search['slice']['id'] for search in self.client.searches), [0, 1, 2])
+
+	def test_ids_are_kept(self):
+		for document in elastic_reader.ElasticReader.get_features(**self.get_kwargs()):
+			self.assertEqual(document['title'], 'title {}'.format(document['elastic_id'].split('_')[1]))
+
+	def test_source_fields(self):
+		documents = list(elastic_reader.ElasticReader.get_features(**self.get_kwargs(elastic_source_fields=json.dumps(['title', '']))))
+
+		self.assertTrue(all(search['_source'] == ['title'] for search in self.client.searches))
+		self.assertTrue(all(set(document) == {'title', 'elastic_id'} for document in documents))
+
+	def test_count_total_documents(self):
+		query = {'term': {'title': 'title 1'}}
+		total = elastic_reader.ElasticReader.count_total_documents(**self.get_kwargs(elastic_source_query=json.dumps(query)))
+
+		self.assertEqual(total, 25)
+		self.assertEqual(self.client.counts, [{'query': query}])
+
+	def test_scrolls_are_cleared_when_closed_early(self):
+		documents = elastic_reader.ElasticReader.get_features(**self.get_kwargs())
+		next(documents)
+		documents.close()
+		self.wait_for_cleared_scrolls()
+
+		self.assertTrue(self.client.pages)
+		self.assertEqual(sorted(self.client.cleared), sorted(self.client.pages))
@@ -0,0 +1,263 @@
+""" Compiled evaluation of grammar builder metaqueries over batches of documents.
+
+multilayer_matcher evaluates a grammar document by document: LayerDict maps every character of a layer to its
+token in Python lists, and the operators combine all the match combinations of their components before
+filtering them. CompiledGrammar translates the metaquery once into a tree of nodes and evaluates a batch of
+documents at a time:
+
+- the layers of the batch are joined into one text and tokenized at once into numpy offset arrays;
+- Exact leaves run their precompiled alternation once over the joined text, Regex leaves run per document;
+- match spans are mapped to token indices with a vectorized binary search over the token offsets;
+- Concatenation and Gap join the matches of their components by token positions instead of filtering the
+  Cartesian product.
+
+The matches are the same as those of multilayer_matcher, as Match objects without texts. Tokens are delimited
+by whitespace and '+', like the token pattern [^\s+]+ of multilayer_matcher.
+"""
+import bisect
+import itertools
+import re
+
+import numpy as np
+
+from . import multilayer_matcher as matcher
+
+# Characters matched by [\s+], the token delimiters of multilayer_matcher
+DELIMITER_CODES = np.array([code for code in range(0x3001) if chr(code).isspace()] + [ord('+')], dtype=np.uint32)
+
+# Tokens of a layer text, for mapping the token indices of matches back to the text
+TOKEN_PATTERN = re.compile(r'[^\s+]+')
+
+# Joins the layer texts of a batch, a whitespace character so that tokens do not cross documents
+DOCUMENT_SEPARATOR = '\n'
+
+
+def compile_grammar(metaquery_dict):
+    return CompiledGrammar(metaquery_dict)
+
+
+class BatchLayer:
+    """ Texts of one layer of a batch of documents, tokenized on whitespace and '+'
+    """
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.text = DOCUMENT_SEPARATOR.join(texts)
+
+        lengths = np.array([len(text) + len(DOCUMENT_SEPARATOR) for text in texts], dtype=np.int64)
+        self.doc_starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(texts) else np.zeros(0, dtype=np.int64)
+
+        codes = np.frombuffer(self.text.encode('utf-32-le'), dtype=np.uint32)
+        is_delimiter = np.isin(codes, DELIMITER_CODES)
+        is_token = ~is_delimiter
+        self.token_starts = np.flatnonzero(is_token & np.concatenate(([True], is_delimiter[:-1])))
+        self.token_ends = np.flatnonzero(is_token & np.concatenate((is_delimiter[1:], [True]))) + 1
+        self.doc_first_tokens = np.searchsorted(self.token_starts, self.doc_starts)
+
+    def get_token_spans(self, starts, ends):
+        """ Maps character spans of the joined text to (document indices, first tokens, last tokens) in the documents
+
+        Spans without any token characters are left out.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if not len(self.token_starts):
+            starts = ends = starts[:0]
+        nonempty = ends > starts
+        starts, ends = starts[nonempty], ends[nonempty]
+
+        first_tokens = np.searchsorted(self.token_starts, starts, side='right') - 1
+        # A span starting with a delimiter starts at the next token
+        in_space = (first_tokens < 0) | (starts >= self.token_ends[np.maximum(first_tokens, 0)])
+        first_tokens = np.where(in_space, first_tokens + 1, first_tokens)
+        last_tokens = np.searchsorted(self.token_starts, ends - 1, side='right') - 1
+
+        docs = np.searchsorted(self.doc_starts, starts, side='right') - 1
+        valid = last_tokens >= first_tokens
+        docs, first_tokens, last_tokens = docs[valid], first_tokens[valid], last_tokens[valid]
+        doc_first_tokens = self.doc_first_tokens[docs]
+        return docs, first_tokens - doc_first_tokens, last_tokens - doc_first_tokens
+
+
+class DocumentBatch:
+    """ Feature dicts of the documents, with their layers tokenized on first use
+    """
+
+    def __init__(self, feature_dicts):
+        self.feature_dicts = feature_dicts
+        self._layers = {}
+
+    def __len__(self):
+        return len(self.feature_dicts)
+
+    def get_layer(self, layer_path):
+        if layer_path not in self._layers:
+            texts = []
+            for feature_dict in self.feature_dicts:
+                text = feature_dict.get(layer_path, '')
+                texts.append(text if isinstance(text, str) else '')
+            self._layers[layer_path] = BatchLayer(texts)
+        return self._layers[layer_path]
+
+
+class Leaf:
+
+    def __init__(self, layer_path, pattern, joinable):
+        self._layer_path = layer_path
+        self._feature_name = layer_path.split('.')[0]
+        self._pattern = pattern
+        # Whether the pattern can be run over the joined texts of a batch
+        self._joinable = joinable
+
+    def evaluate(self, batch):
+        layer = batch.get_layer(self._layer_path)
+        starts, ends = [], []
+
+        if self._joinable:
+            for match in self._pattern.finditer(layer.text):
+                starts.append(match.start())
+                ends.append(match.end())
+        else:
+            for text, doc_start in zip(layer.texts, layer.doc_starts.tolist()):
+                for match in self._pattern.finditer(text):
+                    starts.append(doc_start + match.start())
+                    ends.append(doc_start + match.end())
+
+        results = [[] for _ in range(len(batch))]
+        for doc, first_token, last_token in zip(*(array.tolist() for array in layer.get_token_spans(starts, ends))):
+            token_idxs = tuple(range(first_token, last_token + 1))
+            results[doc].append((token_idxs, (self._feature_name,) * len(token_idxs)))
+        return results
+
+
+class Exact(Leaf):
+
+    def __init__(self, terms, layer_path, case_sensitive=False):
+        pattern = re.compile('|'.join(re.escape(term) for term in terms), 0 if case_sensitive else re.IGNORECASE)
+        super(Exact, self).__init__(layer_path, pattern, joinable=not any(DOCUMENT_SEPARATOR in term for term in terms))
+
+
+class Regex(Leaf):
+
+    def __init__(self, expression, layer_path, case_sensitive=False):
+        pattern = re.compile(expression, 0 if case_sensitive else re.IGNORECASE)
+        # Anchors and lookarounds would see the neighbouring documents
+        super(Regex, self).__init__(layer_path, pattern, joinable=False)
+
+
+def _unique(matches):
+    return list(dict.fromkeys(matches))
+
+
+def _merge(combination):
+    return (tuple(itertools.chain.from_iterable(match[0] for match in combination)),
+            tuple(itertools.chain.from_iterable(match[1] for match in combination)))
+
+
+class Union:
+
+    def __init__(self, components):
+        self._components = components
+
+    def evaluate(self, batch):
+        component_results = [component.evaluate(batch) for component in self._components]
+        return [_unique(itertools.chain.from_iterable(doc_results)) for doc_results in zip(*component_results)]
+
+
+class Intersection:
+
+    def __init__(self, components):
+        self._components = components
+
+    def evaluate(self, batch):
+        component_results = [component.evaluate(batch) for component in self._components]
+        return [_unique(_merge(combination) for combination in itertools.product(*doc_results)) for doc_results in zip(*component_results)]
+
+
+class Sequence:
+    """ Intersection of the components where every token follows the previous one by min_gap to max_gap positions
+    """
+
+    def __init__(self, components, min_gap, max_gap):
+        self._components = components
+        self._min_gap = min_gap
+        self._max_gap = max_gap
+
+    def _is_sequence(self, token_idxs):
+        return all(self._min_gap <= next_token_idx - prev_token_idx <= self._max_gap for prev_token_idx, next_token_idx in zip(token_idxs, token_idxs[1:]))
+
+    def evaluate(self, batch):
+        component_results = [component.evaluate(batch) for component in self._components]
+        return [self._join(doc_results) for doc_results in zip(*component_results)]
+
+    def _join(self, doc_results):
+        partials = [match for match in doc_results[0] if self._is_sequence(match[0])]
+
+        for matches in doc_results[1:]:
+            if not partials:
+                break
+            # Matches of the component ordered by their first token, so that the ones following a partial match are a range
+            candidates = sorted((match for match in matches if self._is_sequence(match[0])), key=lambda match: match[0][0])
+            first_tokens = [match[0][0] for match in candidates]
+
+            joined = []
+            for partial in partials:
+                last_token = partial[0][-1]
+                start = bisect.bisect_left(first_tokens, last_token + self._min_gap)
+                end = bisect.bisect_right(first_tokens, last_token + self._max_gap) if self._max_gap != float('inf') else len(candidates)
+                joined.extend(_merge((partial, match)) for match in candidates[start:end])
+            partials = joined
+
+        return _unique(partials)
+
+
+class Concatenation(Sequence):
+
+    def __init__(self, components):
+        super(Concatenation, self).__init__(components, 1, 1)
+
+
+class Gap(Sequence):
+
+    def __init__(self, components, slop=None):
+        super(Gap, self).__init__(components, 1, int(slop) if slop else float('inf'))
+
+
+class CompiledGrammar:
+    """ Grammar of a metaquery, see grammar_builder.views.generate_metaquery_dict
+    """
+
+    def __init__(self, metaquery_dict):
+        self._root = self._compile(metaquery_dict)
+
+    def _compile(self, component_dict):
+        operation = component_dict['operation']
+        if 'layer' in component_dict:
+            if operation == 'exact':
+                return Exact(component_dict['terms'], component_dict['layer'], component_dict.get('sensitive', False))
+            elif operation == 'regex':
+                return Regex(component_dict['expression'], component_dict['layer'], component_dict.get('sensitive', False))
+            raise ValueError('Unknown grammar leaf operation: {}'.format(operation))
+
+        components = [self._compile(sub_component) for sub_component in component_dict['components']]
+        if operation == 'gap':
+            return Gap(components, slop=component_dict.get('slop'))
+        elif operation == 'concat':
+            return Concatenation(components)
+        elif operation == 'intersect':
+            return Intersection(components)
+        elif operation == 'union':
+            return Union(components)
+        raise ValueError('Unknown grammar operation: {}'.format(operation))
+
+    def match_batch(self, feature_dicts):
+        """ Returns the list of Match objects of every document
+
+        :param feature_dicts: dicts of the documents' layer texts by their paths, as given to LayerDict.
+        """
+        if not feature_dicts:
+            return []
+        return [[matcher.Match(token_idxs, features, []) for token_idxs, features in matches] for matches in self._root.evaluate(DocumentBatch(feature_dicts))]
+
+    def match(self, feature_dict):
+        return self.match_batch([feature_dict])[0]
@@ -0,0 +1,129 @@
+""" Export of the documents a grammar matches, with their match spans.
+
+The candidate documents of the grammar's query are read with a sliced scroll limited to the grammar layers and the
+exported features, the slices prefetching pages into the reader's bounded queue. Pages are matched with the compiled
+grammar in a pool of worker processes, each compiling the grammar once, with at most GRAMMAR_EXPORT['pages_in_flight']
+pages submitted ahead of the writer. The rows of the matching documents are written page by page, in the order
+of the scroll, by the writers of the searcher export, so memory use does not depend on the number of documents.
+"""
+import copy
+import json
+from multiprocessing import Pool
+
+from searcher.view_functions.general.document_exporter import EXPORT_WRITERS, FieldAccessor
+from texta.settings import GRAMMAR_EXPORT
+from utils.sliced_scroll import SlicedScrollReader
+from .grammar_engine import compile_grammar
+from .match_store import get_feature_dict
+
+# Exported column of the match spans
+MATCHES_FEATURE = 'grammar_matches'
+
+# Grammar of the worker process, compiled by its initializer
+_worker_grammar = None
+
+
+def _init_worker(metaquery_dict):
+    global _worker_grammar
+    _worker_grammar = compile_grammar(metaquery_dict)
+
+
+def _match_page(feature_dicts):
+    return _get_spans(_worker_grammar, feature_dicts)
+
+
+def _get_spans(grammar, feature_dicts):
+    """ Returns the [token indices, features] spans of the matches of every document
+    """
+    return [[[list(match.token_idxs), list(match.features)] for match in matches] for matches in grammar.match_batch(feature_dicts)]
+
+
+class GrammarExporter:
+    """ Streams the documents matching a grammar in the given format
+
+    :param es_m: ES_Manager of the exported datasets.
+    :param query: search body of the candidate documents, the grammar's ElasticGrammarQuery merged with the search.
+    :param metaquery: grammar to match, see grammar_builder.views.generate_metaquery_dict.
+    :param layers: features the grammar is evaluated on, see grammar_builder.views.extract_layers.
+    :param features: exported features, dot separated paths of the documents' _source.
+    :param export_format: key of EXPORT_WRITERS.
+    """
+
+    def __init__(self, es_m, query, metaquery, layers, features, export_format='csv'):
+        if export_format not in EXPORT_WRITERS:
+            raise ValueError('Unknown export format: {}'.format(export_format))
+
+        self.es_m = es_m
+        self.query = query
+        self.metaquery = metaquery
+        self.layers = sorted(layers)
+        # Top level fields of the layers, the part of the documents sent to the worker processes
+        self.layer_roots = sorted(set(layer.split('.')[0] for layer in layers))
+        self.features = features
+        self.accessors = [FieldAccessor(feature_name) for feature_name in features]
+        self.writer = EXPORT_WRITERS[export_format](['_id'] + features + [MATCHES_FEATURE])
+        self.n_matched = 0
+
+    def stream(self, progress=None):
+        """ Yields the chunks of the export file
+
+        :param progress: called with the number of documents of every processed page.
+        """
+        yield self.writer.header()
+
+        pages = iter(self._get_reader())
+        try:
+            for hits, spans in self._match_pages(pages):
+                rows = []
+                for hit, doc_spans in zip(hits, spans):
+                    if doc_spans:
+                        source = hit.get('_source', {})
+                        rows.append([hit['_id']] + [accessor(source) for accessor in self.accessors] + [json.dumps(doc_spans)])
+
+                self.n_matched += len(rows)
+                data = self.writer.write(rows)
+                if data:
+                    yield data
+                if progress:
+                    progress(len(hits))
+        finally:
+            # Stops the slices and clears their scroll contexts
+            pages.close()
+
+        yield self.writer.close()
+
+    def _match_pages(self, pages):
+        """ Yields the (hits, match spans) of the pages in order
+        """
+        if GRAMMAR_EXPORT['processes'] <= 1:
+            grammar = compile_grammar(self.metaquery)
+            for hits in pages:
+                yield hits, _get_spans(grammar, [get_feature_dict(hit) for hit in hits])
+            return
+
+        in_flight = []
+        # The processes are forked when the pool is created, before the threads of the reader are started
+        pool = Pool(processes=GRAMMAR_EXPORT['processes'], initializer=_init_worker, initargs=(self.metaquery,))
+        try:
+            for hits in pages:
+                feature_dicts = [get_feature_dict({'_source': {root: hit['_source'][root] for root in self.layer_roots if root in hit.get('_source', {})}}) for hit in hits]
+                in_flight.append((hits, pool.apply_async(_match_page, (feature_dicts,))))
+                if len(in_flight) >= GRAMMAR_EXPORT['pages_in_flight']:
+                    hits, result = in_flight.pop(0)
+                    yield hits, result.get()
+
+            while in_flight:
+                hits, result = in_flight.pop(0)
+                yield hits, result.get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _get_reader(self):
+        query = copy.deepcopy(self.query)
+        query['_source'] = sorted(set(self.layers) | set(self.features))
+        query.pop('size', None)
+        query.pop('from', None)
+
+        return SlicedScrollReader(self.es_m.stringify_datasets(), query, n_slices=GRAMMAR_EXPORT['slices'], scroll_size=GRAMMAR_EXPORT['scroll_size'],
+                                  time_out=GRAMMAR_EXPORT['scroll_time_out'], url=self.es_m.es_url)
@@ -0,0 +1,164 @@
+""" Grammar matches of a search, evaluated once in the background and served page by page.
+
+GrammarMatchStore walks all the candidate documents of a search with a sliced scroll in a background thread,
+evaluates the grammar on each and appends the ids and match spans of the documents of the requested polarity
+to chunks of GRAMMAR_MATCHES['chunk_size'] entries. A page is read from the chunks containing its offsets and its
+documents are fetched with one ids query, so any page costs the same number of requests. The chunks are kept in a
+Django cache shared by the processes, keyed by the search, the grammar, the polarity and the generation tokens
+of the indices (see utils/aggregation_cache.py), so that writing to the indices starts a new walk.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.core.cache import caches
+
+from texta.settings import ERROR_LOGGER, GRAMMAR_MATCHES
+from utils import aggregation_cache
+from utils.sliced_scroll import SlicedScrollReader
+from . import multilayer_matcher as matcher
+
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_STOPPED = 'stopped'
+STATUS_FAILED = 'failed'
+
+
+def get_feature_dict(hit):
+    """ Flattens the _source of a hit to the feature paths the grammar layers refer to
+    """
+    feature_dict = {}
+    for field_name in hit['_source']:
+        field_value = hit['_source'][field_name]
+        if isinstance(field_value, dict):
+            for subfield_name, subfield_value in field_value.items():
+                combined_field_name = '{0}.{1}'.format(field_name, subfield_name)
+                feature_dict[combined_field_name] = subfield_value
+        else:
+            feature_dict[field_name] = field_value
+    return feature_dict
+
+
+def get_matches(stored_matches):
+    """ Converts the stored match spans back to Match objects for highlighting
+    """
+    return [matcher.Match(token_idxs, features, []) for token_idxs, features in stored_matches]
+
+
+class GrammarMatchStore:
+    """ Matching documents of one search, grammar and polarity
+
+    :param owner: identifies the table the matches are shown in, a walk is stopped when its owner starts a new one.
+    """
+
+    def __init__(self, es_m, query, metaquery, polarity, owner):
+        self.es_m = es_m
+        self.query = {'query': query.get('query', {'match_all': {}})}
+        self.polarity = polarity
+        self.owner = owner
+        self.index = es_m.stringify_datasets()
+        self.cache = caches[GRAMMAR_MATCHES['cache']]
+
+        generations = aggregation_cache.get_generations(self.index, url=es_m.es_url)
+        content = json.dumps([es_m.es_url, self.index, self.query, metaquery, polarity, generations], sort_keys=True, default=str)
+        self.key = hashlib.sha1(content.encode('utf8')).hexdigest()
+
+    def _cache_key(self, *parts):
+        return ':'.join(('grammar_matches', self.key) + tuple(str(part) for part in parts))
+
+    def _owner_key(self):
+        return 'grammar_matches:owner:{0}'.format(self.owner)
+
+    def get_state(self):
+        return self.cache.get(self._cache_key('state'))
+
+    def start(self, features, grammar):
+        """ Starts the walk in a background thread, unless the matches are stored or another process is walking them
+
+        :param features: feature paths the grammar is evaluated on.
+        :param grammar: CompiledGrammar of grammar_engine.
+        """
+        self.cache.set(self._owner_key(), self.key, timeout=GRAMMAR_MATCHES['ttl'])
+
+        state = self.get_state()
+        if state and (state['status'] == STATUS_COMPLETED or (state['status'] == STATUS_RUNNING and time.time() - state['updated'] < GRAMMAR_MATCHES['heartbeat'])):
+            return
+        # Only one of the processes serving the table starts the walk
+        if not self.cache.add(self._cache_key('walker'), True, timeout=GRAMMAR_MATCHES['heartbeat']):
+            return
+
+        state = {'status': STATUS_RUNNING, 'processed': 0, 'matched': 0, 'updated': time.time()}
+        self.cache.set(self._cache_key('state'), state, timeout=GRAMMAR_MATCHES['ttl'])
+        threading.Thread(target=self._walk, args=(features, grammar, state), daemon=True).start()
+
+    def _walk(self, features, grammar, state):
+        chunk_size = GRAMMAR_MATCHES['chunk_size']
+        chunk_idx = 0
+        pending = []
+        body = dict(self.query, _source=features)
+        reader = SlicedScrollReader(self.index, body, n_slices=GRAMMAR_MATCHES['slices'], scroll_size=GRAMMAR_MATCHES['scroll_size'],
+                                    time_out=GRAMMAR_MATCHES['scroll_time_out'], url=self.es_m.es_url)
+        pages = iter(reader)
+
+        try:
+            for hits in pages:
+                # The grammar is evaluated on the page as one batch
+                for hit, matches in zip(hits, grammar.match_batch([get_feature_dict(hit) for hit in hits])):
+                    # Negative polarity lists the documents the grammar does not match
+                    if (self.polarity == 'positive') == bool(matches):
+                        pending.append([hit['_index'], hit['_id'], [[list(match.token_idxs), list(match.features)] for match in matches]])
+
+                while len(pending) >= chunk_size:
+                    self.cache.set(self._cache_key('chunk', chunk_idx), pending[:chunk_size], timeout=GRAMMAR_MATCHES['ttl'])
+                    pending = pending[chunk_size:]
+                    chunk_idx += 1
+                # The incomplete last chunk is stored too, so that the first pages are served during the walk
+                self.cache.set(self._cache_key('chunk', chunk_idx), pending, timeout=GRAMMAR_MATCHES['ttl'])
+
+                state['processed'] += len(hits)
+                state['matched'] = chunk_idx * chunk_size + len(pending)
+                state['updated'] = time.time()
+
+                if self.cache.get(self._owner_key()) != self.key:
+                    # The table shows another search or grammar now
+                    state['status'] = STATUS_STOPPED
+                    break
+                self.cache.set(self._cache_key('state'), state, timeout=GRAMMAR_MATCHES['ttl'])
+            else:
+                state['status'] = STATUS_COMPLETED
+
+        except Exception:
+            logging.getLogger(ERROR_LOGGER).exception('Grammar match walk failed.')
+            state['status'] = STATUS_FAILED
+        finally:
+            pages.close()
+
+        state['updated'] = time.time()
+        self.cache.set(self._cache_key('state'), state, timeout=GRAMMAR_MATCHES['ttl'])
+        self.cache.delete(self._cache_key('walker'))
+
+    def get_page(self, start, length):
+        """ Returns the stored [index, id, match spans] entries at the offsets of the page and the state of the walk
+
+        Waits up to GRAMMAR_MATCHES['page_wait'] seconds for a running walk to reach the page.
+        """
+        deadline = time.time() + GRAMMAR_MATCHES['page_wait']
+        while True:
+            state = self.get_state()
+            if state is None or state['status'] != STATUS_RUNNING or state['matched'] >= start + length or time.time() >= deadline:
+                break
+            time.sleep(0.2)
+
+        if not state:
+            return [], {'status': STATUS_FAILED, 'processed': 0, 'matched': 0}
+
+        chunk_size = GRAMMAR_MATCHES['chunk_size']
+        end = min(start + length, state['matched'])
+        entries = []
+        for chunk_idx in range(start // chunk_size, (end - 1) // chunk_size + 1 if end > start else start // chunk_size):
+            chunk = self.cache.get(self._cache_key('chunk', chunk_idx)) or []
+            chunk_start = chunk_idx * chunk_size
+            entries.extend(chunk[max(start - chunk_start, 0):end - chunk_start])
+        return entries, state
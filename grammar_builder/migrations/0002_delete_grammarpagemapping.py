@@ -0,0 +1,16 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grammar_builder', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='GrammarPageMapping',
+        ),
+    ]
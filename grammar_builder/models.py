@@ -17,18 +17,6 @@ class GrammarComponent(models.Model):
         return "{\tName: %s\n\tType: %s\n\tContent: %s\n\tLayer: %s\n\tJoin-by: %s\n}"%(self.name, self.type, self.content, self.layer, self.join_by)
 
 
-# Maps grammar tool's session data (search_id, inclusive_grammar, exclusive_grammar) and pagination step to
-# specific cursor location ('from') in Elastic Search.
-class GrammarPageMapping(models.Model):
-    search_id = models.IntegerField()
-    inclusive_grammar = models.IntegerField()
-    exclusive_grammar = models.IntegerField()
-    polarity = models.CharField(max_length=8)
-    page = models.IntegerField()
-    elastic_start = models.IntegerField()
-    elastic_end = models.IntegerField()
-    author = models.ForeignKey(User, on_delete=models.CASCADE)
-    
 class Grammar(models.Model):
     name = models.CharField(max_length=64)
     json = models.CharField(max_length=2048)
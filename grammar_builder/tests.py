@@ -1,3 +1,78 @@
-from django.test import TestCase
+import random
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from . import multilayer_matcher as matcher
+from .grammar_engine import compile_grammar
+
+WORDS = ['tere', 'pere', 'kere', 'ohsa', 'mis', 'sa', 'ikka', 'vaike', 'teretere']
+SEPARATORS = [' ', ' ', ' ', '  ', '\t', '\n', '+', ' +', '++']
+LAYERS = ['text', 'text.lemmas']
+# Patterns of whole characters, as multilayer_matcher fails on matches starting with a delimiter or empty ones
+REGEXES = ['[tpk]ere', 'e+', 's[a-z]*', '[a-z]+a', 'ikka|mis']
+
+
+def random_text(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(0, 12))]
+    words = [word.upper() if rng.random() < 0.1 else word for word in words]
+    return ''.join(word + rng.choice(SEPARATORS) for word in words).strip()
+
+
+def random_grammar(rng, depth=0):
+    if depth >= 2 or rng.random() < 0.4:
+        component = {'layer': rng.choice(LAYERS), 'sensitive': rng.random() < 0.3}
+        if rng.random() < 0.6:
+            terms = rng.sample(WORDS, rng.randint(1, 3))
+            if rng.random() < 0.2:
+                terms.append(' '.join(rng.sample(WORDS, 2)))
+            component.update({'operation': 'exact', 'terms': terms})
+        else:
+            component.update({'operation': 'regex', 'expression': rng.choice(REGEXES)})
+        return component
+
+    component = {'operation': rng.choice(['union', 'intersect', 'concat', 'gap']),
+                 'components': [random_grammar(rng, depth + 1) for _ in range(rng.randint(1, 3))]}
+    if component['operation'] == 'gap':
+        component.update({'slop': rng.choice([None, 1, 2, 3]), 'matchFirst': False})
+    return component
+
+
+def generate_instructions(component_dict):
+    """ multilayer_matcher instructions of a metaquery, as built by grammar_builder.views before the compiled engine
+    """
+    if 'layer' in component_dict:
+        if component_dict['operation'] == 'exact':
+            return matcher.Exact(component_dict['terms'], component_dict['layer'], component_dict['sensitive'])
+        return matcher.Regex(component_dict['expression'], component_dict['layer'], component_dict['sensitive'])
+
+    components = [generate_instructions(sub_component) for sub_component in component_dict['components']]
+    if component_dict['operation'] == 'gap':
+        return matcher.Gap(components, slop=component_dict['slop'])
+    return {'concat': matcher.Concatenation, 'intersect': matcher.Intersection, 'union': matcher.Union}[component_dict['operation']](components)
+
+
+class GrammarEngineTest(SimpleTestCase):
+
+    def test_matches_multilayer_matcher(self):
+        rng = random.Random(0)
+
+        for _ in range(300):
+            metaquery = random_grammar(rng)
+            feature_dicts = [{layer: random_text(rng) for layer in LAYERS} for _ in range(rng.randint(1, 5))]
+            instructions = generate_instructions(metaquery)
+
+            for feature_dict, matches in zip(feature_dicts, compile_grammar(metaquery).match_batch(feature_dicts)):
+                expected = instructions.match(matcher.LayerDict(feature_dict))
+                self.assertEqual(sorted((match.token_idxs, match.features) for match in matches),
+                                 sorted((match.token_idxs, match.features) for match in expected),
+                                 msg='{0} {1}'.format(metaquery, feature_dict))
+
+    def test_plus_delimits_tokens(self):
+        metaquery = {'operation': 'concat', 'components': [{'operation': 'exact', 'terms': ['b'], 'layer': 'text', 'sensitive': False},
+                                                           {'operation': 'exact', 'terms': ['c'], 'layer': 'text', 'sensitive': False}]}
+        feature_dict = {'text': 'a+b +c C++'}
+        matches = compile_grammar(metaquery).match(feature_dict)
+        expected = generate_instructions(metaquery).match(matcher.LayerDict(feature_dict))
+
+        self.assertEqual([(match.token_idxs, match.features) for match in matches], [((1, 2), ('text', 'text'))])
+        self.assertEqual(sorted((match.token_idxs, match.features) for match in matches), sorted((match.token_idxs, match.features) for match in expected))
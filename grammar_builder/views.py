@@ -2,38 +2,31 @@ from __future__ import absolute_import
 import json
 import pprint
 
-from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.http import HttpResponse, HttpResponseRedirect
 from django.template import loader, Context
 from django.contrib.auth.decorators import login_required
-import requests
 
 from searcher.views import Search
 from utils.datasets import Datasets
 from utils.es_manager import ES_Manager
 
-from texta.settings import STATIC_URL, URL_PREFIX, es_url
+from texta.settings import STATIC_URL, URL_PREFIX
 
 from task_manager.models import Task
+from task_manager.task_manager import create_task
 from task_manager.tasks.task_types import TaskTypes
+from task_manager.tasks.workers.management_workers.management_task_params import ManagerKeys
 from permission_admin.models import Dataset
 from conceptualiser.models import Term, TermConcept, Concept
-from grammar_builder.models import GrammarComponent, GrammarPageMapping, Grammar
+from grammar_builder.models import GrammarComponent, Grammar
 from . import multilayer_matcher as matcher
+from .match_store import GrammarMatchStore, get_feature_dict, get_matches
+from .grammar_engine import TOKEN_PATTERN, compile_grammar
 
 from .elastic_grammar_query import ElasticGrammarQuery
 
 from collections import defaultdict
 
-import csv
-
-import sys, os
-
-try:
-    from io import BytesIO
-except:
-    from io import StringIO
-
-ES_SCROLL_BATCH = 100
 
 @login_required
 def index(request):
@@ -265,6 +258,8 @@ def get_table(request):
 
 @login_required
 def export_matched_data(request):
+    """ Starts a management task writing the documents matched by the grammar, with their match spans, to a file
+    """
     search_id = request.GET['search_id']
 
     inclusive_metaquery = json.loads(request.GET['inclusive_grammar'])
@@ -282,72 +277,27 @@ def export_matched_data(request):
         es_m.load_combined_query(saved_query)
         es_m.merge_combined_query_with_query_dict(component_query)
 
-    inclusive_instructions = generate_instructions(inclusive_metaquery)
-
-    response = StreamingHttpResponse(get_all_matched_rows(es_m.combined_query['main'], request, inclusive_instructions), content_type='text/csv')
-
-    response['Content-Disposition'] = 'attachment; filename="%s"' % ('extracted.csv')
-
-    return response
-
-def get_all_matched_rows(query, request, inclusive_instructions):
-    buffer_ = StringIO()
-    writer = csv.writer(buffer_)
-
-    ds = Datasets().activate_dataset(request.session)
-    es_m = ds.build_manager(ES_Manager)
-
     features = sorted([field['path'] for field in es_m.get_mapped_fields()])
 
-    query['size'] = ES_SCROLL_BATCH
-
-    writer.writerow(features)
-
-    ds.get_index()
-    ds.get_mapping()
-    es_url
-
-    request_url = os.path.join(es_url, ds.get_index(), ds.get_mapping(), '_search?scroll=1m')
-    response = requests.get(request_url, data=json.dumps(query)).json()
-
-    scroll_id = response['_scroll_id']
-    hits = response['hits']['hits']
-
-    scroll_payload = json.dumps({'scroll':'1m', 'scroll_id':scroll_id})
-    while hits:
-        for hit in hits:
-            feature_dict = {feature_name:hit['_source'][feature_name] for feature_name in hit['_source']}
-
-            feature_dict = {}
-
-            row = []
-            for feature_name in features:
-                feature_path = feature_name.split('.')
-                parent_source = hit['_source']
-                for path_component in feature_path:
-                    if path_component in parent_source:
-                        parent_source = parent_source[path_component]
-                    else:
-                        parent_source = ""
-                        break
-
-                content = parent_source
-                row.append(content)
-                feature_dict[feature_name] = content
-
-            layer_dict = matcher.LayerDict(feature_dict)
-            if inclusive_instructions.match(layer_dict):
-                writer.writerow([element.encode('utf-8') if isinstance(element,unicode) else element for element in row])
-
-        buffer_.seek(0)
-        data = buffer_.read()
-        buffer_.seek(0)
-        buffer_.truncate()
-        yield data
-
-        response = requests.get(os.path.join(es_url,'_search','scroll'), data=scroll_payload).json()
-        hits = response['hits']['hits']
-        scroll_id = response['_scroll_id']
+    task_type = TaskTypes.MANAGEMENT_TASK
+    description = 'grammar_builder_export'
+    params = {
+        'grammar_export_query': es_m.combined_query['main'],
+        'grammar_export_metaquery': inclusive_metaquery,
+        'grammar_export_layers': sorted(extract_layers(inclusive_metaquery)),
+        'grammar_export_features': features,
+        'grammar_export_format': request.GET.get('format', 'csv'),
+        'task_type': task_type,
+        'manager_key': ManagerKeys.GRAMMAR_EXPORTER,
+        'description': description,
+        'dataset': request.session['dataset']
+    }
+
+    task_id = create_task(task_type, description, params, request.user)
+    task = Task.objects.get(pk=task_id)
+    task.update_status(Task.STATUS_QUEUED)
+
+    return HttpResponse(json.dumps({'task_id': task_id}))
 
 @login_required
 def get_table_data(request):
@@ -355,7 +305,7 @@ def get_table_data(request):
 
     query_data['search_id'] = request.GET['search_id']
     query_data['polarity'] = request.GET['polarity']
-    query_data['requested_page'] = int(request.GET['iDisplayStart'])/int(request.GET['iDisplayLength'])+1
+    query_data['start'] = int(request.GET['iDisplayStart'])
     query_data['page_length'] = int(request.GET['iDisplayLength'])
 
     if request.GET['is_test'] == 'true':
@@ -376,17 +326,8 @@ def get_table_data(request):
         query_data['features'] = sorted(extract_layers(query_data['inclusive_metaquery']) | extract_layers(query_data['exclusive_metaquery']))
 
 
-    GrammarPageMapping.objects.filter(search_id=query_data['search_id'],
-                                    inclusive_grammar=query_data['inclusive_grammar_id'],
-                                    exclusive_grammar=query_data['exclusive_grammar_id'],
-                                    polarity=query_data['polarity'], author=request.user).delete()
-
-
     ds = Datasets().activate_dataset(request.session)
 
-    query_data['dataset'] = ds.get_index()
-    query_data['mapping'] = ds.get_mapping()
-
     component_query = ElasticGrammarQuery(query_data['inclusive_metaquery'], None).generate()
 
     es_m = ds.build_manager(ES_Manager)
@@ -404,148 +345,50 @@ def get_table_data(request):
         if query_data['polarity'] == 'positive':
             es_m.combined_query = component_query
 
-    # Add paging data to the query
-    #es_m.set_query_parameter('from', request.session['grammar_'+polarity+'_cursor'])
-    es_m.set_query_parameter('size', request.GET['iDisplayLength'])
-    es_m.set_query_parameter('_source', query_data['features'])
-
-    query_data['inclusive_instructions'] = generate_instructions(query_data['inclusive_metaquery'])
-    query_data['exclusive_instructions'] = {} #generate_instructions(query_data['exclusive_metaquery'])
+    match_store = GrammarMatchStore(es_m, es_m.combined_query['main'], query_data['inclusive_metaquery'], query_data['polarity'],
+                                    owner='{0}:{1}'.format(request.user.pk, query_data['polarity']))
+    match_store.start(query_data['features'], compile_grammar(query_data['inclusive_metaquery']))
 
-    data = scroll_data(es_m.combined_query['main'], request, query_data)
+    data = get_page_data(es_m, match_store, query_data)
     data['sEcho'] = request.GET['sEcho']
 
     return HttpResponse(json.dumps(data,ensure_ascii=False))
 
 
-def scroll_data(query,request, query_data):
-    out = {'aaData':[],'iTotalRecords':0,'iTotalDisplayRecords':0}
-
-    positive_polarity = query_data['polarity'] == 'positive'
-
-    rows = out['aaData']
-    target_row_no = query_data['page_length']
-
-    grammar_page_mapping = GrammarPageMapping.objects.filter(search_id=query_data['search_id'],
-                                                             inclusive_grammar=query_data['inclusive_grammar_id'],
-                                                            exclusive_grammar=query_data['exclusive_grammar_id'],
-                                                            page=query_data['requested_page'], polarity=query_data['polarity'],
-                                                            author=request.user)
-
-    if grammar_page_mapping:
-        es_from = grammar_page_mapping[0].elastic_start
-    else:
-        ordered_pages = GrammarPageMapping.objects.filter(search_id=query_data['search_id'],
-                                                          inclusive_grammar=query_data['inclusive_grammar_id'],
-                                                            exclusive_grammar=query_data['exclusive_grammar_id'],
-                                                            polarity=query_data['polarity'], author=request.user).order_by('-page')
-        if ordered_pages:
-            max_stored_page, es_from = ordered_pages[0].page, ordered_pages[0].elastic_end
-        else:
-            max_stored_page, es_from = 0, 0
-
-        es_from = get_es_from(max_stored_page, es_from, request, query, query_data)
-
-    page_data = get_next_page_data(query, es_from, 0, query_data, request)
-    rows.extend(page_data['rows'])
-
-    out['iTotalRecords'] = page_data['total']
-    out['iTotalDisplayRecords'] = page_data['total']
-    return out
-
-def get_es_from(max_stored_page, es_from, request, query, query_data):
-    current_page = max_stored_page
-    requested_page = query_data['requested_page']
-    es_from = es_from
-    last_end = es_from
-
-    while current_page < requested_page and es_from != None:
-        page_data = get_next_page_data(query, last_end, current_page, query_data, request)
-        es_from = page_data['from']
-        last_end = page_data['end']
-        current_page = page_data['page']
-
-    return es_from
-
-
-def get_next_page_data(query, es_from, last_page, query_data, request):
-    start_from = None
-    end = None
-    rows = []
-    page_length = query_data['page_length']
-
-    if es_from == None:
-        return {'rows':rows,'from':start_from,'page':last_page,'end':None, 'total':None}
-
-    dataset = query_data['dataset']
-    mapping = query_data['mapping']
-    polarity = query_data['polarity']
-
-    inclusive_instructions = query_data['inclusive_instructions']
-    exclusive_instructions = query_data['exclusive_instructions']
-
-    query['from'] = es_from
-    response = ES_Manager.plain_search(es_url, dataset, mapping, query)
-
-    try:
-        hit = response['hits']['hits'][0]
-        feature_dict = {feature_name:hit['_source'][feature_name][0] for feature_name in hit['_source']}
+def get_page_data(es_m, match_store, query_data):
+    """ Returns the rows of the page from the stored grammar matches, the total is exact once all the documents are walked
+    """
+    entries, state = match_store.get_page(query_data['start'], query_data['page_length'])
+    out = {'aaData':[],'iTotalRecords':state['matched'],'iTotalDisplayRecords':state['matched']}
+
+    if not entries:
+        return out
+
+    query = {'query': {'ids': {'values': list(set(doc_id for index, doc_id, matches in entries))}}, 'size': len(entries), '_source': query_data['features']}
+    response = ES_Manager.plain_search(es_m.es_url, es_m.stringify_datasets(), query)
+    hits = {(hit['_index'], hit['_id']): hit for hit in response['hits']['hits']}
+
+    for index, doc_id, matches in entries:
+        if (index, doc_id) not in hits:
+            # Deleted after the walk
+            continue
+        hit = hits[(index, doc_id)]
+        feature_dict = get_feature_dict(hit)
         sorted_feature_names = sorted(feature_dict)
-        feature_to_idx_map = {feature: (feature_idx+1) for feature_idx, feature in enumerate(sorted_feature_names)}
-    except:
-        pass
-
-    hit_idx = page_length-1
-
-    while len(rows) < page_length and 'hits' in response and 'hits' in response['hits'] and response['hits']['hits'] and hit_idx+1 == page_length:
-        for hit_idx, hit in enumerate(response['hits']['hits']):
-            if len(rows) >= page_length:
-                break
-
-            feature_dict = {}
-
-            for field_name in hit['_source']:
-                field_value = hit['_source'][field_name]
-                if isinstance(field_value, dict):
-                    for subfield_name, subfield_value in field_value.items():
-                        combined_field_name = '{0}.{1}'.format(field_name, subfield_name)
-                        feature_dict[combined_field_name] = subfield_value
-                else:
-                    feature_dict[field_name] = field_value
 
-            sorted_feature_names = sorted(feature_dict)
+        feature_to_idx_map = defaultdict(list)
+        for feature_idx, feature in enumerate(sorted_feature_names):
+            feature_to_idx_map[feature.split('.')[0]].append(feature_idx+1)
 
-            feature_to_idx_map = defaultdict(list)
-            for feature_idx, feature in enumerate(sorted_feature_names):
-                feature_to_idx_map[feature.split('.')[0]].append(feature_idx+1)
+        row = [hit['_id']]
+        row.extend([feature_dict[feature_name] for feature_name in sorted_feature_names])
 
-            row = [hit['_id']]
-            row.extend([feature_dict[feature_name] for feature_name in sorted_feature_names])
-            layer_dict = matcher.LayerDict(feature_dict)
+        if matches:
+            row = highlight(row, feature_to_idx_map, get_matches(matches))
 
-            inclusive_matches = inclusive_instructions.match(layer_dict)
+        out['aaData'].append(row)
 
-            if (polarity == 'positive') == bool(inclusive_matches): # add row if polarity is positive and we have a match or negative and dont
-                if len(rows) == 0:
-                    start_from = query['from'] + hit_idx
-                end = query['from'] + hit_idx
-
-                if inclusive_matches:
-                    row = highlight(row, feature_to_idx_map, inclusive_matches)
-
-                rows.append(row)
-
-        query['from'] = query['from'] + hit_idx + 1
-
-        if len(rows) >= page_length:
-            break
-        response = ES_Manager.plain_search(es_url, dataset, mapping,query)
-    if end:
-        GrammarPageMapping(search_id=query_data['search_id'], inclusive_grammar=query_data['inclusive_grammar_id'],
-                        exclusive_grammar=query_data['exclusive_grammar_id'], page=query_data['requested_page'], polarity=query_data['polarity'],
-                        elastic_start=start_from, elastic_end=end+1, author=request.user).save()
-
-    return {'rows':rows,'from':start_from,'page':last_page+1,'end':(end+(0 if last_page == 0 else 1)) if end else end, 'total':response['hits']['total']}
+    return out
 
 def highlight(row, feature_to_idx_map, inclusive_matches):
     colours = defaultdict(lambda: defaultdict(list))
@@ -558,12 +401,21 @@ def highlight(row, feature_to_idx_map, inclusive_matches):
 
     for feature in colours:
         for feature_idx in feature_to_idx_map[feature]:
-            feature_tokens = row[feature_idx].split()
-            for token_idx in colours[feature]:
-                new_token = annotate_token(feature_tokens[token_idx], titles[feature][token_idx], colours[feature][token_idx])
-                feature_tokens[token_idx] = new_token
+            # Tokens are delimited like in the grammar engine, the delimiters are kept
+            text = row[feature_idx]
+            token_spans = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+            parts = []
+            last_end = 0
+            for token_idx, (start, end) in enumerate(token_spans):
+                parts.append(text[last_end:start])
+                if token_idx in colours[feature]:
+                    parts.append(annotate_token(text[start:end], titles[feature][token_idx], colours[feature][token_idx]))
+                else:
+                    parts.append(text[start:end])
+                last_end = end
+            parts.append(text[last_end:])
 
-            row[feature_idx] = ' '.join(feature_tokens)
+            row[feature_idx] = ''.join(parts)
 
     return row
 
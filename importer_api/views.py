@@ -2,12 +2,13 @@ from django.http import JsonResponse
 from account.models import Profile
 from django.views import View
 from elasticsearch.helpers import streaming_bulk as elastic_parallelbulk
-from texta.settings import es_url, INFO_LOGGER
+from texta.settings import FACT_FIELD, es_url, INFO_LOGGER
 
 import json
 import logging
 import elasticsearch
 
+from utils import aggregation_cache
 from utils.es_manager import ES_Manager
 
 
@@ -23,6 +24,7 @@ class ElasticsearchHandler:
 
     def insert_single_document(self, document):
         response = self.es.index(index=self.index, doc_type=self.doc_type, body=document)
+        aggregation_cache.invalidate_indices([self.index], facts=FACT_FIELD in document)
         self.logger.info(response)
 
     def insert_multiple_documents(self, list_of_documents):
@@ -33,6 +35,7 @@ class ElasticsearchHandler:
             if not success:
                 self.logger.error(str(response))
                 raise ValueError(str(response))
+        aggregation_cache.invalidate_indices([self.index], facts=any(FACT_FIELD in document for document in list_of_documents))
 
     def insert_index_into_es(self, analyzer):
         """
@@ -276,7 +276,8 @@ def query(request):
                 preclusters = PreclusterMaker(positives,[model.model.wv.syn0norm[model.vocab[positive].index] for positive in positives])()
                 labels, vectors = zip(*[zip(*cluster) for cluster in preclusters])
                 label_idxes = [[model.vocab[label].index for label in labels[cluster_idx]] for cluster_idx in range(len(labels))]
-                suggestions_per_cluster = [list(zip(*getattr(model,method)(positive=labels[cluster_idx],topn=50,ignored_idxes = ignored_idxes + [label_idxes[i][j] for i in range(len(label_idxes)) for j in range(len(label_idxes[i])) if i != cluster_idx])))[0] for cluster_idx in range(len(labels))]
+                other_label_idxes = [[label_idxes[i][j] for i in range(len(label_idxes)) for j in range(len(label_idxes[i])) if i != cluster_idx] for cluster_idx in range(len(labels))]
+                suggestions_per_cluster = [[similar[0] for similar in similars] for similars in getattr(model,method+'_batch')(positives=[list(cluster_labels) for cluster_labels in labels],topn=50,ignored_idxes=ignored_idxes,extra_ignored_idxes=other_label_idxes)]
                 suggestions_list = suggestions_per_cluster
                 suggestions = RRA_suggestions(suggestions_list, tooltip_feature, request)
             else:
@@ -284,7 +285,7 @@ def query(request):
         else:
             #RobustRankAggreg
             _, local_method = request.POST['method'].split()
-            local_suggestions = [[similar[0] for similar in getattr(model,local_method)(positive=[positive],topn=50,ignored_idxes=ignored_idxes) if similar[0] not in positives ] for positive in positives]
+            local_suggestions = [[similar[0] for similar in similars if similar[0] not in positives ] for similars in getattr(model,local_method+'_batch')(positives=[[positive] for positive in positives],topn=50,ignored_idxes=ignored_idxes)]
             suggestions_list = local_suggestions
             suggestions = RRA_suggestions(suggestions_list, tooltip_feature, request)
 
@@ -7,8 +7,9 @@ sys.path.append(file_dir)
 from .query import Query
 from .searcher import Searcher
 
-import requests
-import json
+import time
+
+from utils.es_transport import get_client
 
 
 class Aggregator(object):
@@ -17,23 +18,45 @@ class Aggregator(object):
         self._date_format = date_format
         self._searcher = Searcher(es_url)
         self._es_url = es_url
-        self._header = {"Content-Type": "application/json"}
 
     def aggregate(self, processed_request):
+        """ Runs the aggregation over all the searches of the request in a single multi search
+
+        Results are returned in the order of the searches. If the request sets "timings" to true,
+        the Elasticsearch time of every search and the total time in milliseconds are returned as well.
+        """
         aggregation_subquery = self._prepare_aggregation_subquery(processed_request['aggregation'])
 
-        aggregation_results = []
+        queries = []
         for search in processed_request['searches']:
             query = self._searcher.create_search_query(search)
             query.set_parameter('aggs', aggregation_subquery)
             query.set_parameter('size', 0)
-            aggregation_results.append(self._get_aggregation_results(search['index'], search['mapping'], query.generate()))
+            queries.append((search['index'], search['mapping'], query.generate()))
+
+        start = time.time()
+        responses = self._get_aggregation_results(queries)
+        took = int((time.time() - start) * 1000)
 
+        aggregation_results = []
+        for response in responses:
+            if 'error' in response:
+                aggregation_results.append({'error': response['error']})
+            else:
+                aggregation_results.append(response['aggregations'])
+
+        if processed_request.get('timings', False):
+            timings = [{'took': response.get('took'), 'timed_out': response.get('timed_out', False)} for response in responses]
+            return {'aggregations': aggregation_results, 'timings': timings, 'took': took}
         return aggregation_results
 
-    def _get_aggregation_results(self, index, mapping, query):
-        response = requests.post('{0}/{1}/{2}/_search'.format(self._es_url, index, mapping), data=json.dumps(query), headers=self._header)
-        return response.json()['aggregations']
+    def _get_aggregation_results(self, queries):
+        body = []
+        for index, mapping, query in queries:
+            body.append({'index': index, 'type': mapping})
+            body.append(query)
+
+        return get_client(self._es_url).msearch(body=body)['responses']
 
     def _prepare_aggregation_subquery(self, aggregation_steps):
         for agg in aggregation_steps:
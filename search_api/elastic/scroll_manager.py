@@ -0,0 +1,168 @@
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from search_api.models import ScrollCursor
+from texta.settings import SEARCH_API_SCROLL
+from utils.es_transport import get_client
+
+TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+class ScrollLimitExceeded(Exception):
+    pass
+
+
+def parse_keep_alive(keep_alive):
+    """ Converts an Elasticsearch time value like 30s, 1m or 1h to seconds
+    """
+    match = re.fullmatch(r'(\d+)([smh])', str(keep_alive))
+    if not match:
+        raise ValueError('Invalid scroll keep-alive: {}. Use seconds, minutes or hours, like 30s, 1m or 1h.'.format(keep_alive))
+    return int(match.group(1)) * TIME_UNITS[match.group(2)]
+
+
+class ScrollManager(object):
+    """ Scrolls search results on behalf of search API clients
+
+    Clients get opaque cursors, which are mapped to the Elasticsearch scroll IDs in the database,
+    so that any server process can continue a scroll. The number of open cursors of a user is limited,
+    and contexts of abandoned cursors are cleared once their keep-alive has passed.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+        self.client = get_client()
+
+    def start(self, index, mapping, query, keep_alive=None):
+        """ Runs the query and opens a cursor to its next pages
+
+        :param query: Elasticsearch query body, its size is the page size.
+        :param keep_alive: time the cursor stays open between requests, limited by max_keep_alive.
+        :return: dict of the first page's hits, the cursor and the total number of hits.
+        """
+        keep_alive = self._get_keep_alive(keep_alive)
+        self.expire_cursors()
+
+        user_id = self.user.pk if self.user else None
+        if ScrollCursor.objects.filter(user_id=user_id).count() >= SEARCH_API_SCROLL['max_cursors_per_user']:
+            raise ScrollLimitExceeded('Too many open scrolls, a maximum of {} is allowed. Scroll to the end or close the unused ones.'.format(SEARCH_API_SCROLL['max_cursors_per_user']))
+
+        response = self.client.search(index=index, doc_type=mapping, body=query, scroll=keep_alive)
+        hits = [hit['_source'] for hit in response['hits']['hits']]
+        total = response['hits']['total']
+
+        if not hits or len(hits) >= total:
+            # All the results fit into the first page
+            self._clear(response.get('_scroll_id'))
+            return {'hits': hits, 'scroll_id': None, 'total': total}
+
+        cursor = ScrollCursor.objects.create(
+            cursor=secrets.token_urlsafe(32),
+            user_id=user_id,
+            scroll_id=response['_scroll_id'],
+            keep_alive=keep_alive,
+            total=total,
+            expires_at=self._get_expiry(keep_alive)
+        )
+        return {'hits': hits, 'scroll_id': cursor.cursor, 'total': total}
+
+    def next(self, cursor):
+        """ Returns the next page of a cursor, the cursor is closed after the last page
+        """
+        scroll_cursor = self._get_cursor(cursor)
+
+        response = self.client.scroll(scroll_id=scroll_cursor.scroll_id, scroll=scroll_cursor.keep_alive)
+        hits = [hit['_source'] for hit in response['hits']['hits']]
+
+        if not hits:
+            self._close(scroll_cursor)
+            return {'hits': [], 'scroll_id': None, 'total': scroll_cursor.total}
+
+        scroll_cursor.scroll_id = response.get('_scroll_id', scroll_cursor.scroll_id)
+        scroll_cursor.expires_at = self._get_expiry(scroll_cursor.keep_alive)
+        scroll_cursor.save(update_fields=['scroll_id', 'expires_at'])
+        return {'hits': hits, 'scroll_id': cursor, 'total': scroll_cursor.total}
+
+    def close(self, cursor):
+        self._close(self._get_cursor(cursor))
+
+    def stream(self, index, mapping, query, limit=None):
+        """ Yields all the hits of the query, the next page is fetched while the current one is consumed
+
+        :param limit: maximum number of yielded hits.
+        """
+        query.setdefault('size', SEARCH_API_SCROLL['stream_page_size'])
+        keep_alive = SEARCH_API_SCROLL['default_keep_alive']
+        executor = ThreadPoolExecutor(max_workers=1)
+        scroll_id = None
+
+        try:
+            response = self.client.search(index=index, doc_type=mapping, body=query, scroll=keep_alive)
+            hits_yielded = 0
+            while response['hits']['hits']:
+                scroll_id = response.get('_scroll_id', scroll_id)
+                next_page = executor.submit(self.client.scroll, scroll_id=scroll_id, scroll=keep_alive)
+
+                for hit in response['hits']['hits']:
+                    if limit and hits_yielded == limit:
+                        return
+                    yield hit['_source']
+                    hits_yielded += 1
+
+                response = next_page.result()
+        finally:
+            # Also reached when the client disconnects and the response is closed
+            executor.shutdown(wait=True)
+            self._clear(scroll_id)
+
+    @classmethod
+    def expire_cursors(cls):
+        """ Clears the scroll contexts of cursors which have not been continued within their keep-alive
+        """
+        client = get_client()
+        for scroll_cursor in ScrollCursor.objects.filter(expires_at__lt=datetime.now()):
+            cls._clear_scroll(client, scroll_cursor.scroll_id)
+            scroll_cursor.delete()
+
+    def _get_cursor(self, cursor):
+        user_id = self.user.pk if self.user else None
+        try:
+            scroll_cursor = ScrollCursor.objects.get(cursor=cursor, user_id=user_id)
+        except ScrollCursor.DoesNotExist:
+            raise Exception('Scroll ID is not valid or has expired.')
+
+        if scroll_cursor.expires_at < datetime.now():
+            self._close(scroll_cursor)
+            raise Exception('Scroll ID is not valid or has expired.')
+
+        return scroll_cursor
+
+    def _close(self, scroll_cursor):
+        self._clear(scroll_cursor.scroll_id)
+        scroll_cursor.delete()
+
+    def _clear(self, scroll_id):
+        self._clear_scroll(self.client, scroll_id)
+
+    @staticmethod
+    def _clear_scroll(client, scroll_id):
+        if scroll_id:
+            try:
+                client.clear_scroll(scroll_id=scroll_id, ignore=(404,))
+            except Exception:
+                # The context expires after its keep-alive anyway
+                pass
+
+    @staticmethod
+    def _get_keep_alive(keep_alive):
+        if not keep_alive:
+            return SEARCH_API_SCROLL['default_keep_alive']
+        if parse_keep_alive(keep_alive) > parse_keep_alive(SEARCH_API_SCROLL['max_keep_alive']):
+            return SEARCH_API_SCROLL['max_keep_alive']
+        return keep_alive
+
+    @staticmethod
+    def _get_expiry(keep_alive):
+        return datetime.now() + timedelta(seconds=parse_keep_alive(keep_alive))
@@ -1,11 +1,11 @@
-from elasticsearch import Elasticsearch
 from elasticsearch_dsl import Search
 from query import Query
-import requests
 import json
 from collections import defaultdict
 
-from texta.settings import es_url
+from texta.settings import SEARCH_API_SCROLL
+from utils.es_transport import get_client, get_session
+from .scroll_manager import ScrollManager
 
 
 class Searcher(object):
@@ -14,11 +14,8 @@ class Searcher(object):
         self._es_url = es_url
         self._use_ldap = False
         self._header = {"Content-Type": "application/json"}
-        if es_use_ldap:
-            self._requests = requests.Session()
-            self._requests.auth = (es_ldap_user, es_ldap_password)
-        else:
-            self._requests = requests
+        # Pooled session of the process, LDAP credentials are applied by es_transport
+        self._requests = get_session()
 
         self._default_batch = default_batch
 
@@ -44,15 +41,33 @@ class Searcher(object):
 
         scroll = processed_request.get('scroll', False)
         scroll_id = processed_request.get('scroll_id', None)
+        keep_alive = processed_request.get('scroll_keep_alive', None)
 
         fields = processed_request.get("fields", None)
 
-        query = json.dumps(self.create_search_query(processed_request).generate())
+        # Scroll IDs given to the clients are cursors of the scroll manager
+        scroll_manager = ScrollManager(processed_request.get('user', None))
 
-        if scroll_id:
-            return self._continue_scrolling(scroll_id)
+        if scroll_id and processed_request.get('close_scroll', False):
+            scroll_manager.close(scroll_id)
+            return {'hits': [], 'scroll_id': None, 'total': 0}
+        elif scroll_id:
+            return scroll_manager.next(scroll_id)
         elif scroll:
-            return self._start_scrolling(index, mapping, query, fields)
+            query = Search().from_dict(self.create_search_query(processed_request).generate()).source(fields).to_dict()  # Add field limits to the query.
+            return scroll_manager.start(index, mapping, query, keep_alive)
+
+    def stream(self, processed_request):
+        """ Yields all the matching documents in one scroll, which is cleared when the stream ends or is closed
+        """
+        index = processed_request['index']
+        mapping = processed_request['mapping']
+        fields = processed_request.get("fields", None)
+
+        query = Search().from_dict(self.create_search_query(processed_request).generate()).source(fields).to_dict()
+        query['size'] = SEARCH_API_SCROLL['stream_page_size']
+
+        return ScrollManager(processed_request.get('user', None)).stream(index, mapping, query, limit=self._limit)
 
     def create_search_query(self, processed_request):
         parameters = processed_request.get('parameters', None)  # fields, size, from
@@ -104,8 +119,7 @@ class Searcher(object):
     def _search(self, index, mapping, query, real_fields):
         query_dict = json.loads(query)
 
-        e = Elasticsearch(es_url)
-        search = Search(index=index, doc_type=mapping).update_from_dict(query_dict).using(e)
+        search = Search(index=index, doc_type=mapping).update_from_dict(query_dict).using(get_client())
         search = search.source(real_fields)  # Select fields to return.
         search = search[0:query_dict.get("size", 10)]  # Select how many documents to return.
 
@@ -114,44 +128,30 @@ class Searcher(object):
             yield hit.to_dict()
 
     def _search_with_fields(self, index, mapping, query):
-        search_url = '{0}/{1}/{2}/_search?scroll=1m'.format(self._es_url, index, mapping)
-        scroll_url = '{0}/_search/scroll?scroll=1m'.format(self._es_url)
+        keep_alive = SEARCH_API_SCROLL['default_keep_alive']
+        search_url = '{0}/{1}/{2}/_search?scroll={3}'.format(self._es_url, index, mapping, keep_alive)
+        scroll_url = '{0}/_search/scroll?scroll={1}'.format(self._es_url, keep_alive)
 
         response = self._requests.post(search_url, data=query, headers=self._header).json()
-        scroll_id = json.dumps({'scroll_id': response['_scroll_id']})
+        scroll_id = response.get('_scroll_id')
 
         hits_yielded = 0
-        while 'hits' in response and 'hits' in response['hits'] and response['hits']['hits']:
-            for hit in response['hits']['hits']:
-                if self._limit and hits_yielded == self._limit:
-                    break
-                for field_name in hit['_source']:
-                    if field_name != 'texta_facts':
-                        hit['_source'][field_name] = hit['_source'][field_name][0]
-                yield hit['_source']
-                hits_yielded += 1
-            else:
-                response = self._requests.post(scroll_url, data=scroll_id, header=self._header).json()
-                continue
-
-            response = {}
-
-    def _start_scrolling(self, index, mapping, query, fields):
-        search_url = '{0}/{1}/{2}/_search?scroll=1m'.format(self._es_url, index, mapping)
-        query = json.dumps(Search().from_dict(json.loads(query)).source(fields).to_dict())  # Add field limits to the query.
-        response = self._requests.post(search_url, data=query, headers=self._header).json()
-
-        hits = response.get("hits", []).get("hits", [])
-        hits = [hit["_source"] for hit in hits if hits]
-        return {'hits': hits, 'scroll_id': response['_scroll_id'], 'total': response['hits']['total']}
-
-    def _continue_scrolling(self, scroll_id):
-        scroll_url = '{0}/_search/scroll?scroll=1m'.format(self._es_url)
-        response = self._requests.post(scroll_url, data=json.dumps({'scroll_id': scroll_id}), headers=self._header).json()
-
-        hits = []
-        if 'hits' in response and 'hits' in response['hits'] and response['hits']['hits']:
-            for hit in response['hits']['hits']:
-                    hits.append(hit['_source'])
-
-        return {'hits': hits, 'scroll_id': scroll_id, 'total': response['hits']['total']}
+        try:
+            while 'hits' in response and 'hits' in response['hits'] and response['hits']['hits']:
+                for hit in response['hits']['hits']:
+                    if self._limit and hits_yielded == self._limit:
+                        break
+                    for field_name in hit['_source']:
+                        if field_name != 'texta_facts':
+                            hit['_source'][field_name] = hit['_source'][field_name][0]
+                    yield hit['_source']
+                    hits_yielded += 1
+                else:
+                    response = self._requests.post(scroll_url, data=json.dumps({'scroll_id': scroll_id}), headers=self._header).json()
+                    scroll_id = response.get('_scroll_id', scroll_id)
+                    continue
+
+                response = {}
+        finally:
+            if scroll_id:
+                self._requests.delete('{0}/_search/scroll'.format(self._es_url), data=json.dumps({'scroll_id': scroll_id}), headers=self._header)
@@ -1,6 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class ScrollCursor(models.Model):
+    """ Open Elasticsearch scroll context handed out to a search API client as an opaque cursor
+    """
+    cursor = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE)
+    scroll_id = models.TextField()
+    keep_alive = models.CharField(max_length=10)
+    total = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
@@ -64,10 +64,8 @@ class RestProcessor(object):
         except:
             raise Exception('Invalid authentication token.')
 
-        Validator.validate_search_data(processed_query, profile.user)
-
-        dataset_id = int(processed_query['dataset'])
-        dataset = Dataset.objects.get(pk=dataset_id)
+        dataset = Validator.validate_search_data(processed_query, profile.user)
+        dataset_id = dataset.pk
 
         for key in ['fields', 'constraints', 'parameters']:
             if key not in processed_query:
@@ -76,6 +74,8 @@ class RestProcessor(object):
         processed_query['dataset'] = dataset_id
         processed_query['index'] = dataset.index
         processed_query['mapping'] = dataset.mapping
+        # Owner of the opened scrolls
+        processed_query['user'] = profile.user
 
         return processed_query
 
@@ -102,11 +102,19 @@ class RestProcessor(object):
 
         Validator.validate_aggregation_data(processed_query)
 
-        for search_idx, search in enumerate(processed_query['searches']):
-            Validator.validate_search_data(search, profile.user, search_idx)
+        # Datasets of all the searches are resolved in one query
+        dataset_ids = []
+        for search in processed_query['searches']:
+            try:
+                dataset_ids.append(int(search['dataset']))
+            except:
+                # Reported by the search's validation
+                pass
+        datasets = Dataset.objects.in_bulk(dataset_ids)
 
-            dataset_id = int(search['dataset'])
-            dataset = Dataset.objects.get(pk=dataset_id)
+        for search_idx, search in enumerate(processed_query['searches']):
+            dataset = Validator.validate_search_data(search, profile.user, search_idx, datasets)
+            dataset_id = dataset.pk
 
             for key in ['fields', 'constraints', 'parameters']:
                 if key not in search:
@@ -235,7 +243,11 @@ class Validator(object):
                     ))
 
     @staticmethod
-    def validate_search_data(data_dict, user, search_position=None):
+    def validate_search_data(data_dict, user, search_position=None, datasets=None):
+        """ Validates a search and returns its dataset
+
+        :param datasets: dict of the datasets resolved beforehand by ID, the dataset is queried if not given.
+        """
         search_position_str = ' for search {0}'.format(search_position) if search_position else ''
 
         try:
@@ -249,7 +261,7 @@ class Validator(object):
             raise Exception('"dataset" attribute{0} is not an integer.'.format(search_position_str))
 
         try:
-            dataset = Dataset.objects.get(pk=dataset_id)
+            dataset = datasets[dataset_id] if datasets is not None else Dataset.objects.get(pk=dataset_id)
         except:
             raise Exception('No dataset ID matches the "dataset" attribute\'s value{0}.'.format(search_position_str))
 
@@ -277,6 +289,8 @@ class Validator(object):
 
         Validator._validate_constraints(data_dict.get('constraints', []), search_position)
 
+        return dataset
+
     @staticmethod
     def _validate_constraints(constraints, search_position):
         for_search_position_str = ' for search {0}'.format(search_position) if search_position != None else ''
@@ -7,6 +7,7 @@ from search_api.update_endpoint import update_views
 urlpatterns = [
     url(r'^search', views.search, name='search'),
     url(r'^scroll', views.scroll, name='scroll'),
+    url(r'^stream', views.stream, name='stream'),
     url(r'^aggregate', views.aggregate, name='aggregate'),
     url(r'^list/datasets', views.list_datasets, name='list_datasets'),
     url(r'^list/dataset', views.list_fields, name='list_fields'),
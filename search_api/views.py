@@ -37,11 +37,26 @@ def scroll(request):
     except Exception as processing_error:
         return HttpResponse(json.dumps({'error': str(processing_error)}))
 
-    results = Searcher(es_url).scroll(processed_request)
+    try:
+        results = Searcher(es_url).scroll(processed_request)
+    except Exception as scroll_error:
+        return HttpResponse(json.dumps({'error': str(scroll_error)}))
 
     return HttpResponse(json.dumps(results, ensure_ascii=False))
 
 
+def stream(request):
+    """ Streams all the matching documents as newline delimited JSON
+    """
+    try:
+        processed_request = RestProcessor().process_searcher(request)
+    except Exception as processing_error:
+        return HttpResponse(json.dumps({'error': str(processing_error)}))
+
+    results = Searcher(es_url).stream(processed_request)
+    return StreamingHttpResponse(process_stream(results), content_type='application/x-ndjson')
+
+
 def aggregate(request):
     try:
         processed_request = RestProcessor().process_aggregator(request)
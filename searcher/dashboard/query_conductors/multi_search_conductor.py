@@ -6,6 +6,7 @@ from elasticsearch_dsl import MultiSearch
 
 from searcher.dashboard.es_helper import DashboardEsHelper
 from texta.settings import ERROR_LOGGER
+from utils import aggregation_cache
 
 
 class MultiSearchConductor:
@@ -19,35 +20,47 @@ class MultiSearchConductor:
         list_of_indices = indices.split(',')
 
         for index in list_of_indices:
-            # Fetch all the fields and their types, then filter the ones we don't want like _texta_id.
-            normal_fields, nested_fields = DashboardEsHelper(es_url=es_url, indices=index).get_aggregation_field_data()
-            normal_fields, nested_fields = self._filter_excluded_fields(excluded_fields, normal_fields, nested_fields, )
+            # Results of an index are cached until it is written to, the aggregations depend on its fields.
+            index_result = aggregation_cache.get_or_compute(
+                index, query_body, lambda: self._query_index(index, query_body, es, es_url, excluded_fields),
+                aggs={'dashboard_excluded_fields': sorted(excluded_fields)}, url=es_url
+            )
+            self.field_counts.update(index_result['field_counts'])
+            result[index] = index_result['responses']
 
-            # Attach all the aggregations to Elasticsearch, depending on the fields.
-            # Text, keywords get term aggs etc.
-            self._normal_fields_handler(normal_fields, index=index, query_body=query_body, es=es)
-            self._texta_facts_agg_handler(index=index, query_body=query_body, es=es)
+        return result
 
-            # Send the query towards Elasticsearch and then save it into the result
-            # dict under its index's name.
-            try:
-                responses = self.multi_search.using(es).execute()
-                result[index] = [response.to_dict() for response in responses]
+    def _query_index(self, index, query_body, es, es_url, excluded_fields):
+        # Every index gets its own multi search, so that its result does not contain the previous indices' ones.
+        self.multi_search = MultiSearch()
+        field_counts = {}
 
-            except elasticsearch.exceptions.TransportError as e:
-                logging.getLogger(ERROR_LOGGER).exception(e.info)
-                raise elasticsearch.exceptions.TransportError
+        # Fetch all the fields and their types, then filter the ones we don't want like _texta_id.
+        normal_fields, nested_fields = DashboardEsHelper(es_url=es_url, indices=index).get_aggregation_field_data()
+        normal_fields, nested_fields = self._filter_excluded_fields(excluded_fields, normal_fields, nested_fields, )
 
-        return result
+        # Attach all the aggregations to Elasticsearch, depending on the fields.
+        # Text, keywords get term aggs etc.
+        self._normal_fields_handler(normal_fields, index=index, query_body=query_body, es=es, field_counts=field_counts)
+        self._texta_facts_agg_handler(index=index, query_body=query_body, es=es)
+
+        # Send the query towards Elasticsearch and then return it with the field counts of the index.
+        try:
+            responses = self.multi_search.using(es).execute()
+            return {'responses': [response.to_dict() for response in responses], 'field_counts': field_counts}
+
+        except elasticsearch.exceptions.TransportError as e:
+            logging.getLogger(ERROR_LOGGER).exception(e.info)
+            raise elasticsearch.exceptions.TransportError
 
-    def _normal_fields_handler(self, list_of_normal_fields, query_body, index, es):
+    def _normal_fields_handler(self, list_of_normal_fields, query_body, index, es, field_counts):
         for field_dict in list_of_normal_fields:
             field_type = field_dict['type']
             field_name = field_dict['full_path']
             clean_field_name = self._remove_dot_notation(field_name)
 
             search_gateway = elasticsearch_dsl.Search(index=index).using(es)
-            self.field_counts[clean_field_name] = search_gateway.query("exists", field=clean_field_name).count()
+            field_counts[clean_field_name] = search_gateway.query("exists", field=clean_field_name).count()
 
             # Do not play around with the #, they exist to avoid naming conflicts as awkward as they may be.
             # TODO Find a better solution for this.
@@ -190,15 +190,14 @@ class AggManager:
                 saved_query = json.loads(s.query)
                 self.es_m.load_combined_query(saved_query)
                 self.es_m.set_query_parameter("aggs", self.agg_query)
-                response = self.es_m.search()
+                response = {"aggregations": self.es_m.search_aggregations()}
                 responses.append({"id":"search_"+str(s.pk),"label":name,"response":response})
         
         # EXECUTE THE LIVE QUERY
         if "ignore_active_search" not in self.es_params:
             self.es_m.build(self.es_params)
             self.es_m.set_query_parameter("aggs", self.agg_query)
-            self.es_m.set_query_parameter("size", 0)
-            response = self.es_m.search()
+            response = {"aggregations": self.es_m.search_aggregations()}
             #raise Exception(self.es_m.combined_query['main']['aggs'])
             responses.append({"id":"query","label":"Current Search","response":response})
 
@@ -209,7 +208,7 @@ class AggManager:
             empty_params = {}
             self.es_m.build(empty_params)
             self.es_m.set_query_parameter("aggs", self.agg_query)
-            response = self.es_m.search()
+            response = {"aggregations": self.es_m.search_aggregations()}
             out["empty_timeline_response"] = response
         
         return out
@@ -0,0 +1,229 @@
+""" Streaming export of searched documents
+
+Documents are read page by page with a (sliced) scroll limited to the exported features,
+converted to rows with precompiled field accessors and written to the response by a format
+specific writer, so that memory use does not depend on the number of exported documents.
+Scroll contexts are cleared when the export ends, fails or the client disconnects.
+"""
+import copy
+import csv
+import json
+from io import StringIO
+
+from searcher.view_functions.general.searcher_utils import improve_facts_readability
+from texta.settings import FACT_FIELD, SEARCHER_EXPORT
+from utils.sliced_scroll import SlicedScrollReader
+
+class FieldAccessor:
+    """ Reads a dot separated feature, like mlp.lemmas, from a document's _source
+    """
+
+    def __init__(self, feature_name):
+        self.feature_name = feature_name
+        self.keys = tuple(feature_name.split('.'))
+
+    def __call__(self, source):
+        value = source
+        for key in self.keys:
+            if isinstance(value, dict) and key in value:
+                value = value[key]
+            else:
+                return ""
+        return value
+
+
+def format_csv_cell(feature_name, value):
+    if feature_name == FACT_FIELD:
+        content = improve_facts_readability(value, join_with=' - ', indent_with='')
+        # Append JSON format
+        return '{}     {}'.format(content, value)
+    # stringify just in case value is something like a bool, escape newlines that break the csv
+    return str(value).replace('\n', ' \\n')
+
+
+class CSVExportWriter:
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    def __init__(self, features):
+        self.features = features
+        self.formatters = [(i, feature_name) for i, feature_name in enumerate(features)]
+        self.buffer = StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self):
+        self.writer.writerow(self.features)
+        return self._get_buffer_data()
+
+    def write(self, rows):
+        for row in rows:
+            self.writer.writerow([format_csv_cell(feature_name, row[i]) for i, feature_name in self.formatters])
+        return self._get_buffer_data()
+
+    def close(self):
+        return ''
+
+    def _get_buffer_data(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class JSONLinesExportWriter:
+    content_type = 'application/x-ndjson'
+    extension = 'jsonl'
+
+    def __init__(self, features):
+        self.features = features
+
+    def header(self):
+        return ''
+
+    def write(self, rows):
+        return ''.join(json.dumps(dict(zip(self.features, row)), ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self):
+        return ''
+
+
+class _ParquetSink:
+    """ Write-only file object whose written bytes can be taken out while the file position keeps growing,
+    as Parquet footers refer to the absolute offsets of the row groups.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ParquetExportWriter:
+    """ Writes every feature as a string column, structured values are stored as JSON
+    """
+    content_type = 'application/octet-stream'
+    extension = 'parquet'
+
+    def __init__(self, features, row_group_size=None):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.features = features
+        self.row_group_size = row_group_size if row_group_size else SEARCHER_EXPORT['parquet_row_group_size']
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(feature_name, pyarrow.string()) for feature_name in features])
+        self.sink = _ParquetSink()
+        self.writer = pyarrow.parquet.ParquetWriter(self.sink, self.schema)
+        self.columns = [[] for _ in features]
+
+    def header(self):
+        return b''
+
+    def write(self, rows):
+        for row in rows:
+            for column, value in zip(self.columns, row):
+                column.append(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+        if len(self.columns[0]) >= self.row_group_size:
+            self._write_row_group()
+        return self.sink.drain()
+
+    def close(self):
+        if self.columns[0]:
+            self._write_row_group()
+        self.writer.close()
+        return self.sink.drain()
+
+    def _write_row_group(self):
+        arrays = [self.pyarrow.array(column, type=self.pyarrow.string()) for column in self.columns]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.features]
+
+
+EXPORT_WRITERS = {
+    'csv': CSVExportWriter,
+    'jsonl': JSONLinesExportWriter,
+    'parquet': ParquetExportWriter
+}
+
+
+class DocumentExporter:
+    """ Streams the documents matching a search in the given format
+
+    :param es_m: ES_Manager with the search's query built.
+    :param features: exported features, dot separated paths of the documents' _source.
+    :param export_format: key of EXPORT_WRITERS.
+    :param start: number of matching documents skipped.
+    :param limit: maximum number of exported documents, None to export all.
+    """
+
+    def __init__(self, es_m, features, export_format='csv', start=0, limit=None):
+        if export_format not in EXPORT_WRITERS:
+            raise ValueError('Unknown export format: {}'.format(export_format))
+
+        self.es_m = es_m
+        self.features = features
+        self.start = start
+        self.limit = limit
+        self.accessors = [FieldAccessor(feature_name) for feature_name in features]
+        self.writer = EXPORT_WRITERS[export_format](features)
+
+    def stream(self):
+        yield self.writer.header()
+
+        left = self.limit
+        pages = iter(self._get_reader())
+        try:
+            for hits in pages:
+                if left is not None:
+                    hits = hits[:left]
+                    left -= len(hits)
+
+                rows = [[accessor(hit.get('_source', {})) for accessor in self.accessors] for hit in hits]
+                data = self.writer.write(rows)
+                if data:
+                    yield data
+
+                if left == 0:
+                    break
+        finally:
+            # Stops the slices and clears their scroll contexts
+            pages.close()
+
+        yield self.writer.close()
+
+    def _get_reader(self):
+        query = copy.deepcopy(self.es_m.get_combined_query()['main'])
+        query['_source'] = self.features
+        query.pop('size', None)
+
+        scroll_size = SEARCHER_EXPORT['scroll_size']
+        n_slices = SEARCHER_EXPORT['slices']
+        if self.start:
+            query['from'] = self.start
+        if self.limit is not None:
+            scroll_size = min(scroll_size, max(self.limit, 1))
+        # Slices can not be combined with an offset, a limited export or an ordering of the hits
+        if self.start or self.limit is not None or 'sort' in query:
+            n_slices = 1
+
+        return SlicedScrollReader(self.es_m.stringify_datasets(), query, n_slices=n_slices, scroll_size=scroll_size, time_out=SEARCHER_EXPORT['scroll_time_out'])
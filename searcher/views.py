@@ -483,6 +483,7 @@ def delete_document(request):
     active_indices = es_m.stringify_datasets()
     doc_ids = request.POST.getlist('document_id[]')
 
+    es_m.ensure_writable()
     url = 'http://localhost:9200/' + active_indices + '/_delete_by_query?refresh=true'
     response = es_m.plain_post(url, data=json.dumps(
         {
@@ -493,6 +494,7 @@ def delete_document(request):
             }
         }
     ))
+    es_m.invalidate_aggregation_cache()
     return HttpResponse(json.dumps(response))
 
 
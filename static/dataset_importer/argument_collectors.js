@@ -53,6 +53,13 @@ function collectXmlArguments(formData) {
 }
 
 function collectElasticArguments(formData) {
+    var sourceFields = $('#elastic-source-fields').val().split('\n').filter(function (field) { return field.trim() !== ''; });
+
+    formData.append('elastic_source_index', $('#elastic-source-index').val());
+    formData.append('elastic_source_url', $('#elastic-source-url').val());
+    formData.append('elastic_source_query', $('#elastic-source-query').val());
+    formData.append('elastic_source_fields', JSON.stringify(sourceFields));
+
     return formData;
 }
 
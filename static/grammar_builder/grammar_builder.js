@@ -462,8 +462,21 @@ function export_data() {
     if (grammarValidity.valid) {
         inclusiveTestGrammarJson = JSON.stringify(jstreeToNestedGrammar(node_json));
         var searchId = $("#search-selection").val();
-        query = PREFIX + '/export?' + 'search_id=' + searchId + '&inclusive_grammar=' + inclusiveTestGrammarJson
-        window.open(query)
+        $.ajax({
+            url: PREFIX + '/export',
+            data: {search_id: searchId, inclusive_grammar: inclusiveTestGrammarJson},
+            type: 'GET',
+            success: function () {
+                swal({
+                    title: 'Started Grammar Export task!',
+                    text: 'Check Management Tasks under Task Manager, to see the progress and download the exported file.',
+                    type: 'success'
+                })
+            },
+            error: function () {
+                swal('Error!', 'There was a problem starting the Grammar Export task!', 'error')
+            }
+        })
     } else {
         swal('Failed to export with the specified grammar!',"Reason: " + grammarValidity.reason + "\n\nSolution: " + grammarValidity.solution, "error");
     }
@@ -16,6 +16,9 @@ function toggleFullscreen () {
         recalcDatatablesHeight()
     }
 }
+$(document).on('change', 'input[name=export-format]', function () {
+    $('#export-file-extension').text('.' + $(this).val())
+})
 function exportData (exportType) {
     var queryArgs = $('#filters').serializeArray()
 
@@ -30,9 +33,14 @@ function exportData (exportType) {
             value: $('#export-file-name-agg').val() + '.csv'
         })
     } else {
+        var exportFormat = $('input[name=export-format]:checked').val()
+        queryArgs.push({
+            name: 'export_format',
+            value: exportFormat
+        })
         queryArgs.push({
             name: 'filename',
-            value: $('#export-file-name-example').val() + '.csv'
+            value: $('#export-file-name-example').val() + '.' + exportFormat
         })
         var extentDec = $('input[name=export-extent]:checked').val()
         /* global examplesTable */
@@ -37,6 +37,8 @@ function start_task_preprocessor(task_id ,formElement,preprocessorKey){
     $('<input>').attr('type', 'hidden').attr('name', 'preprocessor_key').val(preprocessorKey).appendTo(formElement)
     $('<input>').attr('type', 'hidden').attr('name', 'description').val($('#apply-preprocessor-description-param').val()).appendTo(formElement)
     $('<input>').attr('type', 'hidden').attr('name', 'search').val($('#apply-preprocessor-search-param').val()).appendTo(formElement)
+    $('<input>').attr('type', 'hidden').attr('name', 'scroll_size').val($('#apply-preprocessor-scroll-size-param').val()).appendTo(formElement)
+    $('<input>').attr('type', 'hidden').attr('name', 'scroll_time_out').val($('#apply-preprocessor-scroll-time-out-param').val()).appendTo(formElement)
 
     var request = new XMLHttpRequest()
     request.onreadystatechange = function () {
@@ -588,7 +588,7 @@ def api_tag_text(request, user, params):
 
             if 'error' not in explain:
                 try:
-                    df_text = pd.DataFrame(text_dict_df)
+                    df_text = pd.DataFrame(tagger.transform_text_map(text_dict_df))
                     # tag
                     p = int(tagger.model.predict(df_text)[0])
                     # get confidence
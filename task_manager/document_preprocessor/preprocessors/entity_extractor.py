@@ -12,6 +12,8 @@ class EntityExtractorPreprocessor(object):
 
     def __init__(self, feature_map={}):
         self._feature_map = feature_map
+        # Extractor workers are kept across batches, their models are shared through the model registry.
+        self._extractors = {}
 
     def transform(self, documents, **kwargs):
         try:
@@ -25,8 +27,9 @@ class EntityExtractorPreprocessor(object):
 
             # Load tagger models
             for _id in model_ids_to_apply:
-                ent_ext = EntityExtractorWorker()
-                models_to_apply.append(ent_ext)
+                if _id not in self._extractors:
+                    self._extractors[_id] = EntityExtractorWorker()
+                models_to_apply.append(self._extractors[_id])
 
             # Starts text map
             text_map = {}
@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 from lexicon_miner.models import Lexicon, Word
 from texta.settings import ERROR_LOGGER, INFO_LOGGER
+from django.db.models import Count, Max
+from collections import OrderedDict
+from .lexicon_matcher import LexiconMatcher
 import numpy as np
+import bisect
 import logging
 import json
 import re
 import os
 
+# Number of compiled classifier sets kept by a LexTagger
+CLASSIFIER_CACHE_SIZE = 16
+
 class LexClassifier:
     def __init__(self,lexicon,operation='or',match_type='prefix',required_words=1,phrase_slop=0,counter_slop=0,counter_lexicon=[]):
         """
@@ -34,6 +41,11 @@ class LexClassifier:
         self._patterns = self._generate_patterns(self._lexicon, operation,match_type)
         self._counter_patterns = self._generate_patterns(self._counter_lexicon, operation='or',match_type='exact')
         self._counter_slop = counter_slop
+        # Entries are matched with a trie, the patterns are used where the trie can not reproduce them
+        self._matcher = self._build_matcher(self._lexicon, operation, match_type)
+        self._counter_matcher = self._build_matcher(self._counter_lexicon, operation='or', match_type='exact')
+        self._compiled_patterns = None
+        self._compiled_counter_patterns = None
 
     def _parse_lex(self,lexicon):
         if isinstance(lexicon,list):
@@ -81,18 +93,18 @@ class LexClassifier:
                 lex_with_slops.append(pattern)
         return lex_with_slops
 
-    def _dispend_counter_matches(self,counter_matches,unpacked_match,doc):
+    def _dispend_counter_matches(self,counter_ends,unpacked_match,doc):
         match = unpacked_match[0]
         match_start = match['spans'][0]
 
-        for counter_match in counter_matches:
-            counter_match_end = counter_match['spans'][1]
-
-            if counter_match_end < match_start:
-                section = doc[counter_match_end+1:match_start]
-                words = section.split()
-                if len(words) <= self._counter_slop:
-                    return []
+        # The words between a counter match and the match can only decrease with a later counter match,
+        # so only the last counter match ending before the match needs to be checked
+        i = bisect.bisect_left(counter_ends, match_start)
+        if i > 0:
+            section = doc[counter_ends[i-1]+1:match_start]
+            words = section.split()
+            if len(words) <= self._counter_slop:
+                return []
         return unpacked_match
 
 
@@ -104,7 +116,8 @@ class LexClassifier:
             lex_with_slops = self._add_slops(lexicon)
 
             if operation == 'or':
-                pattern = '|'.join(lex_with_slops)
+                # Grouped, so that the prefix and suffix apply to every entry
+                pattern = '(?:' + '|'.join(lex_with_slops) + ')'
                 full_pattern = prefix + pattern + suffix
                 patterns.append(full_pattern)
             else:
@@ -113,10 +126,23 @@ class LexClassifier:
                     patterns.append(full_pattern)
             return patterns
 
+    def _build_matcher(self,lexicon,operation,match_type):
+        lex_with_slops = self._add_slops(lexicon)
+        return LexiconMatcher(lex_with_slops, match_type, operation, self._get_prefix(match_type), self._get_suffix(match_type))
+
+    def _find_spans(self,matcher,patterns,compiled_attr,doc):
+        """Returns the raw spans of every pattern in the doc"""
+        spans = matcher.find(doc)
+        if spans is None:
+            if getattr(self, compiled_attr) is None:
+                setattr(self, compiled_attr, [re.compile(pattern,flags=re.IGNORECASE) for pattern in patterns])
+            spans = [[match.span() for match in pattern.finditer(doc)] for pattern in getattr(self, compiled_attr)]
+        return spans
+
     def _unpack_match(self,match):
-        raw_start = match.start()
-        raw_end = match.end()
-        raw_str_val = match.group()
+        return self._unpack_span(match.start(),match.end(),match.group())
+
+    def _unpack_span(self,raw_start,raw_end,raw_str_val):
 
         if re.search('^\s',raw_str_val):
             raw_start+=1
@@ -129,10 +155,9 @@ class LexClassifier:
 
     def _get_counter_matches(self,doc):
         counter_matches = []
-        for pattern in self._counter_patterns:
-            matches = re.finditer(pattern,doc,flags=re.IGNORECASE)
-            for match in matches:
-                unpacked_match = self._unpack_match(match)
+        for spans in self._find_spans(self._counter_matcher,self._counter_patterns,'_compiled_counter_patterns',doc):
+            for start, end in spans:
+                unpacked_match = self._unpack_span(start,end,doc[start:end])
                 counter_matches.extend(unpacked_match)
         return counter_matches
 
@@ -141,16 +166,16 @@ class LexClassifier:
         found_matches = 0
         nr_patterns = len(self._patterns)
 
-        counter_matches = self._get_counter_matches(doc)
+        if self._counter_lexicon:
+            counter_ends = sorted(counter_match['spans'][1] for counter_match in self._get_counter_matches(doc))
 
-        for pattern in self._patterns:
-            matches = re.finditer(pattern,doc,flags=re.IGNORECASE)
-            for i,m in enumerate(matches):
+        for spans in self._find_spans(self._matcher,self._patterns,'_compiled_patterns',doc):
+            for i,(start,end) in enumerate(spans):
 
-                unpacked_match = self._unpack_match(m)
+                unpacked_match = self._unpack_span(start,end,doc[start:end])
 
                 if self._counter_lexicon:
-                    unpacked_match = self._dispend_counter_matches(counter_matches,unpacked_match,doc)
+                    unpacked_match = self._dispend_counter_matches(counter_ends,unpacked_match,doc)
 
                 if i<1 and unpacked_match:
                     found_matches+=1
@@ -170,6 +195,8 @@ class LexTagger(object):
 
     def __init__(self, feature_map={}):
         self._feature_map = feature_map
+        # Compiled classifiers are reused by the batches of a task, keyed by the arguments and lexicon contents
+        self._classifier_cache = OrderedDict()
 
 
     def _convert_to_ratio(self,percentage_str):
@@ -259,6 +286,37 @@ class LexTagger(object):
             classifiers[lex_name] = classifier
         return classifiers
 
+    def _get_lexicon_signature(self, lex_ids):
+        # Saving a lexicon recreates its words, which changes the number or the largest id of the words
+        rows = Word.objects.filter(lexicon__in=lex_ids).values('lexicon','lexicon__name').annotate(count=Count('pk'),last_pk=Max('pk'))
+        return tuple(sorted((row['lexicon'],row['lexicon__name'],row['count'],row['last_pk']) for row in rows))
+
+    def _get_cached_classifiers(self, args):
+        lex_ids = args['lex_ids']
+        counter_lex_ids = args['counter_lex_id']
+        cache_key = (tuple(lex_ids), tuple(counter_lex_ids), args['match_type'], args['operation'], args['slop'],\
+                     args['words_required'], args['cl_slop'], args['add_counter_lex'],\
+                     self._get_lexicon_signature(lex_ids + counter_lex_ids))
+
+        if cache_key in self._classifier_cache:
+            self._classifier_cache.move_to_end(cache_key)
+            return self._classifier_cache[cache_key]
+
+        lexicons_to_apply = self._unpack_lexicons(lex_ids)
+
+        try:
+            counter_lexicon = list(self._unpack_lexicons(counter_lex_ids).items())[0][1]
+        except Exception as e:
+            counter_lexicon = []
+            logging.getLogger(ERROR_LOGGER).error('Loading Counter Lexicon failed.', exc_info=True)
+
+        classifiers = self._get_classifiers(lexicons_to_apply,counter_lexicon,args)
+
+        self._classifier_cache[cache_key] = classifiers
+        if len(self._classifier_cache) > CLASSIFIER_CACHE_SIZE:
+            self._classifier_cache.popitem(last=False)
+        return classifiers
+
     def _decode_text(self,text):
         try:
             decoded_text = text.decode()
@@ -283,19 +341,9 @@ class LexTagger(object):
 
         args = self._load_arguments(kwargs)
     
-        lex_ids = args['lex_ids']
-        counter_lex_ids = args['counter_lex_id']
         input_features = args['input_features']
 
-        lexicons_to_apply = self._unpack_lexicons(lex_ids)
-
-        try:
-            counter_lexicon = list(self._unpack_lexicons(counter_lex_ids).items())[0][1]
-        except Exception as e:
-            counter_lexicon = []
-            logging.getLogger(ERROR_LOGGER).error('Loading Counter Lexicon failed.', exc_info=True)
-
-        classifiers = self._get_classifiers(lexicons_to_apply,counter_lexicon,args)
+        classifiers = self._get_cached_classifiers(args)
 
         for input_feature in input_features:
             texts = self._get_texts(documents,input_feature)
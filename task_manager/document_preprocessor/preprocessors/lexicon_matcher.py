@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+""" Trie based matching of lexicon entries with the semantics of LexClassifier's regular expressions
+
+LexClassifier used to match '(\\s|^)((?:entry_1|entry_2|...)\\w*)' style alternations, which the regex engine tries entry by
+entry at every position of a document. Entries without regex syntax are stored in a character trie instead, so that
+all of them are matched at a position with a single walk. The scan reproduces the regular expressions: candidate
+positions, the alternative chosen at a position (the first one in lexicon order), the lookahead of exact matches and
+the extension of prefix and fuzzy matches to the end of the word. Entries using regex syntax are still matched with
+their own regular expression for operation 'and'. For operation 'or' the order the regex engine tries them in can
+not be combined with the trie, so such lexicons are matched with the alternation.
+"""
+import re
+
+# Characters which make a lexicon entry a regular expression
+REGEX_CHARACTERS = set('.^$*+?{}[]\\|()')
+
+_SPACE = re.compile(r'\s')
+
+
+def is_regex_entry(entry):
+    return any(character in REGEX_CHARACTERS for character in entry)
+
+
+def _is_word(character):
+    # Same as \w of str patterns
+    return character.isalnum() or character == '_'
+
+
+class EntryTrie:
+    """ Character trie of lowercased entries, every node lists the indices of the entries ending in it
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, entry, index):
+        node = self.root
+        for character in entry.lower():
+            node = node.setdefault(character, {})
+        node.setdefault(None, []).append(index)
+
+    def walk(self, text, start):
+        """ Yields (entry indices, end) of the entries occurring in the text at start, shortest first
+        """
+        node = self.root
+        if None in node:
+            yield node[None], start
+        for position in range(start, len(text)):
+            node = node.get(text[position])
+            if node is None:
+                return
+            if None in node:
+                yield node[None], position + 1
+
+
+class LexiconMatcher:
+    """ Finds the raw spans the LexClassifier patterns of the entries would match
+
+    :param entries: lexicon entries, with phrase slops already applied.
+    :param match_type: 'prefix', 'exact' or 'fuzzy'.
+    :param operation: 'or' to match all the entries as one pattern, 'and' to match every entry as a separate pattern.
+    :param prefix: pattern prefix of the match type, used for regex entries.
+    :param suffix: pattern suffix of the match type, used for regex entries.
+    """
+
+    def __init__(self, entries, match_type, operation, prefix, suffix):
+        self.match_type = match_type
+        self.operation = operation
+        self.n_entries = len(entries)
+        self.trie = EntryTrie()
+        self.regex_entries = []
+
+        for index, entry in enumerate(entries):
+            if is_regex_entry(entry):
+                self.regex_entries.append(index)
+            else:
+                self.trie.add(entry, index)
+
+        if operation == 'or':
+            self.regex_patterns = []
+        else:
+            self.regex_patterns = [re.compile(prefix + entries[index] + suffix, flags=re.IGNORECASE) for index in self.regex_entries]
+
+    def find(self, text):
+        """ Returns a list of raw (start, end) spans for every pattern, a single pattern for operation 'or',
+        or None if the text has to be matched with the patterns of LexClassifier
+        """
+        if self.operation == 'or' and self.regex_entries:
+            return None
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Positions of lowercased characters would not match the text's
+            return None
+
+        if self.match_type == 'fuzzy':
+            entry_spans = self._find_fuzzy(text, lowered)
+        else:
+            entry_spans = self._find_bounded(text, lowered, exact=self.match_type == 'exact')
+
+        if self.operation == 'or':
+            return [[(start, end) for start, end, index in entry_spans]]
+
+        spans_by_entry = [[] for _ in range(self.n_entries)]
+        for start, end, index in entry_spans:
+            spans_by_entry[index].append((start, end))
+        for index, pattern in zip(self.regex_entries, self.regex_patterns):
+            spans_by_entry[index] = [match.span() for match in pattern.finditer(text)]
+        return spans_by_entry
+
+    def _extend_word(self, text, end):
+        while end < len(text) and _is_word(text[end]):
+            end += 1
+        return end
+
+    @staticmethod
+    def _exact_end(text, end):
+        """ Lookahead (?=((\\W*)\\s|$)) of exact matches
+        """
+        if end == len(text):
+            return True
+        while end < len(text) and not _is_word(text[end]):
+            if text[end].isspace():
+                return True
+            end += 1
+        return False
+
+    def _entries_at(self, text, lowered, start, exact):
+        """ Returns the (index, end) of the entries which match at start, in lexicon order
+        """
+        found = []
+        for indices, end in self.trie.walk(lowered, start):
+            if exact and not self._exact_end(text, end):
+                continue
+            found.extend((index, end) for index in indices)
+        found.sort()
+        return found
+
+    def _find_bounded(self, text, lowered, exact):
+        """ Matches of (\\s|^)(entries) followed by \\w* for prefix and by the exact lookahead for exact matches
+
+        :return: list of (raw start, raw end, entry index). For operation 'or' the spans do not overlap, for 'and'
+        the spans of every entry do not overlap.
+        """
+        spans = []
+        last_ends = {}
+
+        def candidates():
+            # (raw start, entry start) in the order the regex tries them
+            for space in _SPACE.finditer(text):
+                yield space.start(), space.start() + 1
+                if space.start() == 0:
+                    yield 0, 0
+            if not text or not text[0].isspace():
+                yield 0, 0
+
+        for raw_start, start in sorted(candidates(), key=lambda candidate: candidate[0]):
+            found = self._entries_at(text, lowered, start, exact)
+            for index, end in found:
+                if raw_start < last_ends.get(None if self.operation == 'or' else index, 0):
+                    continue
+                if not exact:
+                    end = self._extend_word(text, end)
+                if end == raw_start:
+                    continue
+                spans.append((raw_start, end, index))
+                last_ends[None if self.operation == 'or' else index] = end
+                if self.operation == 'or':
+                    # The first alternative in lexicon order is matched
+                    break
+
+        return spans
+
+    def _find_fuzzy(self, text, lowered):
+        """ Matches of \\w*(entries)\\w*: the regex engine extends the leading \\w* as far as possible, so the
+        rightmost entry occurrence within the word run is matched, and the match spans from the scan position.
+        """
+        spans = []
+        last_ends = {}
+        position = 0
+        n = len(text)
+
+        while position <= n:
+            run_end = self._extend_word(text, position)
+            occurrences = {}
+            for start in range(run_end, position - 1, -1):
+                for index, end in self._entries_at(text, lowered, start, exact=False):
+                    if index not in occurrences:
+                        occurrences[index] = (start, end)
+                if occurrences and self.operation == 'or':
+                    break
+
+            if self.operation == 'or':
+                if occurrences:
+                    index = min(occurrences)
+                    start, end = occurrences[index]
+                    end = self._extend_word(text, end)
+                    spans.append((position, end, index))
+                    position = end if end > position else position + 1
+                else:
+                    position = run_end + 1
+                continue
+
+            for index, (start, end) in occurrences.items():
+                raw_start = max(position, last_ends.get(index, 0))
+                if start < raw_start:
+                    continue
+                end = self._extend_word(text, end)
+                if end > raw_start:
+                    spans.append((raw_start, end, index))
+                    last_ends[index] = end
+            position = run_end + 1
+
+        if self.operation != 'or':
+            spans.sort(key=lambda span: (span[2], span[0]))
+        return spans
@@ -1,4 +1,5 @@
 from task_manager.tasks.workers.text_tagger_worker import TagModelWorker
+from task_manager.tools import MultiTagger
 
 import numpy as np
 import json
@@ -10,6 +11,8 @@ class TextTaggerPreprocessor(object):
 
     def __init__(self, feature_map={}):
         self._feature_map = feature_map
+        # Tagger workers are kept across batches, their models are shared through the model registry.
+        self._taggers = {}
 
     def transform(self, documents, **kwargs):
         input_features = json.loads(kwargs['text_tagger_feature_names'])
@@ -22,7 +25,9 @@ class TextTaggerPreprocessor(object):
 
         # Load tagger models
         for _id in tagger_ids_to_apply:
-            tm = TagModelWorker()
+            if _id not in self._taggers:
+                self._taggers[_id] = TagModelWorker()
+            tm = self._taggers[_id]
             tm.load(_id)
             taggers_to_apply.append(tm)
 
@@ -53,13 +58,19 @@ class TextTaggerPreprocessor(object):
                     text_map[field].append(decoded_text.strip())
 
         # Apply tags to every input feature
-        results = []
-        tagger_descriptions = []
-
-        for tagger in taggers_to_apply:
-            tagger_descriptions.append(tagger.description)
-            result_vector = tagger.tag(text_map)
-            results.append(result_vector)
+        tagger_descriptions = [tagger.description for tagger in taggers_to_apply]
+        # Taggers trained on texts transformed with a language model get the texts transformed the same way
+        tagger_groups = {}
+        for tagger_idx, tagger in enumerate(taggers_to_apply):
+            tagger_groups.setdefault(tagger.get_text_transform_key(), []).append(tagger_idx)
+
+        results = [None] * len(taggers_to_apply)
+        for tagger_idxs in tagger_groups.values():
+            group_text_map = taggers_to_apply[tagger_idxs[0]].transform_text_map(text_map)
+            # Shared features are extracted once and linear taggers are scored together
+            group_results = MultiTagger([taggers_to_apply[tagger_idx].model for tagger_idx in tagger_idxs]).predict(group_text_map)
+            for tagger_idx, tagger_results in zip(tagger_idxs, group_results):
+                results[tagger_idx] = tagger_results
         results_transposed = np.array(results).transpose()
 
         for i, tagger_ids in enumerate(results_transposed):
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.7 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task_manager', '0004_merge_20190424_1230'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, default=None, null=True),
+        ),
+    ]
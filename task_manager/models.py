@@ -51,8 +51,17 @@ class Task(models.Model):
     time_started = models.DateTimeField()
     last_update = models.DateTimeField(null=True, blank=True, default=None)
     time_completed = models.DateTimeField(null=True, blank=True, default=None)
+    # Last time the scheduler running the task reported itself alive
+    heartbeat = models.DateTimeField(null=True, blank=True, default=None)
     resources = PickledObjectField(null=True, default=None)
 
+    def save(self, *args, **kwargs):
+        # The heartbeat is written only by the schedulers' queryset updates, as saving a task loaded earlier,
+        # for example by its worker, would overwrite a newer heartbeat and get the running task failed as lost.
+        if self.pk is not None and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'heartbeat']
+        super(Task, self).save(*args, **kwargs)
+
     @staticmethod
     def get_by_id(task_id):
         return Task.objects.get(pk=task_id)
@@ -80,7 +89,22 @@ class Task(models.Model):
         self.progress = progress
         self.progress_message = progress_message
         self.last_update = datetime.now()
-        self.save()
+        self.save(update_fields=['progress', 'progress_message', 'last_update'])
+
+    @staticmethod
+    def update_running_progress(task_id, progress, progress_message):
+        """ Marks the task as running and updates its progress, unless the task has been canceled.
+        Only the progress columns are written and the row is not loaded.
+
+        :return: False if the task has been canceled or deleted.
+        """
+        updated = Task.objects.filter(pk=task_id).exclude(status=Task.STATUS_CANCELED).update(
+            status=Task.STATUS_RUNNING,
+            progress=progress,
+            progress_message=progress_message,
+            last_update=datetime.now()
+        )
+        return updated > 0
 
     def to_json(self):
         data = {
@@ -0,0 +1,254 @@
+""" Task Scheduler
+
+Claims queued tasks from the Task table and runs their workers in child processes.
+
+Queued tasks are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several schedulers, also on
+different nodes, can share the Task table without starting a task twice. Free process slots are
+filled as soon as they appear, tasks of higher priority types are started first and the number of
+running tasks per type can be limited. Running tasks are kept alive with heartbeats, and tasks
+of a scheduler which has stopped sending them are failed by the other schedulers.
+"""
+import logging
+import multiprocessing
+import signal
+import time
+from datetime import datetime, timedelta
+
+from django.db import connections, transaction
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from task_manager.models import Task
+from task_manager.tasks.task_params import activate_task_worker
+from texta.settings import ERROR_LOGGER, INFO_LOGGER, TASK_SCHEDULER
+
+# Statuses of tasks which have been claimed by a scheduler and not finished yet
+ACTIVE_STATUSES = (Task.STATUS_RUNNING, Task.STATUS_UPDATING)
+
+
+def _run_task(task_id, task_type):
+    """ Entry point of the task processes
+    """
+    # The scheduler's signal handlers are inherited when forking
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    worker = activate_task_worker(task_type)
+    if worker is None:
+        # Invalid task
+        Task.objects.filter(pk=task_id).update(status=Task.STATUS_FAILED, last_update=datetime.now())
+        log_dict = {'task': 'Task Scheduler', 'event': 'invalid_task', 'task_type': task_type, 'task_id': task_id}
+        logging.getLogger(ERROR_LOGGER).error("Invalid task", extra=log_dict)
+        return
+
+    try:
+        # Run worker
+        worker.run(task_id)
+    except Exception as e:
+        # Capture generic task error
+        Task.objects.filter(pk=task_id).update(status=Task.STATUS_FAILED, last_update=datetime.now())
+        log_dict = {'task': 'Task Scheduler', 'event': 'task_execution_error', 'task_type': task_type, 'task_id': task_id}
+        logging.getLogger(INFO_LOGGER).info("Task execution error", extra=log_dict)
+        logging.getLogger(ERROR_LOGGER).exception(e)
+
+
+class RunningTask:
+
+    def __init__(self, task_id, task_type, process):
+        self.task_id = task_id
+        self.task_type = task_type
+        self.process = process
+        self.canceled_at = None
+
+
+class TaskScheduler:
+    """ Runs queued tasks in a managed pool of worker processes
+
+    A first SIGINT/SIGTERM stops claiming new tasks and waits for the running ones to finish,
+    a second one terminates the running tasks and puts them back to the queue.
+    """
+
+    def __init__(self, max_running=None, task_type_limits=None, task_type_priorities=None):
+        self.max_running = max_running if max_running else TASK_SCHEDULER['max_running']
+        self.task_type_limits = task_type_limits if task_type_limits is not None else TASK_SCHEDULER['task_type_limits']
+        self.task_type_priorities = task_type_priorities if task_type_priorities is not None else TASK_SCHEDULER['task_type_priorities']
+        self.poll_interval = TASK_SCHEDULER['poll_interval']
+        self.heartbeat_interval = TASK_SCHEDULER['heartbeat_interval']
+        self.heartbeat_timeout = TASK_SCHEDULER['heartbeat_timeout']
+        self.cancel_grace_seconds = TASK_SCHEDULER['cancel_grace_seconds']
+        self.max_last_update_minutes = TASK_SCHEDULER['max_last_update_minutes']
+
+        self.running = {}
+        self.daemon = True
+        self._stopping = False
+        self._terminating = False
+        self._last_heartbeat = 0
+        self.info_logger = logging.getLogger(INFO_LOGGER)
+        self.error_logger = logging.getLogger(ERROR_LOGGER)
+
+    def run(self, daemon=True):
+        """ Schedules tasks until stopped
+
+        :param daemon: keep claiming tasks until a stop signal, otherwise claim the currently queued tasks once and wait for them to finish.
+        """
+        self.daemon = daemon
+        self._install_signal_handlers()
+        self._claim_tasks()
+
+        while True:
+            if self._terminating:
+                self._terminate_running_tasks()
+
+            self._check_running_tasks()
+            self._send_heartbeat()
+            self._time_out_tasks()
+
+            if daemon and not self._stopping:
+                self._claim_tasks()
+            elif not self.running:
+                break
+
+            time.sleep(self.poll_interval)
+
+        log_dict = {'task': 'Task Scheduler', 'event': 'scheduler_stopped'}
+        self.info_logger.info("Task scheduler stopped", extra=log_dict)
+
+    def stop(self, *args):
+        if self._stopping:
+            self._terminating = True
+        self._stopping = True
+
+    def _install_signal_handlers(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+    def _get_queued_tasks(self, excluded_types):
+        """ Queued tasks in the order of their type's priority and queueing time
+        """
+        priorities = [When(task_type=task_type, then=Value(priority)) for task_type, priority in self.task_type_priorities.items()]
+        queued_tasks = Task.objects.filter(status=Task.STATUS_QUEUED).exclude(task_type__in=excluded_types)
+        if priorities:
+            queued_tasks = queued_tasks.annotate(priority=Case(*priorities, default=Value(0), output_field=IntegerField()))
+            return queued_tasks.order_by('-priority', 'last_update', 'id')
+        return queued_tasks.order_by('last_update', 'id')
+
+    def _claim_tasks(self):
+        """ Starts queued tasks until all the process slots are taken
+
+        A daemon scheduler has max_running process slots of its own. Schedulers run once, for example by cron,
+        may overlap, so their slots are max_running minus the tasks running under all the schedulers.
+        Task type limits are checked against the tasks claimed by all the schedulers. Tasks claimed
+        concurrently by another scheduler are not visible yet, so concurrent claims may exceed a limit briefly.
+        """
+        while True:
+            claimed = []
+
+            with transaction.atomic():
+                running_counts = dict(Task.objects.filter(status__in=ACTIVE_STATUSES).values_list('task_type').annotate(Count('id')).order_by())
+                if self.daemon:
+                    free_slots = self.max_running - len(self.running)
+                else:
+                    free_slots = self.max_running - sum(running_counts.values())
+                if free_slots <= 0:
+                    return
+
+                free_by_type = {task_type: limit - running_counts.get(task_type, 0) for task_type, limit in self.task_type_limits.items()}
+                excluded_types = [task_type for task_type, free in free_by_type.items() if free <= 0]
+
+                queued_tasks = self._get_queued_tasks(excluded_types).select_for_update(skip_locked=True)
+                for task in queued_tasks[:free_slots]:
+                    if task.task_type in free_by_type:
+                        if free_by_type[task.task_type] <= 0:
+                            continue
+                        free_by_type[task.task_type] -= 1
+                    claimed.append(task)
+
+                now = datetime.now()
+                Task.objects.filter(pk__in=[task.pk for task in claimed]).update(status=Task.STATUS_RUNNING, last_update=now, heartbeat=now)
+
+            if not claimed:
+                return
+
+            for task in claimed:
+                self._start_task(task)
+
+    def _start_task(self, task):
+        # Forked processes must not share the database connections of the scheduler
+        connections.close_all()
+        process = multiprocessing.Process(target=_run_task, args=(task.id, task.task_type), name='task-{}'.format(task.id))
+        process.start()
+        self.running[task.id] = RunningTask(task.id, task.task_type, process)
+
+        log_dict = {'task': 'Task Scheduler', 'event': 'task_started', 'task_type': task.task_type, 'task_id': task.id, 'pid': process.pid}
+        self.info_logger.info("Task started", extra=log_dict)
+
+    def _check_running_tasks(self):
+        """ Collects finished task processes and terminates canceled tasks after the grace period
+        """
+        statuses = dict(Task.objects.filter(pk__in=list(self.running)).values_list('id', 'status'))
+
+        for task_id, running_task in list(self.running.items()):
+            process = running_task.process
+            status = statuses.get(task_id)
+
+            if not process.is_alive():
+                process.join()
+                del self.running[task_id]
+                # The worker updates the status itself unless the process died
+                if status in ACTIVE_STATUSES:
+                    Task.objects.filter(pk=task_id).update(status=Task.STATUS_FAILED, last_update=datetime.now(), time_completed=datetime.now())
+                    log_dict = {'task': 'Task Scheduler', 'event': 'task_process_died', 'task_type': running_task.task_type, 'task_id': task_id, 'exitcode': process.exitcode}
+                    self.error_logger.error("Task process exited without finishing the task", extra=log_dict)
+                continue
+
+            if status == Task.STATUS_CANCELED:
+                if running_task.canceled_at is None:
+                    running_task.canceled_at = time.time()
+                elif time.time() - running_task.canceled_at > self.cancel_grace_seconds:
+                    process.terminate()
+                    Task.objects.filter(pk=task_id).update(last_update=datetime.now(), time_completed=datetime.now())
+                    log_dict = {'task': 'Task Scheduler', 'event': 'canceled_task_terminated', 'task_type': running_task.task_type, 'task_id': task_id}
+                    self.info_logger.info("Canceled task terminated", extra=log_dict)
+
+    def _send_heartbeat(self):
+        if self.running and time.time() - self._last_heartbeat >= self.heartbeat_interval:
+            Task.objects.filter(pk__in=list(self.running)).update(heartbeat=datetime.now())
+            self._last_heartbeat = time.time()
+
+    def _time_out_tasks(self):
+        """ Time out tasks
+
+        Uses the last update time as "watch dog" time and marks the task as failed with timeout if
+        max_last_update_minutes has passed. Tasks whose scheduler has stopped sending heartbeats are failed as lost.
+        """
+        now = datetime.now()
+        timed_out = Task.objects.filter(status__in=ACTIVE_STATUSES, last_update__lt=now - timedelta(minutes=self.max_last_update_minutes))
+        lost = Task.objects.filter(status__in=ACTIVE_STATUSES, heartbeat__lt=now - timedelta(seconds=self.heartbeat_timeout))
+
+        for tasks, message in ((timed_out, 'timeout'), (lost, 'scheduler lost')):
+            for task in tasks:
+                if task.id in self.running:
+                    if message != 'timeout':
+                        # Own tasks get their heartbeats
+                        continue
+                    self.running[task.id].process.terminate()
+
+                task.update_status(Task.STATUS_FAILED, set_time_completed=True)
+                task.update_progress(0, message)
+
+                log_dict = {'task': 'Task Scheduler', 'event': 'time_out_task', 'task_id': task.id, 'reason': message}
+                self.error_logger.error("Task timed out", extra=log_dict)
+
+    def _terminate_running_tasks(self):
+        """ Terminates the running tasks and puts them back to the queue
+        """
+        for task_id, running_task in list(self.running.items()):
+            running_task.process.terminate()
+            running_task.process.join()
+            del self.running[task_id]
+
+            task = Task.objects.filter(pk=task_id, status__in=ACTIVE_STATUSES).first()
+            if task:
+                task.requeue_task()
+
+            log_dict = {'task': 'Task Scheduler', 'event': 'task_requeued', 'task_type': running_task.task_type, 'task_id': task_id}
+            self.info_logger.info("Running task terminated and requeued", extra=log_dict)
@@ -5,6 +5,7 @@ import logging
 import numpy as np
 import pickle as pkl
 import psutil
+import threading
 from itertools import chain, product
 
 from task_manager.models import Task
@@ -24,12 +25,31 @@ from sklearn.preprocessing import LabelBinarizer, MultiLabelBinarizer
 from task_manager.tools import ShowSteps
 from task_manager.tools import TaskCanceledException
 from task_manager.tools import get_pipeline_builder
+from task_manager.tools import get_model_registry
 from .base_worker import BaseWorker
 
 from lexicon_miner.models import Lexicon
 from lexicon_miner.models import Word
 
 
+class SharedTagger(object):
+    """ pycrfsuite Tagger shared through the model registry by all the threads of a process
+
+    A Tagger keeps the set sequence between set and tag, so concurrent tag calls are serialized.
+    """
+
+    def __init__(self, file_path):
+        self._tagger = Tagger()
+        self._tagger.open(file_path)
+        self._lock = threading.Lock()
+
+    def tag(self, xseq):
+        # Features are computed outside the lock
+        xseq = list(xseq)
+        with self._lock:
+            return self._tagger.tag(xseq)
+
+
 class EntityExtractorWorker(BaseWorker):
 
     def __init__(self):
@@ -258,16 +278,23 @@ class EntityExtractorWorker(BaseWorker):
 
     def _load_keywords(self):
         file_path = os.path.join(MODELS_DIR, self.task_type, "{}_meta".format(self.model_name))
+        self.keywords = get_model_registry().get(file_path, self._unpickle)
+
+    @staticmethod
+    def _unpickle(file_path):
         with open(file_path, "rb") as f:
-            self.keywords = pkl.load(f)
+            return pkl.load(f)
+
+    @staticmethod
+    def _open_tagger(file_path):
+        return SharedTagger(file_path)
 
     def _load_tagger(self):
         # In pycrfsuite, you have to save the model first, then load it as a tagger
         self.model_name = 'model_{}'.format(self.task_obj.unique_id)
         file_path = os.path.join(MODELS_DIR, self.task_type, self.model_name)
         try:
-            tagger = Tagger()
-            tagger.open(file_path)
+            tagger = get_model_registry().get(file_path, self._open_tagger)
         except Exception as e:
             print(e)
             self.error_logger.error('Failed to load crf model from the filesystem.', exc_info=True, extra={
@@ -12,6 +12,8 @@ from task_manager.tools import TaskCanceledException
 from texta.settings import MODELS_DIR, ERROR_LOGGER, INFO_LOGGER
 from utils.word_cluster import WordCluster
 from utils.phraser import Phraser
+from utils.gensim_wrapper.similarity_backend import build_ann_index
+from utils.gensim_wrapper.mapped_word2vec import save_mapped
 import graypy
 
 from .base_worker import BaseWorker
@@ -150,6 +152,9 @@ class LanguageModelWorker(BaseWorker):
             self.model.save(output_model_file)
             self.phraser.save(output_phraser_file)
             self.word_cluster.save(output_cluster_file)
+            # Normalized vectors mapped by the web processes and the index for the lexicon miner's term suggestions
+            save_mapped(self.model, output_model_file)
+            build_ann_index(self.model, output_model_file)
 
             write_task_xml(self.task_obj, output_xml_file)
 
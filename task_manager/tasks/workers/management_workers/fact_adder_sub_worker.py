@@ -2,7 +2,8 @@ import logging
 import json
 import re
 from task_manager.tasks.workers.base_worker import BaseWorker
-from task_manager.tools import ShowProgress
+from task_manager.tasks.workers.management_workers.fact_mutator import FactMutator
+from task_manager.tools import TaskCanceledException
 from texta.settings import ERROR_LOGGER, FACT_PROPERTIES, FACT_FIELD, INFO_LOGGER
 
 
@@ -50,6 +51,8 @@ class FactAdderSubWorker(BaseWorker):
             self.parse_params()
             result = self.add_facts()
             return json.dumps(result)
+        except TaskCanceledException:
+            raise
         except:
             logging.getLogger(ERROR_LOGGER).error('A problem occurred when attempted to run fact_deleter_worker.', exc_info=True, extra={
                 'params': self.params,
@@ -103,7 +106,9 @@ class FactAdderSubWorker(BaseWorker):
             data += json.dumps({"update": {"_id": document['_id'], "_type": document['_type'], "_index": document['_index']}}) + '\n'
             document = {'doc': {FACT_FIELD: document['_source'][FACT_FIELD]}}
             data += json.dumps(document) + '\n'
+        self.es_m.ensure_writable()
         response = self.es_m.plain_post_bulk(self.es_m.es_url, data)
+        self.es_m.invalidate_aggregation_cache(refresh=True)
         return {'fact_count': 1, 'status': 'success'}
 
     def doc_matches_to_facts(self):
@@ -117,7 +122,9 @@ class FactAdderSubWorker(BaseWorker):
 
         fact_count = 0
         data, fact_count = self._derive_match_spans(hits, fact_count)
+        self.es_m.ensure_writable()
         response = self.es_m.plain_post_bulk(self.es_m.es_url, data)
+        self.es_m.invalidate_aggregation_cache(refresh=True)
         return {'fact_count': fact_count, 'status': 'success'}
 
     def matches_to_facts(self):
@@ -130,48 +137,30 @@ class FactAdderSubWorker(BaseWorker):
             # Match prefix, or separate word
             query = {"main": {"query": {"multi_match": {"query": self.fact_value, "fields": [self.fact_field], "type": self.match_type}}}}
 
-        # response = self.es_m.perform_query(query)
         self.es_m.load_combined_query(query)
-        response = self.es_m.scroll(size=self.scroll_size, time_out='3m', field_scroll=self.fact_field)
-        scroll_id = response['_scroll_id']
-        total_docs = response['hits']['total']
-        # For partial update
-        doc_ids = [x['_id'] for x in response['hits']['hits'] if '_id' in x]
-
-        show_progress = ShowProgress(self.task_id, multiplier=total_docs / self.scroll_size)
-        show_progress.set_total(total_docs)
-        show_progress.update_view(0)
-
-        # If texta_facts not in document
-        hits = response['hits']['hits']
-        docs_left = total_docs
-        fact_count = 0
-        if hits:
-            try:
-                self.es_m.update_mapping_structure(FACT_FIELD, FACT_PROPERTIES)
-                while len(response['hits']['hits']):
-                    data, fact_count = self._derive_match_spans(response['hits']['hits'], fact_count)
-                    self.es_m.plain_post_bulk(self.es_m.es_url, data)
-                    self.es_m.update_documents_by_id(doc_ids)
-                    response = self.es_m.scroll(scroll_id=scroll_id, time_out='3m', size=self.scroll_size, field_scroll=FACT_FIELD)
-                    if response['hits']:
-                        docs_left -= len(response['hits']['hits'])
-                        scroll_id = response['_scroll_id']
-                        # For partial update
-                        doc_ids = [x['_id'] for x in response['hits']['hits'] if '_id' in x]
-                    show_progress.update(docs_left)
-                # Update the last patch
-                update_response = self.es_m.update_documents_by_id(doc_ids)
-
-            except Exception as e:
-                logging.getLogger(ERROR_LOGGER).exception(e)
-                return {'fact_count': fact_count, 'status': 'scrolling_error'}
-        else:
+        if not self.es_m.get_total_documents():
             return {'fact_count': 0, 'status': 'no_hits'}
-        self.es_m.clear_scroll(scroll_id)
-        return {'fact_count': fact_count, 'status': 'success'}
+
+        try:
+            self.es_m.update_mapping_structure(FACT_FIELD, FACT_PROPERTIES)
+            result = FactMutator(self.es_m, self.task_id).add_facts(query['main']['query'], [self.fact_field], self._find_match_facts)
+        except TaskCanceledException:
+            raise
+        except Exception as e:
+            logging.getLogger(ERROR_LOGGER).exception(e)
+            return {'fact_count': 0, 'status': 'scrolling_error'}
+        return {'fact_count': result['facts_added'], 'failed_updates': result['failed_updates'], 'status': 'success'}
 
     def _derive_match_spans(self, hits, fact_count):
+        data = ''
+        for document in hits:
+            new_facts = self._find_match_facts(document)
+            fact_count += len(new_facts)
+            data = self._append_fact_to_doc(document, data, new_facts)
+        return data, fact_count
+
+    def _find_match_facts(self, document):
+        """Returns the matches in the fact field of the document as facts"""
         if self.match_type == 'phrase':
             pattern = r"\b{}\b"
         elif self.match_type == 'phrase_prefix':
@@ -179,16 +168,12 @@ class FactAdderSubWorker(BaseWorker):
         elif self.match_type == 'string':
             pattern = r"\w*{}\w*"
 
-        data = ''
-        for document in hits:
-            content = self._derive_content(document)
-            new_facts = []
-            for match in re.finditer(pattern.format(self.fact_value), content, re.IGNORECASE):
-                save_val = match.group().lower() if not self.case_sens else match.group()
-                new_facts.append({'fact': self.fact_name, 'str_val': save_val, 'doc_path': self.fact_field, 'spans': str([list(match.span())])})
-                fact_count += 1
-            data = self._append_fact_to_doc(document, data, new_facts)
-        return data, fact_count
+        content = self._derive_content(document)
+        new_facts = []
+        for match in re.finditer(pattern.format(self.fact_value), content, re.IGNORECASE):
+            save_val = match.group().lower() if not self.case_sens else match.group()
+            new_facts.append({'fact': self.fact_name, 'str_val': save_val, 'doc_path': self.fact_field, 'spans': str([list(match.span())])})
+        return new_facts
 
     def _append_fact_to_doc(self, document, data, new_facts):
         if FACT_FIELD not in document['_source']:
@@ -1,7 +1,8 @@
 import logging
 import json
 from task_manager.tasks.workers.base_worker import BaseWorker
-from task_manager.tools import ShowProgress
+from task_manager.tasks.workers.management_workers.fact_mutator import FactMutator
+from task_manager.tools import TaskCanceledException
 from texta.settings import ERROR_LOGGER, FACT_FIELD, INFO_LOGGER
 
 
@@ -42,6 +43,8 @@ class FactDeleterSubWorker(BaseWorker):
             self.es_m.load_combined_query(query)
             result = self.remove_facts_from_document(rm_facts_dict, doc_id)
             return result
+        except TaskCanceledException:
+            raise
         except:
             self.error_logger.error('A problem occurred when attempted to run fact_deleter_worker.', exc_info=True, extra={
                 'params': self.params,
@@ -65,67 +68,16 @@ class FactDeleterSubWorker(BaseWorker):
         """
 
         try:
-            response = self.es_m.scroll(size=self.scroll_size, field_scroll=FACT_FIELD)
-
-            scroll_id = response['_scroll_id']
-            total_docs = response['hits']['total']
-            # For partial update
-            doc_ids = [x['_id'] for x in response['hits']['hits'] if '_id' in x]
-
-            show_progress = ShowProgress(self.task_id, multiplier=total_docs/self.scroll_size)
-            show_progress.set_total(total_docs)
-            show_progress.update_view(0)
-
-
-            total_facts_removed = 0 # For result
-            total_failed_batches = 0 # For result
-            docs_left = total_docs
-            while docs_left > 0:
-                try:
-                    data = ''
-                    for document in response['hits']['hits']:
-                        new_field = [] # The new facts field
-                        for fact in document['_source'][FACT_FIELD]:
-                            # If the fact name is in rm_facts_dict keys
-                            if fact["fact"] in rm_facts_dict:
-                                # If the fact value is not in the delete key values
-                                if fact['str_val'] not in rm_facts_dict[fact["fact"]]:
-                                    new_field.append(fact)
-                                else:
-                                    total_facts_removed += 1
-                            else:
-                                new_field.append(fact)
-                        # Update dataset
-                        data += json.dumps({"update": {"_id": document['_id'], "_type": document['_type'], "_index": document['_index']}})+'\n'
-                        document = {'doc': {FACT_FIELD: new_field}}
-                        data += json.dumps(document)+'\n'
-
-                    self.es_m.plain_post_bulk(self.es_m.es_url, data)
-                    self.es_m.update_documents_by_id(doc_ids)
-                    response = self.es_m.scroll(scroll_id=scroll_id, size=self.scroll_size, field_scroll=FACT_FIELD)
-                    docs_left = len(response['hits']['hits'])
-                    scroll_id = response['_scroll_id']
-                    doc_ids = [x['_id'] for x in response['hits']['hits'] if '_id' in x]
-                    show_progress.update(docs_left)
-                except:
-                    total_failed_batches += 1
-                    self.error_logger.error('A problem occurred during scrolling of fact deletion.', exc_info=True, extra={
-                        'total_docs': total_docs,
-                        'docs_left': docs_left,
-                        'response': response,
-                        'rm_facts_dict': rm_facts_dict
-                    })
-
-            # Update the last batch of documents
-            self.es_m.update_documents_by_id(doc_ids)
-            show_progress.update_view(100.0)
-            result = json.dumps({ "Documents modified": total_docs, "Facts removed": total_facts_removed, "Failed batches": total_failed_batches })
+            query = self.es_m.combined_query['main']['query']
+            result = FactMutator(self.es_m, self.task_id).remove_facts(rm_facts_dict, query)
+            result = json.dumps({ "Documents modified": result['documents_modified'], "Facts removed": result['facts_removed'], "Failed updates": result['failed_updates'] })
             return result
 
+        except TaskCanceledException:
+            raise
         except:
             self.error_logger.error('A problem occurred when attempting to delete facts.', exc_info=True, extra={
                 'rm_facts_dict': rm_facts_dict,
-                'response': response,
             })
 
 
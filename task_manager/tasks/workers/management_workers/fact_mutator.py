@@ -0,0 +1,200 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from task_manager.tools import ShowProgress, TaskCanceledException
+from texta.settings import ERROR_LOGGER, FACT_FIELD, FACT_MUTATION
+from utils.sliced_scroll import SlicedScrollReader
+
+# Appends params.facts to the facts of a document
+APPEND_FACTS_SCRIPT = '''
+if (ctx._source.{0} == null) {{
+    ctx._source.{0} = params.facts;
+}} else {{
+    ctx._source.{0}.addAll(params.facts);
+}}
+'''.format(FACT_FIELD)
+
+# Removes the facts whose value is listed under their name in params.facts
+REMOVE_FACTS_SCRIPT = '''
+if (ctx._source.{0} == null) {{
+    ctx.op = 'noop';
+}} else if (!ctx._source.{0}.removeIf(fact -> params.facts.containsKey(fact.fact) && params.facts[fact.fact].contains(fact.str_val))) {{
+    ctx.op = 'noop';
+}}
+'''.format(FACT_FIELD)
+
+
+class FactMutator:
+    """ Adds and removes facts of the documents matching a query for the management workers
+
+    Facts are removed on the Elasticsearch side by an _update_by_query with a painless script, so no documents
+    are transferred. Added facts are derived from the document content in Python: the documents are read with a
+    sliced scroll limited to the needed fields and the new facts are appended by scripted bulk updates, without
+    sending the document's other facts. If the scripted removal is not possible, facts are removed the same way
+    with partial document updates. The indices are refreshed once after all the updates.
+    """
+
+    def __init__(self, es_m, task_id, scroll_size=None, slices=None):
+        self.es_m = es_m
+        self.task_id = task_id
+        self.scroll_size = scroll_size if scroll_size else FACT_MUTATION['scroll_size']
+        self.slices = slices if slices else FACT_MUTATION['slices']
+        self.index = es_m.stringify_datasets()
+
+    def remove_facts(self, rm_facts_dict, query):
+        """ Removes the given fact values from the documents matching the query
+
+        :param rm_facts_dict: fact values to remove by fact name, ex: {'CITY': ['tallinna', 'tallinn']}
+        :param query: Elasticsearch query of the documents containing the facts.
+        :return: dict of the numbers of modified documents, removed facts and failed updates.
+        """
+        self.es_m.ensure_writable()
+        facts_removed = self._count_facts(rm_facts_dict, query)
+        try:
+            result = self._update_by_query(query, REMOVE_FACTS_SCRIPT, {'facts': rm_facts_dict})
+        except TaskCanceledException:
+            raise
+        except Exception:
+            logging.getLogger(ERROR_LOGGER).exception('Scripted fact removal failed, removing facts by bulk updates.', extra={'task_id': self.task_id})
+            result = self._update_by_bulk(query, [FACT_FIELD], lambda document: self._remove_from_document(document, rm_facts_dict))
+
+        self.refresh()
+        result['facts_removed'] = facts_removed
+        return result
+
+    def add_facts(self, query, source_fields, derive_facts):
+        """ Appends the facts derived from every document matching the query to its facts
+
+        :param source_fields: fields of the documents' _source passed to derive_facts.
+        :param derive_facts: function returning the list of new facts of a document hit, may be empty.
+        :return: dict of the numbers of modified documents, added facts and failed updates.
+        """
+        self.es_m.ensure_writable()
+        counts = {'facts_added': 0}
+
+        def get_script(document):
+            facts = derive_facts(document)
+            counts['facts_added'] += len(facts)
+            return {'script': {'source': APPEND_FACTS_SCRIPT, 'lang': 'painless', 'params': {'facts': facts}}} if facts else None
+
+        result = self._update_by_bulk(query, source_fields, get_script)
+        self.refresh()
+        result.update(counts)
+        return result
+
+    def refresh(self):
+        self.es_m.invalidate_aggregation_cache(refresh=True)
+
+    def _count_facts(self, rm_facts_dict, query):
+        """ Counts the facts to be removed with a nested filter aggregation
+        """
+        fact_filters = [{"bool": {"must": [{"term": {FACT_FIELD + ".fact": name}}, {"terms": {FACT_FIELD + ".str_val": values}}]}} for name, values in rm_facts_dict.items()]
+        aggs = {"facts": {"nested": {"path": FACT_FIELD}, "aggs": {"removed": {"filter": {"bool": {"should": fact_filters}}}}}}
+        response = self.es_m.plain_search(self.es_m.es_url, self.index, {"query": query, "size": 0, "aggs": aggs})
+        return response['aggregations']['facts']['removed']['doc_count']
+
+    def _update_by_query(self, query, script, params):
+        """ Runs a scripted _update_by_query as a background task of Elasticsearch, polling it for the progress
+        """
+        url = '{0}/{1}/_update_by_query?conflicts=proceed&slices=auto&wait_for_completion=false&scroll_size={2}'.format(self.es_m.es_url, self.index, self.scroll_size)
+        body = {"query": query, "script": {"source": script, "lang": "painless", "params": params}}
+        response = self.es_m.plain_post(url, json.dumps(body))
+        if 'task' not in response:
+            raise Exception('Update by query was not started: {}'.format(response))
+
+        es_task_url = '{0}/_tasks/{1}'.format(self.es_m.es_url, response['task'])
+        show_progress = ShowProgress(self.task_id)
+        show_progress.set_total(1)
+        show_progress.update_view(0)
+        updated = 0
+
+        try:
+            while True:
+                es_task = self.es_m.plain_get(es_task_url)
+                status = es_task.get('task', {}).get('status', {})
+                if status.get('total'):
+                    show_progress.set_total(status['total'])
+                    # ShowProgress counts the processed documents itself
+                    processed = status.get('updated', 0) + status.get('noops', 0)
+                    show_progress.update(processed - updated)
+                    updated = processed
+                if es_task.get('completed'):
+                    break
+                time.sleep(FACT_MUTATION['poll_interval'])
+        except TaskCanceledException:
+            self.es_m.plain_post('{0}/_cancel'.format(es_task_url))
+            raise
+
+        if 'error' in es_task:
+            raise Exception(es_task['error'])
+        es_response = es_task.get('response', {})
+        if es_response.get('failures'):
+            raise Exception(es_response['failures'][:10])
+
+        show_progress.update_view(100.0)
+        # Documents modified meanwhile are skipped
+        return {'documents_modified': es_response.get('updated', 0), 'failed_updates': es_response.get('version_conflicts', 0)}
+
+    def _update_by_bulk(self, query, source_fields, get_update):
+        """ Reads the matching documents with a sliced scroll and sends their updates as bulk requests
+
+        :param get_update: function returning the update body of a document hit, with a script or a partial document, None to skip it.
+        """
+        total = self.es_m.plain_search(self.es_m.es_url, self.index, {"query": query, "size": 0})['hits']['total']
+        show_progress = ShowProgress(self.task_id)
+        show_progress.set_total(max(total, 1))
+        show_progress.update_view(0)
+
+        result = {'documents_modified': 0, 'failed_updates': 0}
+        reader = SlicedScrollReader(self.index, {"query": query, "_source": source_fields}, n_slices=self.slices,
+                                    scroll_size=self.scroll_size, time_out=FACT_MUTATION['scroll_time_out'], url=self.es_m.es_url)
+        pages = iter(reader)
+        executor = ThreadPoolExecutor(max_workers=self.slices)
+        pending = []
+
+        try:
+            for hits in pages:
+                lines = []
+                for document in hits:
+                    update = get_update(document)
+                    if update is None:
+                        continue
+                    lines.append(json.dumps({"update": {"_id": document['_id'], "_type": document['_type'], "_index": document['_index'], "retry_on_conflict": 3}}))
+                    lines.append(json.dumps(update))
+
+                if lines:
+                    # Keep at most one bulk request per slice in flight
+                    if len(pending) >= self.slices:
+                        self._collect_bulk(pending.pop(0), result)
+                    pending.append(executor.submit(self.es_m.plain_post_bulk, self.es_m.es_url, ('\n'.join(lines) + '\n').encode('utf8')))
+                show_progress.update(len(hits))
+
+            for future in pending:
+                self._collect_bulk(future, result)
+        finally:
+            # Stops the slices and clears their scroll contexts
+            pages.close()
+            executor.shutdown(wait=True)
+
+        show_progress.update_view(100.0)
+        return result
+
+    @staticmethod
+    def _collect_bulk(future, result):
+        response = future.result()
+        for item in response.get('items', []):
+            status = item['update']['status']
+            if status >= 300:
+                result['failed_updates'] += 1
+            elif item['update'].get('result') != 'noop':
+                result['documents_modified'] += 1
+
+    @staticmethod
+    def _remove_from_document(document, rm_facts_dict):
+        facts = document['_source'].get(FACT_FIELD) or []
+        kept_facts = [fact for fact in facts if fact.get('str_val') not in rm_facts_dict.get(fact.get('fact'), ())]
+        if len(kept_facts) == len(facts):
+            return None
+        return {'doc': {FACT_FIELD: kept_facts}}
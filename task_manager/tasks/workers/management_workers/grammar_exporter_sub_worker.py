@@ -0,0 +1,91 @@
+import logging
+import json
+import os
+from grammar_builder.grammar_exporter import GrammarExporter
+from task_manager.models import Task
+from task_manager.tasks.task_types import TaskTypes
+from task_manager.tasks.workers.base_worker import BaseWorker
+from task_manager.tools import ShowProgress
+from task_manager.tools import TaskCanceledException
+from texta.settings import ERROR_LOGGER, INFO_LOGGER, MEDIA_URL, PROTECTED_MEDIA, URL_PREFIX
+from utils.es_manager import ES_Manager
+from utils.helper_functions import create_file_path
+
+
+class GrammarExporterSubWorker(BaseWorker):
+
+    def __init__(self, es_m, task_id, params, scroll_size=10000, time_out='10m'):
+        self.es_m = es_m
+        self.task_id = task_id
+        self.params = params
+        self.scroll_size = scroll_size
+        self.scroll_time_out = time_out
+
+        self._reload_env()
+        self.info_logger, self.error_logger = self._generate_loggers()
+
+    def _reload_env(self):
+        from dotenv import load_dotenv
+        from pathlib import Path
+        env_path = str(Path('.env'))
+        load_dotenv(dotenv_path=env_path)
+
+    def _generate_loggers(self):
+        import graypy
+        import os
+        info_logger = logging.getLogger(INFO_LOGGER)
+        error_logger = logging.getLogger(ERROR_LOGGER)
+        handler = graypy.GELFUDPHandler(os.getenv("GRAYLOG_HOST_NAME", "localhost"), int(os.getenv("GRAYLOG_PORT", 12201)))
+
+        info_logger.addHandler(handler)
+        error_logger.addHandler(handler)
+
+        return info_logger, error_logger
+
+    def run(self):
+        """Writes the documents matching the grammar to a file of the task's media.
+
+        Parameters are set by grammar_builder.views.export_matched_data:
+            grammar_export_query {Dict} -- Search body of the candidate documents
+            grammar_export_metaquery {Dict} -- Grammar to match
+            grammar_export_layers {List[str]} -- Features the grammar is evaluated on
+            grammar_export_features {List[str]} -- Exported features
+            grammar_export_format {str} -- 'csv', 'jsonl' or 'parquet'
+        """
+        query = self.params['grammar_export_query']
+        exporter = GrammarExporter(self.es_m, query, self.params['grammar_export_metaquery'], self.params['grammar_export_layers'],
+                                   self.params['grammar_export_features'], self.params.get('grammar_export_format', 'csv'))
+
+        task_obj = Task.objects.get(pk=self.task_id)
+        task_type = TaskTypes.MANAGEMENT_TASK.value
+        # Named after the task, so that the file is deleted with it
+        file_name = 'model_{}_grammar_export.{}'.format(task_obj.unique_id, exporter.writer.extension)
+        file_path = create_file_path(file_name, PROTECTED_MEDIA, "task_manager/", task_type)
+        file_url = os.path.join(URL_PREFIX, MEDIA_URL, "task_manager/", task_type, file_name)
+
+        show_progress = ShowProgress(self.task_id)
+        show_progress.update_step('Matching the grammar')
+        show_progress.set_total(max(self._count(query), 1))
+        show_progress.update_view(0)
+
+        try:
+            with open(file_path, 'wb') as f:
+                for data in exporter.stream(progress=show_progress.update):
+                    f.write(data.encode('utf8') if isinstance(data, str) else data)
+        except Exception as e:
+            if not isinstance(e, TaskCanceledException):
+                self.error_logger.error('A problem occurred when exporting grammar matches.', exc_info=True, extra={
+                    'params': self.params,
+                    'task_id': self.task_id
+                })
+            # A partial export is not kept
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        show_progress.update_view(100)
+        return json.dumps({"Documents processed": show_progress.n_count, "Documents matched": exporter.n_matched, "File": file_url})
+
+    def _count(self, query):
+        response = ES_Manager.plain_search(self.es_m.es_url, self.es_m.stringify_datasets(), {'query': query.get('query', {'match_all': {}}), 'size': 0})
+        return response['hits']['total']
@@ -5,3 +5,4 @@ from enum import Enum, unique
 class ManagerKeys(str, Enum):
     FACT_DELETER = "fact_deleter"
     FACT_ADDER = "fact_adder"
+    GRAMMAR_EXPORTER = "grammar_exporter"
@@ -8,6 +8,7 @@ from task_manager.models import Task
 from task_manager.tools import TaskCanceledException
 from task_manager.tasks.workers.management_workers.fact_deleter_sub_worker import FactDeleterSubWorker
 from task_manager.tasks.workers.management_workers.fact_adder_sub_worker import FactAdderSubWorker
+from task_manager.tasks.workers.management_workers.grammar_exporter_sub_worker import GrammarExporterSubWorker
 
 from utils.datasets import Datasets
 from utils.es_manager import ES_Manager
@@ -29,6 +30,7 @@ class ManagementWorker(BaseWorker):
         self.manager_map = {
             ManagerKeys.FACT_DELETER: FactDeleterSubWorker,
             ManagerKeys.FACT_ADDER: FactAdderSubWorker,
+            ManagerKeys.GRAMMAR_EXPORTER: GrammarExporterSubWorker,
         }
 
         self._reload_env()
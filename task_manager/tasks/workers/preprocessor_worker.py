@@ -1,8 +1,9 @@
-import sys
 from datetime import datetime
 import json
 import os
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from texta.settings import ERROR_LOGGER
@@ -25,12 +26,17 @@ from task_manager.document_preprocessor import PREPROCESSOR_INSTANCES
 
 class PreprocessorWorker(BaseWorker):
 
-    def __init__(self, scroll_size=100, time_out='50m'):
+    def __init__(self, scroll_size=100, time_out='50m', bulk_requests_in_flight=2, update_by_query_pages=0):
         self.es_m = None
         self.task_id = None
         self.params = None
         self.scroll_size = scroll_size
         self.scroll_time_out = time_out
+        # Number of bulk update requests allowed to run while the following pages are processed.
+        self.bulk_requests_in_flight = bulk_requests_in_flight
+        # Run _update_by_query over the processed documents every N pages, 0 disables it.
+        # Bulk updates already reindex the documents, so it is only needed for mapping changes of existing fields.
+        self.update_by_query_pages = update_by_query_pages
 
         self._reload_env()
         self.info_logger, self.error_logger = self._generate_loggers()
@@ -106,23 +112,35 @@ class PreprocessorWorker(BaseWorker):
                 new_field_properties = preprocessor_map[preprocessor_key]['field_properties']
                 self.es_m.update_mapping_structure(new_field_name, new_field_properties)
 
+        self._load_pipeline_parameters()
+
         response = self.es_m.scroll(field_scroll=field_paths, size=self.scroll_size, time_out=self.scroll_time_out)
-        scroll_id = response['_scroll_id']
+        scroll_id = response.get('_scroll_id')
         total_docs = response['hits']['total']
-        # For partial update
-        doc_ids = [x['_id'] for x in response['hits']['hits'] if '_id' in x]
-
-        total_hits = len(response['hits']['hits'])
         show_progress.set_total(total_docs)
+
+        # One thread prefetches the next scroll page, the others run the bulk updates.
+        executor = ThreadPoolExecutor(max_workers=1 + self.bulk_requests_in_flight)
+        bulk_requests = deque()
+        # IDs of processed documents waiting for _update_by_query
+        pending_ids = []
+        n_pages = 0
+        facts_mapping_checked = False
+        facts_written = False
+
         try:
             # Metadata of preprocessor outputs
             meta = {}
-            while total_hits > 0:
+            while response['hits']['hits']:
+                # Fetch the next page while the current one is being transformed
+                next_page = executor.submit(self.es_m.scroll, scroll_id=scroll_id, time_out=self.scroll_time_out)
+
                 documents, parameter_dict, ids, document_locations = self._prepare_preprocessor_data(response)
                 # Add facts field if necessary
-                if documents:
+                if documents and not facts_mapping_checked:
                     if FACT_FIELD not in documents[0]:
                         self.es_m.update_mapping_structure(FACT_FIELD, FACT_PROPERTIES)
+                    facts_mapping_checked = True
 
                 # Apply all preprocessors
                 for preprocessor_code in parameter_dict['preprocessors']:
@@ -132,35 +150,42 @@ class PreprocessorWorker(BaseWorker):
                     documents = result_map['documents']
                     add_dicts(meta, result_map['meta'])
 
-                self.es_m.bulk_post_documents(documents, ids, document_locations)
+                bulk_requests.append(executor.submit(self.es_m.bulk_post_documents, documents, ids, document_locations))
+                facts_written = facts_written or any(FACT_FIELD in document for document in documents)
+                while len(bulk_requests) > self.bulk_requests_in_flight:
+                    bulk_requests.popleft().result()
+
                 # Update progress is important to check task is alive
-                show_progress.update(total_hits)
-                self.es_m.update_documents_by_id(doc_ids)
-                # Get next page if any
+                show_progress.update(len(ids))
 
-                try:
-                    response = self.es_m.scroll(scroll_id=scroll_id, time_out=self.scroll_time_out)
-                    total_hits = len(response['hits']['hits'])
-                    scroll_id = response['_scroll_id']
-                    # For partial update
-                    doc_ids = [x['_id'] for x in response['hits']['hits'] if '_id' in x]
-                except KeyError as e:
-                    t, v, tb = sys.exc_info()
-                    self.error_logger.exception(t)
-                    self.error_logger.exception(v)
-                    self.error_logger.exception(tb)
-
-                    self.error_logger.exception(response)
-                    raise e
+                n_pages += 1
+                if self.update_by_query_pages:
+                    pending_ids.extend(ids)
+                    if n_pages % self.update_by_query_pages == 0:
+                        self._update_pending_documents(bulk_requests, pending_ids)
 
+                # Get next page if any
+                response = next_page.result()
+                if '_scroll_id' not in response:
+                    self.error_logger.error(response)
+                    raise KeyError('_scroll_id')
+                scroll_id = response['_scroll_id']
+
+            show_progress.update_view(100.0)
             task = Task.objects.get(pk=self.task_id)
-            show_progress.update(100)
-            task.result = json.dumps({'documents_processed': show_progress.n_total, **meta, 'preprocessor_key': self.params['preprocessor_key']})
+            throughput = show_progress.get_throughput()
+            task.result = json.dumps({'documents_processed': show_progress.n_total, **meta, 'preprocessor_key': self.params['preprocessor_key'],
+                                      'documents_per_second': throughput['documents_per_second'], 'elapsed_seconds': throughput['elapsed_seconds']})
             task.update_status(Task.STATUS_UPDATING)
-            # Update the last batch of documents
-            self.es_m.update_documents_by_id(doc_ids)
+            # Wait for the last bulk updates and update the remaining documents
+            self._update_pending_documents(bulk_requests, pending_ids)
+            # The pages were not refreshed one by one, drops the aggregations cached before they became searchable
+            self.es_m.invalidate_aggregation_cache(refresh=True, facts=facts_written)
             task.update_status(Task.STATUS_COMPLETED, set_time_completed=True)
 
+        except TaskCanceledException:
+            raise
+
         # If runs into an exception, give feedback
         except Exception as e:
             log_dict = {'task': '_preprocessor_worker', 'event': 'main_scroll_logic_failed', 'data': {'task_id': self.task_id}}
@@ -171,6 +196,34 @@ class PreprocessorWorker(BaseWorker):
             task.time_completed = datetime.now()
             task.save()
 
+        finally:
+            executor.shutdown(wait=True)
+            if scroll_id:
+                ES_Manager.clear_scroll(scroll_id)
+
+
+    def _load_pipeline_parameters(self):
+        """
+        Overrides the default page size, scroll time-out, number of in-flight
+        bulk requests and _update_by_query interval with the task's parameters.
+        """
+        self.scroll_size = int(self.params.get('scroll_size') or self.scroll_size)
+        self.scroll_time_out = self.params.get('scroll_time_out') or self.scroll_time_out
+        self.bulk_requests_in_flight = max(1, int(self.params.get('bulk_requests_in_flight') or self.bulk_requests_in_flight))
+        self.update_by_query_pages = int(self.params.get('update_by_query_pages') or self.update_by_query_pages)
+
+
+    def _update_pending_documents(self, bulk_requests, pending_ids):
+        """
+        Waits for the submitted bulk updates and runs _update_by_query over the pending documents.
+        """
+        while bulk_requests:
+            bulk_requests.popleft().result()
+
+        if pending_ids:
+            self.es_m.update_documents_by_id(pending_ids)
+            del pending_ids[:]
+
 
     def _prepare_preprocessor_data(self, response: dict):
         """
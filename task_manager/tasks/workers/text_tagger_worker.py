@@ -14,6 +14,7 @@ from utils.word_cluster import WordCluster
 from texta.settings import ERROR_LOGGER
 from texta.settings import INFO_LOGGER
 from texta.settings import MODELS_DIR
+from texta.settings import MODEL_REGISTRY
 from texta.settings import MEDIA_URL
 from texta.settings import PROTECTED_MEDIA
 from texta.settings import URL_PREFIX
@@ -28,6 +29,7 @@ from sklearn.model_selection import GridSearchCV
 from task_manager.tools import ShowSteps
 from task_manager.tools import TaskCanceledException
 from task_manager.tools import get_pipeline_builder
+from task_manager.tools import get_model_registry
 from utils.helper_functions import plot_confusion_matrix, create_file_path, write_task_xml
 from utils.stop_words import StopWords
 from utils.phraser import Phraser
@@ -46,6 +48,10 @@ class TagModelWorker(BaseWorker):
         self.task_params = None
         self.task_type = None
         self.n_jobs = 1
+        self._phraser = None
+        self._stop_words = None
+        self._word_cluster = None
+        self._word_cluster_fields = []
 
         self._reload_env()
         self.info_logger, self.error_logger = self._generate_loggers()
@@ -67,34 +73,65 @@ class TagModelWorker(BaseWorker):
 
         return info_logger, error_logger
 
-    def _handle_language_model(self, data_sample_x_map):
-        if 'language_model' in self.task_params:
-            language_model = self.task_params['language_model']
+    def _load_language_model(self, apply_word_clusters=True):
+        """ Loads the phraser and the word clusters of the tagger's language model, if it was trained with one.
+        The same transformation is applied to the texts when training and when tagging.
 
-            if 'word_cluster_fields' in self.task_params:
-                word_cluster_fields = self.task_params['word_cluster_fields']
-            else:
-                word_cluster_fields = None
-
-            task_obj = Task.objects.get(pk=int(language_model['pk']))
-            sw = StopWords()
-
-            # detect phrases & remove stopwords
-            phraser = Phraser(int(language_model['pk']))
-            phraser.load()
-            if phraser:
-                for field_name, field_content in data_sample_x_map.items():
-                    field_content = [' '.join(phraser.phrase(sw.remove(text).split(' '))) for text in field_content]
-                    data_sample_x_map[field_name] = field_content
-
-            # cluster if asked
-            if word_cluster_fields:
-                wc = WordCluster()
-                loaded = wc.load(task_obj.unique_id)
-                if loaded:
-                    for word_cluster_field in word_cluster_fields:
-                        if word_cluster_field in data_sample_x_map:
-                            data_sample_x_map[word_cluster_field] = [wc.text_to_clusters(text) for text in data_sample_x_map[word_cluster_field]]
+        :param apply_word_clusters: whether the texts of the word_cluster_fields are clustered.
+        """
+        self._phraser = None
+        self._stop_words = None
+        self._word_cluster = None
+        self._word_cluster_fields = []
+
+        if 'language_model' not in self.task_params:
+            return
+
+        language_model = self.task_params['language_model']
+        self._stop_words = StopWords()
+        self._phraser = Phraser(int(language_model['pk']))
+        self._phraser.load()
+
+        word_cluster_fields = self.task_params.get('word_cluster_fields')
+        if word_cluster_fields and apply_word_clusters:
+            language_model_task = Task.objects.get(pk=int(language_model['pk']))
+            word_cluster = WordCluster()
+            if word_cluster.load(language_model_task.unique_id, language_model_task.task_type):
+                self._word_cluster = word_cluster
+                self._word_cluster_fields = word_cluster_fields
+
+    def _trained_with_word_clusters(self):
+        """ Whether the training of the tagger clustered the texts. Taggers trained before the clusters were applied
+        have no flag in their result and keep tagging unclustered texts.
+        """
+        try:
+            return bool(json.loads(self.task_obj.result or '{}').get('word_clusters_applied'))
+        except ValueError:
+            return False
+
+    def get_text_transform_key(self):
+        """ Returns a key equal for the taggers which transform the texts the same way, None if the texts are used as they are
+        """
+        if 'language_model' not in self.task_params:
+            return None
+        return int(self.task_params['language_model']['pk']), tuple(sorted(self._word_cluster_fields))
+
+    def transform_text_map(self, text_map):
+        """ Detects the phrases, removes the stopwords and clusters the words of the texts like in training
+
+        :param text_map: dict of field name -> list of texts.
+        :return: a new dict of field name -> list of transformed texts.
+        """
+        if self._phraser is None:
+            return text_map
+
+        transformed = {}
+        for field_name, field_content in text_map.items():
+            transformed[field_name] = [' '.join(self._phraser.phrase(self._stop_words.remove(text).split(' '))) for text in field_content]
+        for word_cluster_field in self._word_cluster_fields:
+            if word_cluster_field in transformed:
+                transformed[word_cluster_field] = [self._word_cluster.text_to_clusters(text.split(' ')) for text in transformed[word_cluster_field]]
+        return transformed
 
     def run(self, task_id):
 
@@ -149,13 +186,14 @@ class TagModelWorker(BaseWorker):
                                    max_positive_sample_size=max_sample_size_opt,
                                    score_threshold=score_threshold_opt)
             data_sample_x_map, data_sample_y, statistics = es_data.get_data_samples()
-            # Pass data_sample_x_map as reference to be modified by self._handle_language_model
-            self._handle_language_model(data_sample_x_map)
+            self._load_language_model()
+            data_sample_x_map = self.transform_text_map(data_sample_x_map)
 
             # Training the model.
             show_progress.update(1)
             self.model, train_summary, plot_url = self._train_model_with_cv(c_pipe, c_params, data_sample_x_map, data_sample_y)
             train_summary['samples'] = statistics
+            train_summary['word_clusters_applied'] = bool(self._word_cluster_fields)
             train_summary['confusion_matrix'] = '<img src="{}" style="max-width: 80%">'.format(plot_url)
             # Saving the model.
             show_progress.update(2)
@@ -196,7 +234,7 @@ class TagModelWorker(BaseWorker):
         # Recover features from model to check map
         union_features = [x[0] for x in self.model.named_steps['union'].transformer_list if x[0].startswith('pipe_')]
         field_features = [x[5:] for x in union_features]
-        df_text = pd.DataFrame(text_map)
+        df_text = pd.DataFrame(self.transform_text_map(text_map))
         for field in field_features:
             if field not in text_map:
                 if check_map_consistency:
@@ -232,7 +270,7 @@ class TagModelWorker(BaseWorker):
 
     def load(self, task_id):
         """
-        Imports model pickle from filesystem.
+        Imports model pickle from filesystem. Loaded models are shared through the process' model registry.
         :param task_id: id of task it was saved from.
         :return: serialized model pickle.
         """
@@ -241,8 +279,12 @@ class TagModelWorker(BaseWorker):
         self.task_type = self.task_obj.task_type
         file_path = os.path.join(MODELS_DIR, self.task_type, model_name)
         try:
-            model = joblib.load(file_path)
+            model = get_model_registry().get(file_path, lambda path: joblib.load(path, mmap_mode=MODEL_REGISTRY['mmap_mode']))
             self.model = model
+            if self.task_id != int(task_id):
+                # Workers are reused for the same tagger, the language model is loaded once
+                self.task_params = json.loads(self.task_obj.parameters)
+                self._load_language_model(apply_word_clusters=self._trained_with_word_clusters())
             self.task_id = int(task_id)
             self.description = self.task_obj.description
             return model
@@ -5,6 +5,8 @@ from .data_manager import EsIterator
 from .data_manager import TaskCanceledException
 from .pipeline_builder import get_pipeline_builder
 from .mass_helper import MassHelper
+from .model_registry import get_model_registry
+from .multi_tagger import MultiTagger
 
 
 __all__ = ["ShowSteps",
@@ -13,4 +15,6 @@ __all__ = ["ShowSteps",
            "EsIterator",
            "TaskCanceledException",
            "get_pipeline_builder",
-           "MassHelper"]
+           "MassHelper",
+           "get_model_registry",
+           "MultiTagger"]
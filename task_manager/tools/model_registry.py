@@ -0,0 +1,98 @@
+""" The Model Registry
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from texta.settings import MODEL_REGISTRY
+
+
+class RegistryEntry:
+
+    def __init__(self, model, mtime, size):
+        self.model = model
+        self.mtime = mtime
+        self.size = size
+
+
+class ModelRegistry:
+    """ Process-level LRU cache of models loaded from the filesystem
+
+    Models are keyed by their file path, which contains the task's unique_id, and are
+    reloaded when the file's modification time changes. Least recently used models are
+    evicted when the summed file sizes exceed the memory budget.
+    """
+
+    def __init__(self, memory_budget):
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Per-file locks, so that a model is loaded once even if requested concurrently.
+        self._load_locks = {}
+
+    def get(self, file_path, loader):
+        """ Returns the model stored in file_path, loading it with loader(file_path) if it is not cached yet
+
+        :param file_path: path to the model's file.
+        :param loader: function which deserializes the model from file_path.
+        :return: the loaded model, shared by all the callers of the process.
+        """
+        mtime = os.path.getmtime(file_path)
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(file_path, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(file_path)
+                if entry is not None and entry.mtime == mtime:
+                    self._entries.move_to_end(file_path)
+                    return entry.model
+
+            model = loader(file_path)
+
+            with self._lock:
+                self._remove(file_path)
+                self._entries[file_path] = RegistryEntry(model, mtime, os.path.getsize(file_path))
+                self._size += self._entries[file_path].size
+                self._evict()
+
+        return model
+
+    def remove(self, file_path):
+        """ Drops the model of file_path from the registry
+        """
+        with self._lock:
+            self._remove(file_path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, file_path):
+        entry = self._entries.pop(file_path, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def _evict(self):
+        # The most recently loaded model is always kept, even if it exceeds the budget alone.
+        while self._size > self.memory_budget and len(self._entries) > 1:
+            file_path, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+
+
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """ Returns the model registry of the current process
+    """
+    global _model_registry
+
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry(MODEL_REGISTRY['memory_budget_mb'] * 1024 * 1024)
+        return _model_registry
@@ -0,0 +1,126 @@
+""" The Multi Tagger
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import Normalizer
+from sklearn.svm import LinearSVC
+from sklearn.utils.extmath import safe_sparse_dot
+
+from .pipeline_builder import ItemSelector, ModelNull
+
+# Steps which transform the texts without any fitted state, so that equal parameters give equal features.
+STATELESS_STEPS = (ItemSelector, HashingVectorizer, ModelNull, Normalizer)
+LINEAR_CLASSIFIERS = (LogisticRegression, LinearSVC)
+
+
+class MultiTagger:
+    """ Applies many tagger pipelines from pipeline_builder to the same texts
+
+    Field pipelines made of stateless steps with equal parameters are transformed once and
+    shared by all the taggers using them. Binary linear classifiers over equal feature unions
+    are evaluated together as a single sparse x dense product of the stacked coefficients.
+    Other taggers fall back to their own predict. Predictions equal per-model predict.
+    """
+
+    def __init__(self, models):
+        self.models = models
+
+    def predict(self, text_map, check_map_consistency=True):
+        """ Predicts the tags of every model
+
+        :param text_map: dict of field name -> list of texts.
+        :param check_map_consistency: raise if a field used by a model is missing from text_map, otherwise use empty texts.
+        :return: list of prediction vectors in the order of the models.
+        """
+        df_text = pd.DataFrame(text_map)
+        for model in self.models:
+            for field in self._get_fields(model):
+                if field not in df_text:
+                    if check_map_consistency:
+                        raise RuntimeError("Mapped field not present: {}".format(field))
+                    else:
+                        df_text[field] = ""
+
+        results = [None] * len(self.models)
+        groups = OrderedDict()
+
+        for i, model in enumerate(self.models):
+            signature = self._get_model_signature(model)
+            if signature is None:
+                results[i] = model.predict(df_text)
+            else:
+                groups.setdefault(signature, []).append(i)
+
+        # Features of the field pipelines, shared by all groups
+        field_features = {}
+
+        for indices in groups.values():
+            union = self.models[indices[0]].named_steps['union']
+            features = self._transform_union(union, df_text, field_features)
+
+            classifiers = [self.models[i].steps[-1][1] for i in indices]
+            coefficients = np.vstack([classifier.coef_ for classifier in classifiers])
+            intercepts = np.hstack([classifier.intercept_ for classifier in classifiers])
+            scores = safe_sparse_dot(features, coefficients.T, dense_output=True) + intercepts
+
+            for column, i in enumerate(indices):
+                results[i] = classifiers[column].classes_[(scores[:, column] > 0).astype(int)]
+
+        return results
+
+    @staticmethod
+    def _get_fields(model):
+        if 'union' not in model.named_steps:
+            return []
+        union_features = [x[0] for x in model.named_steps['union'].transformer_list if x[0].startswith('pipe_')]
+        return [x[5:] for x in union_features]
+
+    def _transform_union(self, union, df_text, field_features):
+        blocks = []
+        for name, pipeline in union.transformer_list:
+            key = (name, self._get_pipeline_signature(pipeline))
+            if key not in field_features:
+                field_features[key] = pipeline.transform(df_text)
+            blocks.append(field_features[key])
+
+        if any(sparse.issparse(block) for block in blocks):
+            return sparse.hstack(blocks).tocsr()
+        return np.hstack(blocks)
+
+    def _get_model_signature(self, model):
+        """ Returns a hashable description of the model's feature union,
+        or None if the model can not be evaluated in a batch.
+        """
+        if 'union' not in model.named_steps or len(model.steps) != 2:
+            return None
+
+        union = model.named_steps['union']
+        classifier = model.steps[-1][1]
+
+        if union.transformer_weights is not None:
+            return None
+        if not isinstance(classifier, LINEAR_CLASSIFIERS) or classifier.coef_.shape[0] != 1:
+            return None
+
+        signature = []
+        for name, pipeline in union.transformer_list:
+            pipeline_signature = self._get_pipeline_signature(pipeline)
+            if pipeline_signature is None:
+                return None
+            signature.append((name, pipeline_signature))
+
+        return tuple(signature)
+
+    @staticmethod
+    def _get_pipeline_signature(pipeline):
+        signature = []
+        for name, step in pipeline.steps:
+            if not isinstance(step, STATELESS_STEPS):
+                return None
+            signature.append((type(step).__name__, repr(sorted(step.get_params().items()))))
+        return tuple(signature)
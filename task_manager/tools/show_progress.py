@@ -1,18 +1,29 @@
+import time
+from datetime import timedelta
 
 from task_manager.models import Task
+from texta.settings import TASK_PROGRESS
 from .data_manager import TaskCanceledException
 
 
 class ShowProgress(object):
     """ Show model training progress
+
+    Updates are counted in memory and written to the task, which also checks whether the task was canceled,
+    when min_interval seconds or min_percentage_step percents have passed since the last write.
     """
 
-    def __init__(self, task_pk, multiplier=None):
+    def __init__(self, task_pk, multiplier=None, min_interval=None, min_percentage_step=None):
         self.n_total = None
         self.n_count = 0
         self.task_pk = task_pk
         self.multiplier = multiplier
         self.step = None
+        self.min_interval = min_interval if min_interval is not None else TASK_PROGRESS['min_interval']
+        self.min_percentage_step = min_percentage_step if min_percentage_step is not None else TASK_PROGRESS['min_percentage_step']
+        self.time_started = time.time()
+        self._last_write_time = None
+        self._last_write_percentage = None
 
     def set_total(self, total):
         self.n_total = total
@@ -27,15 +38,34 @@ class ShowProgress(object):
             return
         self.n_count += amount
         percentage = (100.0 * self.n_count) / self.n_total
-        self.update_view(percentage)
+        if self._is_due(percentage):
+            self.update_view(percentage)
 
     def update_view(self, percentage):
-        r = Task.get_by_id(self.task_pk)
-        # Check if task was canceled
-        if r.status == Task.STATUS_CANCELED:
-            raise TaskCanceledException()
-        r.status = Task.STATUS_RUNNING
         progress_message = '{0:3.0f} %'.format(percentage)
         if self.step:
             progress_message = '{1}: {0}'.format(progress_message, self.step)
-        r.update_progress(percentage, progress_message)
+        throughput = self.get_throughput()
+        if 0 < percentage < 100 and throughput['eta_seconds'] is not None:
+            progress_message = '{0} - {1:.0f} docs/s, ETA {2}'.format(progress_message, throughput['documents_per_second'], timedelta(seconds=throughput['eta_seconds']))
+
+        self._last_write_time = time.time()
+        self._last_write_percentage = percentage
+        # Check if task was canceled
+        if not Task.update_running_progress(self.task_pk, percentage, progress_message):
+            raise TaskCanceledException()
+
+    def get_throughput(self):
+        """ Returns the processing rate since the start and the estimated time left in seconds
+        """
+        elapsed = max(time.time() - self.time_started, 1e-6)
+        rate = self.n_count / elapsed
+        eta = int((self.n_total - self.n_count) / rate) if self.n_total and rate else None
+        return {'documents_per_second': round(rate, 2), 'elapsed_seconds': round(elapsed, 2), 'eta_seconds': max(eta, 0) if eta is not None else None}
+
+    def _is_due(self, percentage):
+        if self._last_write_time is None:
+            return True
+        if time.time() - self._last_write_time >= self.min_interval:
+            return True
+        return abs(percentage - self._last_write_percentage) >= self.min_percentage_step
@@ -20,10 +20,7 @@ class ShowSteps(object):
     def update_view(self):
         i = self.n_step
         percentage = (100.0 * i) / self.n_total
-        r = Task.get_by_id(self.model_pk)
+        progress_message = '{0} [{1}/{2}]'.format(self.step_messages[i], i + 1, self.n_total)
         # Check if task was canceled
-        if r.status == Task.STATUS_CANCELED:
+        if not Task.update_running_progress(self.model_pk, percentage, progress_message):
             raise TaskCanceledException()
-        r.status = Task.STATUS_RUNNING
-        progress_message = '{0} [{1}/{2}]'.format(self.step_messages[i], i + 1, self.n_total)
-        r.update_progress(percentage, progress_message)
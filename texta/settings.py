@@ -149,6 +149,38 @@ SCRIPT_MANAGER_DIR = os.path.join(MEDIA_ROOT, 'script_manager')
 if not os.path.exists(MODELS_DIR):
 	os.makedirs(MODELS_DIR)
 
+# Process-level cache of loaded tagger and entity extractor models (task_manager/tools/model_registry.py).
+# memory_budget_mb - least recently used models are dropped when their summed file sizes exceed the budget.
+# mmap_mode - passed to joblib.load, 'r' memory-maps model arrays so that processes share them through page cache.
+MODEL_REGISTRY = {
+	'memory_budget_mb': int(os.getenv('TEXTA_MODEL_REGISTRY_MEMORY_MB', 2048)),
+	'mmap_mode':        os.getenv('TEXTA_MODEL_REGISTRY_MMAP_MODE', None)
+}
+
+# Task scheduler daemon (python manage.py task-scheduler --daemon), see task_manager/tasks/task_scheduler.py.
+# max_running - number of task processes of one scheduler, several schedulers may share the Task table.
+# task_type_limits - maximum number of running tasks of a type over all the schedulers, e.g. {'train_model': 2}.
+# task_type_priorities - queued tasks of higher priority types are started first, default priority is 0.
+# heartbeat_timeout - running tasks of a scheduler which has not sent a heartbeat for this many seconds are failed.
+# cancel_grace_seconds - seconds a canceled task may keep running before its process is terminated.
+TASK_SCHEDULER = {
+	'max_running':             int(os.getenv('TEXTA_TASK_SCHEDULER_MAX_RUNNING', 6)),
+	'task_type_limits':        {},
+	'task_type_priorities':    {'management_task': 1},
+	'poll_interval':           2,
+	'heartbeat_interval':      30,
+	'heartbeat_timeout':       300,
+	'cancel_grace_seconds':    60,
+	'max_last_update_minutes': 1000
+}
+
+# Progress reporting of the task workers (task_manager/tools/show_progress.py). Progress is written to the
+# database, and cancellation checked, when min_interval seconds or min_percentage_step percents have passed.
+TASK_PROGRESS = {
+	'min_interval':        2,
+	'min_percentage_step': 1
+}
+
 if not os.path.exists(PROTECTED_MEDIA):
 	os.makedirs(PROTECTED_MEDIA)
 
@@ -317,6 +349,156 @@ es_use_ldap = False
 es_ldap_user = os.getenv('TEXTA_LDAP_USER')
 es_ldap_password = os.getenv('TEXTA_LDAP_PASSWORD')
 
+# Shared HTTP transport of all the Elasticsearch traffic (utils/es_transport.py). Every process keeps one pooled
+# keep-alive requests session and one elasticsearch client.
+#
+# pool_maxsize - number of kept-alive connections per host.
+# timeout - seconds to wait for a response.
+# max_retries - retries on connection errors, timeouts and 502/503/504 responses.
+# retry_backoff_factor - exponential backoff factor between retries in seconds.
+# http_compress - gzip request bodies. Responses are always accepted gzipped.
+ES_CONNECTION = {
+	'pool_maxsize':         int(os.getenv('TEXTA_ES_POOL_MAXSIZE', 25)),
+	'timeout':              int(os.getenv('TEXTA_ES_TIMEOUT', 60)),
+	'max_retries':          int(os.getenv('TEXTA_ES_MAX_RETRIES', 3)),
+	'retry_backoff_factor': 0.5,
+	'http_compress':        ast.literal_eval(str(os.getenv('TEXTA_ES_HTTP_COMPRESS', False)))
+}
+
+# Seconds for which ES_Manager caches index mappings (mapped fields, column names, mapping schema) in a process.
+# Mappings altered through ES_Manager.update_mapping_structure are invalidated immediately in the altering process.
+es_mapping_cache_ttl = int(os.getenv('TEXTA_ES_MAPPING_CACHE_TTL', 60))
+
+# Seconds after which ES_Manager clears the read_only_allow_delete block of an index set again before writing to it.
+es_readonly_check_ttl = int(os.getenv('TEXTA_ES_READONLY_CHECK_TTL', 600))
+
+# Shared cache of aggregation results (utils/aggregation_cache.py) used by the searcher aggregations, the dashboard,
+# the fact graph and autocomplete. Results are dropped when ES_Manager, the fact adder and deleter or the dataset
+# importer write to one of their indices, and otherwise expire after ttl seconds. The default file based cache is
+# shared by the web server and the task processes, a local-memory cache invalidates only the results of its own process.
+#
+# cache - alias of the cache in CACHES.
+# ttl - seconds for which results are kept.
+# stats_flush_interval - seconds for which every process counts hits and misses in memory before adding them to the cache.
+AGGREGATION_CACHE = {
+	'enabled':              ast.literal_eval(str(os.getenv('TEXTA_AGGREGATION_CACHE_ENABLED', True))),
+	'cache':                'aggregations',
+	'ttl':                  int(os.getenv('TEXTA_AGGREGATION_CACHE_TTL', 300)),
+	'stats_flush_interval': 60
+}
+
+CACHES = {
+	'default': {
+		'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+	},
+	AGGREGATION_CACHE['cache']: {
+		'BACKEND':  os.getenv('TEXTA_AGGREGATION_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+		'LOCATION': os.getenv('TEXTA_AGGREGATION_CACHE_LOCATION', os.path.join(BASE_DIR, 'data', 'aggregation_cache')),
+		'TIMEOUT':  AGGREGATION_CACHE['ttl'],
+		'OPTIONS':  {'MAX_ENTRIES': 10000}
+	}
+}
+
+# Prefix index of fact names and values for autocomplete (utils/fact_index.py), kept by every process per index set.
+# Only the max_fact_names most frequent names and max_values_per_fact most frequent values of each name are indexed,
+# lookups which may miss less frequent ones fall back to an aggregation, as do the lookups before the first snapshot is built
+# in the background. A snapshot is rebuilt after the facts of its indices may have changed, at most every
+# min_refresh_interval seconds, or when it is older than ttl seconds.
+FACT_AUTOCOMPLETE = {
+	'enabled':              ast.literal_eval(str(os.getenv('TEXTA_FACT_AUTOCOMPLETE_ENABLED', True))),
+	'max_fact_names':       500,
+	'max_values_per_fact':  5000,
+	'min_refresh_interval': 30,
+	'ttl':                  int(os.getenv('TEXTA_FACT_AUTOCOMPLETE_TTL', 3600))
+}
+
+# Searcher fact graph (utils/fact_manager.py). Cooccurrences of the graph's facts are counted with adjacency matrix
+# aggregations of at most max_adjacency_filters filters, which must not exceed index.max_adjacency_matrix_filters.
+# Only the max_links most cooccurring pairs are drawn.
+FACT_GRAPH = {
+	'max_adjacency_filters': 100,
+	'max_links':             int(os.getenv('TEXTA_FACT_GRAPH_MAX_LINKS', 1000))
+}
+
+# Fact adding and deletion of the management tasks (task_manager/tasks/workers/management_workers/fact_mutator.py).
+# Documents which are read for their new facts are scrolled in slices, one thread per slice, and every page is
+# sent as one bulk request. Server-side fact removal is polled every poll_interval seconds for its progress.
+FACT_MUTATION = {
+	'slices':          int(os.getenv('TEXTA_FACT_MUTATION_SLICES', 4)),
+	'scroll_size':     1000,
+	'scroll_time_out': '10m',
+	'poll_interval':   2
+}
+
+# Term suggestions of the lexicon miner (utils/gensim_wrapper/similarity_backend.py).
+# Similarities of batch_size queries are computed with one matrix product and the top-k is partially sorted.
+# With backend 'annoy' (requires the optional annoy package), models of at least ann_min_vocab words get an
+# approximate nearest neighbour index of ann_trees trees when trained, and most_similar searches the index for
+# ann_candidates times the needed number of words, which are reranked exactly.
+WORD2VEC_SIMILARITY = {
+	'backend':        os.getenv('TEXTA_WORD2VEC_SIMILARITY_BACKEND', 'exact'),
+	'batch_size':     16,
+	'ann_min_vocab':  100000,
+	'ann_trees':      50,
+	'ann_search_k':   -1,
+	'ann_candidates': 2
+}
+
+# Word2vec models loaded by the web processes (utils/model_manager.py).
+# Models are memory mapped from the arrays saved at training time, older models are loaded with gensim.
+# Each process keeps the least recently used models loaded until their size exceeds max_bytes.
+MODEL_STORE = {
+	'max_bytes': int(os.getenv('TEXTA_MODEL_STORE_MAX_BYTES', 4*1024**3))
+}
+
+# Grammar builder tables (grammar_builder/match_store.py).
+# The documents of a search are walked once with a sliced scroll and the ids and match spans of the matching
+# documents are stored in chunks of chunk_size in the cache for ttl seconds. A page request waits at most page_wait
+# seconds for a running walk to reach the page. A walk which has not stored its progress for heartbeat seconds is restarted.
+GRAMMAR_MATCHES = {
+	'cache':           AGGREGATION_CACHE['cache'],
+	'ttl':             3600,
+	'chunk_size':      500,
+	'slices':          int(os.getenv('TEXTA_GRAMMAR_MATCHES_SLICES', 2)),
+	'scroll_size':     500,
+	'scroll_time_out': '10m',
+	'page_wait':       10,
+	'heartbeat':       60
+}
+
+# Grammar builder exports (grammar_builder/grammar_exporter.py).
+# The documents are read with a sliced scroll and the grammar is matched in a pool of processes, with at most
+# pages_in_flight pages of scroll_size documents submitted to the pool. With processes set to 1 the grammar is
+# matched in the task's process.
+GRAMMAR_EXPORT = {
+	'processes':       int(os.getenv('TEXTA_GRAMMAR_EXPORT_PROCESSES', 2)),
+	'pages_in_flight': 4,
+	'slices':          int(os.getenv('TEXTA_GRAMMAR_EXPORT_SLICES', 2)),
+	'scroll_size':     500,
+	'scroll_time_out': '10m'
+}
+
+# Searcher document export (searcher/view_functions/general/document_exporter.py).
+# Unsorted exports of all the documents are read with a sliced scroll, one thread per slice.
+SEARCHER_EXPORT = {
+	'slices':                 int(os.getenv('TEXTA_EXPORT_SLICES', 4)),
+	'scroll_size':            1000,
+	'scroll_time_out':        '5m',
+	# Parquet row groups are kept in memory until written
+	'parquet_row_group_size': 50000
+}
+
+# Scroll cursors of the public search API (search_api/elastic/scroll_manager.py).
+# Clients get opaque cursors instead of Elasticsearch scroll IDs. A cursor expires when it has not been
+# continued within its keep-alive, which clients may choose up to max_keep_alive.
+SEARCH_API_SCROLL = {
+	'default_keep_alive':   '1m',
+	'max_keep_alive':       '10m',
+	'max_cursors_per_user': int(os.getenv('TEXTA_SEARCH_API_MAX_CURSORS', 10)),
+	# Page size of the NDJSON stream of a whole result set
+	'stream_page_size':     1000
+}
+
 # Get MLP URL from environment
 MLP_URL = os.getenv('TEXTA_MLP_URL', 'http://localhost:5000')
 
@@ -325,6 +507,31 @@ DATASET_IMPORTER = {
 	'directory':          os.path.join(BASE_DIR, 'files', 'dataset_importer'),
 	'import_processes':   2,
 	'process_batch_size': 1000,
+	# 'thread' workers suit I/O bound storing, 'process' workers suit CPU heavy document building.
+	'worker_type':        'thread',
+	# Maximum number of read batches waiting for a free worker. Reading pauses when the queue is full.
+	'batch_queue_size':   4,
+	# Minimum number of seconds between processed documents count updates in the database.
+	'progress_interval':  5,
+	# Elasticsearch bulk requests of the storing workers. Chunks are limited both by document count and size in bytes,
+	# chunks rejected with 429 (Too Many Requests) are retried max_retries times with exponential backoff.
+	'elastic_bulk':       {
+		'chunk_size':           500,
+		'max_chunk_bytes':      100 * 1024 * 1024,
+		'max_retries':          5,
+		'initial_backoff':      2,
+		'connection_pool_size': 10
+	},
+	# Source indices of the Elasticsearch reader are read with a sliced scroll, one thread per slice.
+	'elastic_reader':     {
+		'slices':          int(os.getenv('TEXTA_IMPORTER_ELASTIC_SLICES', 4)),
+		'scroll_size':     1000,
+		'scroll_time_out': '10m'
+	},
+	# Column types of spreadsheets are inferred from the first sample_rows rows of a sheet.
+	'excel_reader':       {
+		'sample_rows': 1000
+	},
 	'sync':               {
 		'enabled':             False,
 		'interval_in_seconds': 10,
@@ -0,0 +1,211 @@
+# -*- coding: utf8 -*-
+""" Shared cache of Elasticsearch aggregation results.
+
+Results are stored in the Django cache configured by AGGREGATION_CACHE in texta/settings.py and keyed by
+the index set, the query normalized to the parts affecting aggregations, and the aggregation body.
+Every index has a generation token which is part of the keys of its results. Writing to an index replaces
+its token, so that the results cached before the write are no longer found and expire with their TTL.
+Writes are not refreshed one by one, so a search running before a write becomes searchable may cache a result
+without it under the new token until its TTL. Imports and tasks replace the token once more after refreshing
+the index when they finish. A second token per index changes only on the writes which may
+change its facts, for the snapshots of utils/fact_index.py.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.cache import caches
+
+from texta.settings import AGGREGATION_CACHE, ERROR_LOGGER, es_url
+
+# Search body keys which change the returned hits, but not the aggregations
+HIT_KEYS = {'from', 'size', 'sort', 'highlight', '_source', 'stored_fields', 'docvalue_fields', 'script_fields',
+            'track_scores', 'explain', 'version', 'search_after', 'scroll'}
+
+STAT_KEYS = ('hits', 'misses', 'invalidations')
+
+# Counters of the process not yet added to the shared ones
+_pending_stats = Counter()
+_stats_lock = threading.Lock()
+_stats_flushed = time.time()
+
+
+def _get_cache():
+    return caches[AGGREGATION_CACHE['cache']]
+
+
+def _split_indices(indices):
+    if isinstance(indices, str):
+        indices = indices.split(',')
+    return sorted(set(index.strip() for index in indices if index and index.strip()))
+
+
+def _generation_key(url, index):
+    return 'aggregations:generation:{0}:{1}'.format(url, index)
+
+
+def _fact_generation_key(url, index):
+    return 'aggregations:fact_generation:{0}:{1}'.format(url, index)
+
+
+def _stat_key(stat):
+    return 'aggregations:stats:{0}'.format(stat)
+
+
+def normalize_query(body):
+    """ Removes the parts of a search body which do not affect its aggregations
+    """
+    if not isinstance(body, dict):
+        return body
+    return {key: value for key, value in body.items() if key not in HIT_KEYS and key not in ('aggs', 'aggregations')}
+
+
+def _get_generations(cache, url, indices, key_function=_generation_key):
+    """ Returns the generation tokens of the indices, new tokens are assigned to indices without one
+    """
+    keys = [key_function(url, index) for index in indices]
+    generations = cache.get_many(keys)
+
+    for key in keys:
+        if key not in generations:
+            # Another process may have assigned a token in the meantime
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            generations[key] = cache.get(key)
+
+    return [generations[key] for key in keys]
+
+
+def get_generations(indices, url=None):
+    """ Returns the generation tokens of the indices, which change whenever the indices are written to,
+    or None if the cache is disabled
+    """
+    if not AGGREGATION_CACHE['enabled']:
+        return None
+    return tuple(_get_generations(_get_cache(), url if url else es_url, _split_indices(indices)))
+
+
+def get_fact_generations(indices, url=None):
+    """ Returns the tokens of the indices which change whenever their facts may have changed,
+    or None if the cache is disabled
+    """
+    if not AGGREGATION_CACHE['enabled']:
+        return None
+    return tuple(_get_generations(_get_cache(), url if url else es_url, _split_indices(indices), key_function=_fact_generation_key))
+
+
+def _make_key(url, indices, body, aggs, generations):
+    content = json.dumps([url, indices, normalize_query(body), aggs, generations], sort_keys=True, separators=(',', ':'), default=str)
+    return 'aggregations:result:{0}'.format(hashlib.sha1(content.encode('utf8')).hexdigest())
+
+
+def _count(cache, stat):
+    """ Counts in process memory, the counters are added to the shared ones every stats_flush_interval seconds,
+    as every write to the file based cache writes a file and may scan its directory
+    """
+    with _stats_lock:
+        _pending_stats[stat] += 1
+        if time.time() - _stats_flushed < AGGREGATION_CACHE['stats_flush_interval']:
+            return
+    _flush_stats(cache)
+
+
+def _flush_stats(cache):
+    global _stats_flushed
+
+    with _stats_lock:
+        pending = dict(_pending_stats)
+        _pending_stats.clear()
+        _stats_flushed = time.time()
+
+    for stat, count in pending.items():
+        key = _stat_key(stat)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key, count)
+        except ValueError:
+            # The counter was culled between add and incr
+            pass
+
+
+def get_or_compute(indices, body, compute, aggs=None, url=None):
+    """ Returns the cached aggregation result of the search, computing and storing it on a miss
+
+    :param indices: comma separated string or list of the searched indices.
+    :param body: search body, or any JSON serializable description of the searches if compute runs several.
+    :param compute: function without arguments returning the result, which must be JSON serializable.
+    :param aggs: aggregation body, taken from body if not given.
+    :param url: Elasticsearch URL, defaults to es_url.
+    """
+    if not AGGREGATION_CACHE['enabled']:
+        return compute()
+
+    url = url if url else es_url
+    if aggs is None and isinstance(body, dict):
+        aggs = body.get('aggs', body.get('aggregations'))
+
+    try:
+        cache = _get_cache()
+        indices = _split_indices(indices)
+        key = _make_key(url, indices, body, aggs, _get_generations(cache, url, indices))
+        result = cache.get(key)
+    except Exception as e:
+        # A broken cache must not break searching
+        logging.getLogger(ERROR_LOGGER).exception(e)
+        return compute()
+
+    if result is not None:
+        _count(cache, 'hits')
+        return result
+
+    _count(cache, 'misses')
+    result = compute()
+    if result is not None:
+        cache.set(key, result, timeout=AGGREGATION_CACHE['ttl'])
+    return result
+
+
+def invalidate_indices(indices, url=None, facts=True):
+    """ Drops the cached results of every index set containing any of the indices
+
+    :param facts: whether the write may have changed the facts of the indices.
+    """
+    if not AGGREGATION_CACHE['enabled']:
+        return
+
+    url = url if url else es_url
+    indices = _split_indices(indices)
+    if not indices:
+        return
+
+    try:
+        cache = _get_cache()
+        generations = {_generation_key(url, index): uuid.uuid4().hex for index in indices}
+        if facts:
+            generations.update({_fact_generation_key(url, index): uuid.uuid4().hex for index in indices})
+        cache.set_many(generations, timeout=None)
+        _count(cache, 'invalidations')
+    except Exception as e:
+        logging.getLogger(ERROR_LOGGER).exception(e)
+
+
+def get_stats():
+    """ Returns the hit, miss and invalidation counters and the hit ratio of the cache
+    """
+    cache = _get_cache()
+    # The counters of other processes are included up to their latest flush
+    _flush_stats(cache)
+    counters = cache.get_many([_stat_key(stat) for stat in STAT_KEYS])
+    stats = {stat: counters.get(_stat_key(stat), 0) for stat in STAT_KEYS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _pending_stats.clear()
+    _get_cache().delete_many([_stat_key(stat) for stat in STAT_KEYS])
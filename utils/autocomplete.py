@@ -1,7 +1,11 @@
+from collections import defaultdict
+
 from conceptualiser.models import Term, TermConcept
 from lexicon_miner.models import Lexicon
+from texta.settings import FACT_AUTOCOMPLETE
 from utils.datasets import Datasets
 from utils.es_manager import ES_Manager
+from utils.fact_index import FactIndex
 
 class Autocomplete:
 
@@ -41,23 +45,38 @@ class Autocomplete:
         return suggestions
 
     def _get_facts(self, agg_subfield, lookup_type, key_constraint=None):
+        if FACT_AUTOCOMPLETE['enabled']:
+            fact_index = FactIndex.get(self.es_m)
+            if lookup_type == 'FACT_VAL':
+                keys = fact_index.lookup_values(self.content, self.limit, fact_name=key_constraint)
+            else:
+                keys = fact_index.lookup_names(self.content, self.limit)
+            # None if the index may miss less frequent facts
+            if keys is not None:
+                return [self._format_suggestion(key, key) for key in keys]
+
+        return self._aggregate_facts(agg_subfield, lookup_type, key_constraint=key_constraint)
+
+    def _aggregate_facts(self, agg_subfield, lookup_type, key_constraint=None):
         agg_query = {agg_subfield: {"nested": {"path": "texta_facts"}, "aggs": {agg_subfield: {"terms": {"field": "texta_facts.fact"}, "aggs": {"fact_values": {"terms": {"field": "texta_facts.str_val", "size": self.limit, "include": "{0}.*".format(self.content)}}}}}}}
 
         self.es_m.build('')
         self.es_m.set_query_parameter("aggs", agg_query)
 
+        aggregations = self.es_m.search_aggregations()
+
         if lookup_type == 'FACT_VAL' and key_constraint:
             facts = []
-            for bucket in self.es_m.search()["aggregations"][agg_subfield][agg_subfield]["buckets"]:
+            for bucket in aggregations[agg_subfield][agg_subfield]["buckets"]:
                 if bucket["key"] == key_constraint:
                     facts += [self._format_suggestion(sub_bucket["key"], sub_bucket["key"]) for sub_bucket in bucket["fact_values"]["buckets"]]
 
         elif lookup_type == 'FACT_VAL' and not key_constraint:
             facts = []
-            for bucket in self.es_m.search()["aggregations"][agg_subfield][agg_subfield]["buckets"]:
+            for bucket in aggregations[agg_subfield][agg_subfield]["buckets"]:
                 facts += [self._format_suggestion(sub_bucket["key"], sub_bucket["key"]) for sub_bucket in bucket["fact_values"]["buckets"]]
         else:
-            facts = [self._format_suggestion(a["key"],a["key"]) for a in self.es_m.search()["aggregations"][agg_subfield][agg_subfield]["buckets"]]
+            facts = [self._format_suggestion(a["key"],a["key"]) for a in aggregations[agg_subfield][agg_subfield]["buckets"]]
 
         return facts
 
@@ -65,10 +84,15 @@ class Autocomplete:
         concepts = []
 
         if len(self.content) > 0:
-            terms = Term.objects.filter(term__startswith=self.content).filter(author=self.user)
+            terms = list(Term.objects.filter(term__startswith=self.content).filter(author=self.user)[:self.limit])
+            # Concepts of all the terms with their descriptive terms in a single query
+            term_concepts = defaultdict(list)
+            for term_concept in TermConcept.objects.filter(term__in=terms).select_related('concept__descriptive_term'):
+                term_concepts[term_concept.term_id].append(term_concept)
+
             seen = {}
-            for term in terms[:self.limit]:
-                for term_concept in TermConcept.objects.filter(term=term.pk):
+            for term in terms:
+                for term_concept in term_concepts[term.pk]:
                     concept = term_concept.concept
                     concept_term = (concept.pk,term.term)
 
@@ -87,7 +111,7 @@ class Autocomplete:
         suggested_lexicons = []
 
         if len(self.content) > 0:
-            lexicons = Lexicon.objects.filter(name__startswith=self.content).filter(author=self.user)
+            lexicons = Lexicon.objects.filter(name__startswith=self.content).filter(author=self.user).only('pk', 'name')[:self.limit]
             for lexicon in lexicons:
                 display_term = lexicon.name.replace(self.content,'<font color="red">'+self.content+'</font>')
                 display_text = '<b>{0}</b>@L{1}-{2}'.format(display_term,lexicon.pk,lexicon.name)
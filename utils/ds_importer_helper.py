@@ -1,8 +1,8 @@
-import requests
+from utils.es_transport import get_session
 
 
 def check_for_analyzer(display_name: str, analyzer_name: str, es_url):
-    response = requests.get(url="{}/_analyze".format(es_url), json={
+    response = get_session().get(url="{}/_analyze".format(es_url), json={
         "analyzer": analyzer_name,
         "text": ["this is a test", "the second text"]
     })
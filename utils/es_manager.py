@@ -1,24 +1,35 @@
 # -*- coding: utf8 -*-
+import copy
 import datetime
 import json
 import logging
+import time
+from threading import Lock
 from functools import reduce
 from typing import Dict, List
 
 import elasticsearch
-import requests
-from elasticsearch import Elasticsearch, ElasticsearchException
+from elasticsearch import ElasticsearchException
 from elasticsearch_dsl import A, Search
 from elasticsearch_dsl.query import MoreLikeThis, Q
 
 from permission_admin.models import Dataset
-from texta.settings import ERROR_LOGGER, FACT_FIELD, date_format, es_ldap_password, es_ldap_user, es_prefix, es_url, es_use_ldap
+from texta.settings import ERROR_LOGGER, FACT_FIELD, date_format, es_mapping_cache_ttl, es_prefix, es_readonly_check_ttl, es_url
+from utils import aggregation_cache
 from utils.ds_importer_helper import check_for_analyzer
+from utils.es_transport import SharedSession, get_client
 from utils.query_builder import QueryBuilder
 
 # Need to update index.max_inner_result_window to increase
 HEADERS = {'Content-Type': 'application/json'}
 
+# Process-level caches shared by all ES_Manager instances.
+# Mapping cache: (es_url, index_string, key) -> (timestamp, value)
+# Read-only checks: (es_url, index_string) -> timestamp of the last cleared block
+_MAPPING_CACHE = {}
+_READONLY_CHECKS = {}
+_CACHE_LOCK = Lock()
+
 
 class ES_Manager:
     """ Manage Elasticsearch operations and interface
@@ -27,19 +38,86 @@ class ES_Manager:
     HEADERS = HEADERS
     TEXTA_RESERVED = [FACT_FIELD]
     TEXTA_META_FIELDS = ['_es_id']
-    # Redefine requests if LDAP authentication is used
-    if es_use_ldap:
-        requests = requests.Session()
-        requests.auth = (es_ldap_user, es_ldap_password)
-    else:
-        requests = requests
+    # Pooled keep-alive session of the process, authenticated if LDAP is used
+    requests = SharedSession()
 
     def __init__(self, active_datasets, url=None):
         self.es_url = url if url else es_url
         self.active_datasets = active_datasets
         self.combined_query = None
         self._facts_map = None
-        self.clear_readonly_block()
+
+    def _get_cached(self, key, compute):
+        """
+        Returns the value of key for the active datasets from the process-level mapping cache,
+        computing and storing it if it is missing or older than es_mapping_cache_ttl seconds.
+        A copy is returned so that callers can not alter the cached value.
+        :param key: Hashable identifier of the cached value.
+        :param compute: Function without arguments that computes the value.
+        """
+        cache_key = (self.es_url, self.stringify_datasets(), key)
+
+        with _CACHE_LOCK:
+            cached = _MAPPING_CACHE.get(cache_key)
+
+        if cached is None or time.time() - cached[0] > es_mapping_cache_ttl:
+            cached = (time.time(), compute())
+            with _CACHE_LOCK:
+                _MAPPING_CACHE[cache_key] = cached
+
+        return copy.deepcopy(cached[1])
+
+    def invalidate_mapping_cache(self):
+        """
+        Removes the cached mapping data of every index set which contains any of the active indices.
+        """
+        indices = set(self.stringify_datasets().split(','))
+
+        with _CACHE_LOCK:
+            for cache_key in list(_MAPPING_CACHE):
+                url, index_string, key = cache_key
+                if url == self.es_url and indices & set(index_string.split(',')):
+                    del _MAPPING_CACHE[cache_key]
+
+    def invalidate_aggregation_cache(self, indices=None, refresh=False, facts=True):
+        """
+        Drops the cached aggregation results of the active indices, or of the given ones.
+        Called after every write to the indices. Writes are not refreshed one by one: results computed before a write
+        becomes searchable may be cached under the new generation until their TTL, so tasks invalidate once more with
+        refresh=True when they finish. Writes which can not change the facts pass facts=False, keeping the fact
+        autocomplete snapshots.
+        """
+        indices = indices if indices else self.stringify_datasets()
+        if refresh:
+            self.refresh_indices(indices)
+        aggregation_cache.invalidate_indices(indices, url=self.es_url, facts=facts)
+
+    def refresh_indices(self, indices=None):
+        """
+        Makes the writes to the active indices, or to the given ones, searchable.
+        """
+        if not isinstance(indices, str):
+            indices = ','.join(sorted(set(indices))) if indices else self.stringify_datasets()
+        return self.plain_post('{0}/{1}/_refresh'.format(self.es_url, indices))
+
+    def ensure_writable(self):
+        """
+        Clears the read-only block of the active indices before writing to them,
+        at most once per es_readonly_check_ttl seconds for every index set.
+        Called by every writer, including the ones writing through plain_post and plain_post_bulk.
+        """
+        check_key = (self.es_url, self.stringify_datasets())
+
+        with _CACHE_LOCK:
+            last_check = _READONLY_CHECKS.get(check_key)
+            if last_check is not None and time.time() - last_check < es_readonly_check_ttl:
+                return
+
+        response = self.clear_readonly_block()
+        # Failed attempts are retried by the next write
+        if isinstance(response, dict) and response.get('acknowledged'):
+            with _CACHE_LOCK:
+                _READONLY_CHECKS[check_key] = time.time()
 
     def stringify_datasets(self) -> str:
         """
@@ -69,6 +147,7 @@ class ES_Manager:
 
     def bulk_post_update_documents(self, documents, ids):
         """Do both plain_post_bulk and update_documents()"""
+        self.ensure_writable()
         data = ''
 
         for i, _id in enumerate(ids):
@@ -81,6 +160,7 @@ class ES_Manager:
 
     def bulk_post_documents(self, documents, ids, document_locations):
         """Do just plain_post_bulk"""
+        self.ensure_writable()
         data = ''
 
         for i, _id in enumerate(ids):
@@ -88,6 +168,8 @@ class ES_Manager:
             data += json.dumps({"doc": documents[i]}) + '\n'
 
         response = self.plain_post_bulk(self.es_url, data)
+        self.invalidate_aggregation_cache([location['_index'] for location in document_locations],
+                                          facts=any(FACT_FIELD in document for document in documents))
 
         return response
 
@@ -99,10 +181,11 @@ class ES_Manager:
         :return: List of indices that matches pattern
         """
         url = "{}/{}/_alias".format(self.es_url, wildcarded_string)
-        response = requests.get(url=url).json()
+        response = self.requests.get(url=url).json()
         return response.keys()
 
     def update_mapping_structure(self, new_field, new_field_properties):
+        self.ensure_writable()
         url = '{0}/{1}/_mappings/'.format(self.es_url, self.stringify_datasets())
         get_response = self.plain_get(url)
 
@@ -117,15 +200,23 @@ class ES_Manager:
                 url = '{0}/{1}/_mapping/{2}'.format(self.es_url, index, mapping)
                 put_response = self.plain_put(url, json.dumps(properties))
 
+        self.invalidate_mapping_cache()
+        self.invalidate_aggregation_cache(facts=new_field == FACT_FIELD)
+
     def update_documents(self):
+        self.ensure_writable()
         response = self.plain_post(
             '{0}/{1}/_update_by_query?refresh&conflicts=proceed'.format(self.es_url, self.stringify_datasets()))
+        # The documents are reindexed from their unchanged sources
+        self.invalidate_aggregation_cache(facts=False)
         return response
 
     def update_documents_by_id(self, ids: List[str]):
+        self.ensure_writable()
         query = json.dumps({"query": {"terms": {"_id": ids}}})
         response = self.plain_post(
             '{0}/{1}/_update_by_query?conflicts=proceed'.format(self.es_url, self.stringify_datasets()), data=query)
+        self.invalidate_aggregation_cache(facts=False)
         return response
 
     def _decode_mapping_structure(self, structure, root_path=list(), nested_layers=list()):
@@ -246,11 +337,14 @@ class ES_Manager:
                 }
 
                 query_header = {'index': active_dataset.index, 'mapping': active_dataset.mapping}
-                query_body = {'query': query, 'aggs': aggs}
+                query_body = {'query': query, 'aggs': aggs, 'size': 0}
                 queries.append(json.dumps(query_header))
                 queries.append(json.dumps(query_body))
 
-        responses = self.plain_multisearch(es_url, queries)
+        return aggregation_cache.get_or_compute(self.stringify_datasets(), {'msearch': queries}, lambda: self._parse_fields_with_facts(self.plain_multisearch(es_url, queries)), url=self.es_url)
+
+    @staticmethod
+    def _parse_fields_with_facts(responses):
         fields_with_facts = {'fact': [], 'fact_str': [], 'fact_num': []}
 
         for response in responses:
@@ -274,7 +368,7 @@ class ES_Manager:
 
     @staticmethod
     def handle_composition_aggregation(search: Search, aggregation_dict: dict, after: dict):
-        s = Search().from_dict(search).using(Elasticsearch(es_url))
+        s = Search().from_dict(search).using(get_client())
         sources = aggregation_dict["sources"]
         size = aggregation_dict.get("size", 10)
 
@@ -289,7 +383,7 @@ class ES_Manager:
     @staticmethod
     def more_like_this(elastic_url, fields: list, like: list, size: int, filters: list, aggregations: list, include: bool, if_agg_only: bool, dataset: Dataset, return_fields=None):
         # Create the base query creator and unite with ES gateway.
-        search = Search(using=Elasticsearch(elastic_url)).index(dataset.index).doc_type(dataset.mapping)
+        search = Search(using=get_client(elastic_url)).index(dataset.index).doc_type(dataset.mapping)
         mlt = MoreLikeThis(like=like, fields=fields, min_term_freq=1, max_query_terms=12, include=include)  # Prepare the MLT part of the query.
 
         paginated_search = search[0:size]  # Set how many documents to return.
@@ -331,6 +425,9 @@ class ES_Manager:
     def get_mapped_fields(self):
         """ Get flat structure of fields from Elasticsearch mappings
         """
+        return self._get_cached('mapped_fields', self._get_mapped_fields)
+
+    def _get_mapped_fields(self):
         mapping_data = {}
 
         if self.active_datasets:
@@ -356,6 +453,9 @@ class ES_Manager:
         """ Get Column names from flat mapping structure
             Returns: sorted list of names
         """
+        return self._get_cached(('column_names', facts), lambda: self._get_column_names(facts))
+
+    def _get_column_names(self, facts):
         mapped_fields = self.get_mapped_fields()
         mapped_fields = [json.loads(field_data) for field_data in list(mapped_fields.keys())]
         if facts:
@@ -433,6 +533,15 @@ class ES_Manager:
         response = self.plain_post(search_url, q)
         return response
 
+    def search_aggregations(self):
+        """ Returns the aggregations of the combined query, which are cached until the active indices are written to
+        """
+        body = copy.deepcopy(self.combined_query['main'])
+        # Hits are not needed
+        body['size'] = 0
+        search_url = '{0}/{1}/_search'.format(es_url, self.stringify_datasets())
+        return aggregation_cache.get_or_compute(self.stringify_datasets(), body, lambda: self.plain_post(search_url, json.dumps(body))['aggregations'], url=self.es_url)
+
     def process_bulk(self, hits):
         data = ''
         for hit in hits:
@@ -442,10 +551,11 @@ class ES_Manager:
     def delete(self, time_out='1m'):
         """ Deletes the selected rows
         """
+        self.ensure_writable()
 
         q = json.dumps(self.combined_query['main'])
         search_url = '{0}/{1}/_search?scroll={2}'.format(es_url, self.stringify_datasets(), time_out)
-        response = requests.post(search_url, data=q, headers=HEADERS).json()
+        response = self.requests.post(search_url, data=q, headers=HEADERS).json()
 
         scroll_id = response['_scroll_id']
         total_hits = response['hits']['total']
@@ -453,7 +563,7 @@ class ES_Manager:
         # Delete initial response
         data = self.process_bulk(response['hits']['hits'])
         delete_url = '{0}/{1}/_bulk'.format(es_url, self.stringify_datasets())
-        deleted = requests.post(delete_url, data=data, headers=HEADERS)
+        deleted = self.requests.post(delete_url, data=data, headers=HEADERS)
 
         while total_hits > 0:
             response = self.scroll(scroll_id=scroll_id, time_out=time_out)
@@ -461,15 +571,17 @@ class ES_Manager:
             scroll_id = response['_scroll_id']
             data = self.process_bulk(response['hits']['hits'])
             delete_url = '{0}/{1}/_bulk'.format(es_url, self.stringify_datasets())
-            deleted = requests.post(delete_url, data=data, headers=HEADERS)
+            deleted = self.requests.post(delete_url, data=data, headers=HEADERS)
+        self.invalidate_aggregation_cache(refresh=True)
         return True
 
     def add_document(self, document):
         """ Indexes given json document
         """
-        document = json.dumps(document)
+        self.ensure_writable()
         url = '{0}/{1}/{2}/'.format(es_url, self.index, self.mapping)
-        response = self.plain_post(url, data=document)
+        response = self.plain_post(url, data=json.dumps(document))
+        self.invalidate_aggregation_cache(facts=FACT_FIELD in document)
         return True
 
     def scroll(self, scroll_id=None, time_out='1m', id_scroll=False, field_scroll=False, size=100, match_all=False):
@@ -642,7 +754,7 @@ class ES_Manager:
         query = {"aggs": {"max_date": {"max": {"field": field}},
                           "min_date": {"min": {"field": field, 'format': 'yyyy-MM-dd'}}}}
         url = "{0}/{1}/_search".format(self.es_url, self.stringify_datasets())
-        response = requests.post(url, data=json.dumps(query), headers=HEADERS).json()
+        response = self.requests.post(url, data=json.dumps(query), headers=HEADERS).json()
         aggs = response["aggregations"]
 
         _min = self._timestamp_to_str(aggs["min_date"]["value"])
@@ -668,6 +780,9 @@ class ES_Manager:
         of all the indices specified. Supports multi-index.
         :return: Mappings of the doc_types.
         """
+        return self._get_cached('mapping_schema', self._get_mapping_schema)
+
+    def _get_mapping_schema(self) -> dict:
         endpoint_url = '{0}/{1}/_mapping'.format(es_url, self.stringify_datasets())
         response = self.plain_get(endpoint_url)
         return response
@@ -685,7 +800,7 @@ class ES_Manager:
 
     @staticmethod
     def single_index_count(index_name: str):
-        es = Elasticsearch(es_url)
+        es = get_client()
         status = es.cat.indices(index=index_name, h="status").strip()
         if status == "open":
             count = Search(using=es, index=index_name).count()
@@ -701,7 +816,7 @@ class ES_Manager:
         :return:
         """
         url_endpoint = "{0}/{1}/_mapping/*/field/*".format(self.es_url, self.stringify_datasets())
-        response = requests.get(url_endpoint).json()
+        response = self.requests.get(url_endpoint).json()
 
         return response
 
@@ -779,7 +894,7 @@ class ES_Manager:
     @staticmethod
     def is_field_text_field(field_name, index_name):
         text_types = ["text", "keyword"]
-        es = Elasticsearch(es_url)
+        es = get_client()
         mapping = es.indices.get_field_mapping(fields=[field_name], index=[index_name])
         field_type = mapping[index_name]["mappings"][index_name][field_name]["mapping"][field_name]["type"]
         return True if field_type in text_types else False
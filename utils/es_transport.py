@@ -0,0 +1,111 @@
+# -*- coding: utf8 -*-
+""" Shared, pooled HTTP transport for Elasticsearch traffic.
+
+Every process keeps one requests.Session and one elasticsearch.Elasticsearch client per URL,
+both of which keep their connections alive between requests. Pool size, timeouts, retries
+and gzip compression are configured with ES_CONNECTION in texta/settings.py.
+"""
+import gzip
+import os
+from threading import Lock
+
+import requests
+from elasticsearch import Elasticsearch
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from texta.settings import ES_CONNECTION, es_ldap_password, es_ldap_user, es_url, es_use_ldap
+
+# Sessions and clients are keyed by process ID, as pooled sockets must not be shared by forked processes.
+_sessions = {}
+_clients = {}
+_lock = Lock()
+
+
+class ElasticHTTPAdapter(HTTPAdapter):
+    """ HTTPAdapter which applies the default timeout and optionally gzips request bodies.
+    """
+
+    def __init__(self, timeout=None, compress=False, **kwargs):
+        self._timeout = timeout
+        self._compress = compress
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self._timeout
+
+        if self._compress and isinstance(request.body, (str, bytes)) and request.body:
+            body = request.body.encode('utf8') if isinstance(request.body, str) else request.body
+            request.body = gzip.compress(body)
+            request.headers['Content-Encoding'] = 'gzip'
+            request.headers['Content-Length'] = str(len(request.body))
+
+        return super().send(request, **kwargs)
+
+
+class SharedSession:
+    """ Descriptor which resolves to the process-wide session, so that it can be
+    used as a drop-in replacement for the requests module in class attributes.
+    """
+
+    def __get__(self, instance, owner):
+        return get_session()
+
+
+def _get_auth():
+    return (es_ldap_user, es_ldap_password) if es_use_ldap else None
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the pooled, keep-alive session of the current process.
+    Idempotent requests and failed connections are retried with backoff.
+    """
+    pid = os.getpid()
+
+    with _lock:
+        if pid not in _sessions:
+            retries = Retry(
+                total=ES_CONNECTION['max_retries'],
+                backoff_factor=ES_CONNECTION['retry_backoff_factor'],
+                status_forcelist=(502, 503, 504)
+            )
+            adapter = ElasticHTTPAdapter(
+                timeout=ES_CONNECTION['timeout'],
+                compress=ES_CONNECTION['http_compress'],
+                pool_connections=ES_CONNECTION['pool_maxsize'],
+                pool_maxsize=ES_CONNECTION['pool_maxsize'],
+                max_retries=retries
+            )
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.auth = _get_auth()
+            _sessions[pid] = session
+
+        return _sessions[pid]
+
+
+def get_client(url=None) -> Elasticsearch:
+    """
+    Returns the pooled elasticsearch client of the current process for the given URL.
+    :param url: Elasticsearch URL, defaults to es_url from the settings.
+    """
+    url = url if url else es_url
+    key = (os.getpid(), url)
+
+    with _lock:
+        if key not in _clients:
+            _clients[key] = Elasticsearch(
+                url,
+                http_auth=_get_auth(),
+                maxsize=ES_CONNECTION['pool_maxsize'],
+                timeout=ES_CONNECTION['timeout'],
+                max_retries=ES_CONNECTION['max_retries'],
+                retry_on_timeout=True,
+                http_compress=ES_CONNECTION['http_compress']
+            )
+
+        return _clients[key]
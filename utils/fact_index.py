@@ -0,0 +1,190 @@
+# -*- coding: utf8 -*-
+""" In-process prefix index of fact names and values, used by autocomplete.
+
+Every process keeps a snapshot per index set, built with a single aggregation over the facts of the indices.
+Names and values are kept in sorted lists with an array of their fact counts, so that a prefix lookup is two
+binary searches and a partial sort of the matching counts. Snapshots are built in the background, lookups
+returning None until the first one is ready, and rebuilt when the facts of their indices may have changed
+(see utils/aggregation_cache.py) or their TTL has passed.
+"""
+import bisect
+import logging
+import threading
+import time
+
+import numpy as np
+
+from texta.settings import ERROR_LOGGER, FACT_AUTOCOMPLETE, FACT_FIELD
+from utils import aggregation_cache
+
+# (es_url, index_string) -> FactIndex
+_indices = {}
+_lock = threading.Lock()
+
+
+def _prefix_end(prefix):
+    """ Returns the smallest string greater than every string starting with the prefix
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PrefixList:
+    """ Sorted strings with counts, returns the most frequent strings starting with a prefix
+    """
+
+    def __init__(self, counts, truncated=False):
+        self.keys = sorted(counts)
+        self.counts = np.array([counts[key] for key in self.keys], dtype=np.int64)
+        # Order of all the keys by count, for lookups without a prefix
+        self.by_count = np.argsort(-self.counts, kind='stable')
+        # Whether less frequent keys were left out of the index
+        self.truncated = truncated
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, prefix, limit):
+        """ Returns (key, count) tuples of the keys starting with the prefix in the descending order of counts
+        """
+        if not prefix:
+            positions = self.by_count[:limit]
+        else:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, _prefix_end(prefix), lo=start)
+            counts = self.counts[start:end]
+            if len(counts) > limit:
+                top = np.argpartition(-counts, limit - 1)[:limit]
+            else:
+                top = np.arange(len(counts))
+            positions = start + top[np.argsort(-counts[top], kind='stable')]
+
+        return [(self.keys[position], int(self.counts[position])) for position in positions]
+
+    def is_complete(self, results, limit):
+        """ Whether the results of a lookup can not miss any keys left out of the index
+        """
+        return not self.truncated or len(results) >= limit
+
+
+class FactIndex:
+    """ Snapshot of the fact names and string values of an index set with their fact counts
+    """
+
+    def __init__(self, es_url, index_string):
+        self.es_url = es_url
+        self.index_string = index_string
+        self.names = PrefixList({})
+        self.values = {}
+        # Time of the last successful build, None until a snapshot is ready
+        self.built = None
+        # Time of the last build attempt, failed builds are retried after min_refresh_interval
+        self.attempted = None
+        self.generations = None
+        self._refreshing = False
+
+    @classmethod
+    def get(cls, es_m):
+        """ Returns the fact index of the ES_Manager's active datasets, starting its build on the first use
+        """
+        key = (es_m.es_url, es_m.stringify_datasets())
+        with _lock:
+            if key not in _indices:
+                _indices[key] = cls(*key)
+            fact_index = _indices[key]
+
+        if fact_index.is_stale():
+            fact_index.refresh_in_background(es_m)
+
+        return fact_index
+
+    @property
+    def ready(self):
+        return self.built is not None
+
+    def build(self, es_m):
+        # Generations are read before searching, so that writes during the search make the snapshot stale
+        generations = aggregation_cache.get_fact_generations(self.index_string, url=self.es_url)
+        aggs = {
+            "facts": {
+                "nested": {"path": FACT_FIELD},
+                "aggs": {
+                    "fact_names": {
+                        "terms": {"field": "{}.fact".format(FACT_FIELD), "size": FACT_AUTOCOMPLETE['max_fact_names']},
+                        "aggs": {"fact_values": {"terms": {"field": "{}.str_val".format(FACT_FIELD), "size": FACT_AUTOCOMPLETE['max_values_per_fact']}}}
+                    }
+                }
+            }
+        }
+        response = es_m.plain_search(self.es_url, self.index_string, {"size": 0, "aggs": aggs})
+        fact_names = response['aggregations']['facts']['fact_names']
+
+        values = {}
+        for bucket in fact_names['buckets']:
+            value_buckets = bucket['fact_values']
+            values[bucket['key']] = PrefixList({value['key']: value['doc_count'] for value in value_buckets['buckets']}, truncated=value_buckets['sum_other_doc_count'] > 0)
+
+        self.names = PrefixList({bucket['key']: bucket['doc_count'] for bucket in fact_names['buckets']}, truncated=fact_names['sum_other_doc_count'] > 0)
+        self.values = values
+        self.generations = generations
+        self.built = time.time()
+
+    def is_stale(self):
+        if self.attempted is None:
+            return True
+        if time.time() - self.attempted < FACT_AUTOCOMPLETE['min_refresh_interval']:
+            return False
+        if not self.ready or time.time() - self.built > FACT_AUTOCOMPLETE['ttl']:
+            return True
+        return aggregation_cache.get_fact_generations(self.index_string, url=self.es_url) != self.generations
+
+    def refresh_in_background(self, es_m):
+        """ Builds the snapshot in a thread, lookups use the previous snapshot meanwhile
+        """
+        with _lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.build(es_m)
+            except Exception as e:
+                logging.getLogger(ERROR_LOGGER).exception(e)
+            finally:
+                self.attempted = time.time()
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def lookup_names(self, prefix, limit):
+        """ Returns the most frequent fact names starting with the prefix, None if the index may miss some of them
+        """
+        if not self.ready:
+            return None
+        results = self.names.lookup(prefix, limit)
+        return [name for name, count in results] if self.names.is_complete(results, limit) else None
+
+    def lookup_values(self, prefix, limit, fact_name=None):
+        """ Returns the most frequent values of the fact, or of each of the limit most frequent facts,
+        starting with the prefix, None if the index may miss some of them
+        """
+        if not self.ready:
+            return None
+        if fact_name:
+            fact_names = [fact_name] if fact_name in self.values else []
+            if not fact_names and self.names.truncated:
+                return None
+        else:
+            fact_names = [name for name, count in self.names.lookup('', limit)]
+
+        # Read once, as the snapshot may be replaced by a refresh meanwhile
+        values = self.values
+        suggestions = []
+        for name in fact_names:
+            if name not in values:
+                return None
+            results = values[name].lookup(prefix, limit)
+            if not values[name].is_complete(results, limit):
+                return None
+            suggestions.extend(value for value, count in results)
+        return suggestions
@@ -3,13 +3,14 @@ import re
 import json
 import logging
 import requests
+import heapq
 import itertools
 import traceback
 from typing import List
 from utils.datasets import Datasets
 from utils.es_manager import ES_Manager
 from utils.log_manager import LogManager
-from texta.settings import FACT_PROPERTIES, ERROR_LOGGER
+from texta.settings import FACT_GRAPH, FACT_PROPERTIES, ERROR_LOGGER
 from task_manager.task_manager import create_task
 from task_manager.tasks.task_types import TaskTypes
 from task_manager.tasks.workers.management_workers.management_task_params import ManagerKeys
@@ -63,9 +64,9 @@ class FactGraph(FactManager):
 
 
     def fact_graph(self):
-        facts, fact_combinations, unique_fact_names = self.facts_via_aggregation(size=self.search_size)
-        # Get cooccurrences and remove values with 0
-        fact_combinations = {k:v for k,v in dict(zip(fact_combinations, self.count_cooccurrences(fact_combinations))).items() if v != 0}
+        facts, unique_fact_names = self.facts_via_aggregation(size=self.search_size)
+        # Only facts which occur together are counted
+        fact_combinations = self.count_cooccurrences(facts)
         types = dict(zip(unique_fact_names, itertools.cycle(self.shapes)))
 
         nodes = []
@@ -83,9 +84,9 @@ class FactGraph(FactManager):
 
         links = []
         max_link_size = 0
-        for fact in fact_combinations.keys():
-            max_link_size = max(max_link_size, fact_combinations[fact])
-            links.append({"source": facts[fact[0][0] + " - " + fact[0][1]]['id'], "target": facts[fact[1][0] + " - " + fact[1][1]]['id'], "count": fact_combinations[fact]})
+        for (source, target), count in fact_combinations.items():
+            max_link_size = max(max_link_size, count)
+            links.append({"source": source, "target": target, "count": count})
 
         graph_data = json.dumps({"nodes": nodes, "links": links})
         return (graph_data, unique_fact_names, max_node_size, max_link_size, min_node_size)
@@ -96,7 +97,6 @@ class FactGraph(FactManager):
             size - [int=15] -- Amount of fact values per fact name to search in query
         Returns:
             facts - [dict] -- Details for each fact, ex: {'PER - kostja': {'id': 0, 'name': 'PER', 'value': 'kostja', 'doc_count': 44}}
-            fact_combinations - [list of tuples] -- All possible combinations of all facts: [(('FIRST_FACTNAME', 'FIRST_FACTVAL'), ('SECOND_FACTNAME', 'SECOND_FACTVAL'))]
             unique_fact_names - [list of string] -- All unique fact names
         """
 
@@ -104,48 +104,65 @@ class FactGraph(FactManager):
         self.es_m.build(self.es_params)
         self.es_m.set_query_parameter('aggs', aggs)
 
-        response = self.es_m.search()
-        response_aggs = response['aggregations']['facts']['fact_names']['buckets']
+        response_aggs = self.es_m.search_aggregations()['facts']['fact_names']['buckets']
 
         facts = {}
-        fact_combinations = []
         fact_count = 0
         unique_fact_names = []
         for bucket in response_aggs:
             unique_fact_names.append(bucket['key'])
             for fact in bucket['fact_values']['buckets']:
                 facts[bucket['key'] + " - " + fact['key']] = {'id': fact_count, 'name': bucket['key'], 'value': fact['key'], 'doc_count': fact['doc_count']}
-                fact_combinations.append((bucket['key'], fact['key']))
                 fact_count += 1
-        fact_combinations = [x for x in itertools.combinations(fact_combinations, 2)]
-        return (facts, fact_combinations, unique_fact_names)
+        return (facts, unique_fact_names)
 
 
-    def count_cooccurrences(self, fact_pairs):
-        """Finds the counts of cooccuring facts
+    def count_cooccurrences(self, facts):
+        """Counts the documents of the dataset containing both facts of every pair of the given facts.
+        All the pairs are counted at once with adjacency matrix aggregations of one filter per fact. If there are
+        more facts than filters allowed in an aggregation, the facts are split into blocks and every pair of blocks
+        is aggregated in the same multi search.
 
         Arguments:
-            fact_pairs {list of tuples of tuples} -- Example:[(('ORG', 'Riigikohus'),('PER', 'Jaan')), (('ORG', 'Riigikohus'),('PER', 'Peeter'))]
+            facts {dict} -- Facts returned by facts_via_aggregation
 
         Returns:
-            [int list] -- Occurances of the given facts
+            [dict] -- Counts of the max_links most cooccurring fact pairs by their fact ids, ex: {(0, 3): 12, (1, 3): 4}
         """
         dataset_str = self.es_m.stringify_datasets()
-        
+        filters = {}
+        for fact in facts.values():
+            constraint = {"nested": {"path": "texta_facts", "query": {"bool":{"must": [{"term": {"texta_facts.fact": fact['name']}}, {"term": {"texta_facts.str_val": fact['value']}}]}}}}
+            filters[str(fact['id'])] = constraint
+
+        fact_ids = list(filters.keys())
+        max_filters = max(FACT_GRAPH['max_adjacency_filters'], 2)
+        if len(fact_ids) <= max_filters:
+            filter_groups = [fact_ids]
+        else:
+            block_size = max_filters // 2
+            blocks = [fact_ids[i:i + block_size] for i in range(0, len(fact_ids), block_size)]
+            filter_groups = [first + second for first, second in itertools.combinations(blocks, 2)]
+
         queries = []
-        for fact_pair in fact_pairs:
-            fact_constraints = []
-            for fact in fact_pair:
-                constraint = {"nested": {"path": "texta_facts", "query": {"bool":{"must": [{"term": {"texta_facts.fact": fact[0]}}, {"term": {"texta_facts.str_val": fact[1]}}]}}}}
-                fact_constraints.append(constraint)
-            query = {"query": {"bool": {"must": fact_constraints}}, "size": 0}
+        for group in filter_groups:
+            query = {"size": 0, "aggs": {"cooccurrences": {"adjacency_matrix": {"filters": {fact_id: filters[fact_id] for fact_id in group}}}}}
             header = {"index": dataset_str}
             queries.append(json.dumps(header))
             queries.append(json.dumps(query))
 
-        responses = self.es_m.perform_queries(queries)
-        counts = [response["hits"]["total"] for response in responses]
-        return counts
+        counts = {}
+        for response in self.es_m.perform_queries(queries):
+            if 'error' in response:
+                raise Exception(response['error'])
+            for bucket in response['aggregations']['cooccurrences']['buckets']:
+                # Buckets of single filters do not contain the separator
+                if '&' in bucket['key']:
+                    pair = tuple(sorted(int(fact_id) for fact_id in bucket['key'].split('&')))
+                    counts[pair] = bucket['doc_count']
+
+        top_pairs = heapq.nlargest(FACT_GRAPH['max_links'], counts.items(), key=lambda item: item[1])
+        return dict(sorted(top_pairs))
 
 
 class FactAdder(FactManager):
@@ -0,0 +1,158 @@
+""" Word2vec models stored as memory mapped arrays.
+
+When a model is trained, its normalized vectors and vocabulary are saved next to the gensim model as .npy files.
+The web processes open them with mmap_mode='r', so that all the processes share the pages of a model instead of
+each loading the model and computing its normalized vectors. The vocabulary is kept as the UTF-8 bytes of the
+words in one array with their offsets, and words are looked up by a binary search over their sorted order.
+
+MappedWord2Vec provides the part of the gensim Word2Vec interface used by MaskedWord2Vec and the views:
+wv.syn0norm, wv.vocab[word].index, wv.vocab[word].count, wv.index2word and init_sims.
+"""
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# Array files of a model, named after the model file
+VECTORS_SUFFIX = '.vectors.npy'
+WORDS_SUFFIX = '.words.npy'
+WORD_OFFSETS_SUFFIX = '.word_offsets.npy'
+WORD_ORDER_SUFFIX = '.word_order.npy'
+WORD_COUNTS_SUFFIX = '.word_counts.npy'
+
+VocabEntry = namedtuple('VocabEntry', ['index', 'count'])
+
+
+def _save_array(path, array):
+    # Written under a temporary name, so that a process never maps a partially written file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
+
+
+def save_mapped(word2vec_model, model_path):
+    """ Saves the normalized vectors and the vocabulary of a trained gensim model next to the model file
+    """
+    word2vec_model.init_sims()
+    encoded_words = [word.encode('utf8') for word in word2vec_model.wv.index2word]
+
+    offsets = np.zeros(len(encoded_words) + 1, dtype=np.int64)
+    np.cumsum([len(word) for word in encoded_words], out=offsets[1:])
+    order = np.array(sorted(range(len(encoded_words)), key=encoded_words.__getitem__), dtype=np.int64)
+
+    _save_array(model_path + WORDS_SUFFIX, np.frombuffer(b''.join(encoded_words), dtype=np.uint8))
+    _save_array(model_path + WORD_OFFSETS_SUFFIX, offsets)
+    _save_array(model_path + WORD_ORDER_SUFFIX, order)
+    _save_array(model_path + WORD_COUNTS_SUFFIX, np.array([word2vec_model.wv.vocab[word].count for word in word2vec_model.wv.index2word], dtype=np.int64))
+    # Saved last, as its existence marks the model as mappable
+    _save_array(model_path + VECTORS_SUFFIX, np.asarray(word2vec_model.wv.syn0norm, dtype=np.float32))
+
+
+def is_mapped(model_path):
+    # Models mapped before the word counts were saved are loaded with gensim
+    return os.path.exists(model_path + VECTORS_SUFFIX) and os.path.exists(model_path + WORD_COUNTS_SUFFIX)
+
+
+class WordList(object):
+    """ Words of the vocabulary by their index, read from the mapped UTF-8 bytes
+    """
+
+    def __init__(self, words, offsets):
+        self._words = words
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('word index out of range')
+        return self.get_bytes(index).decode('utf8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def get_bytes(self, index):
+        return self._words[self._offsets[index]:self._offsets[index + 1]].tobytes()
+
+
+class Vocabulary(object):
+    """ Maps words to VocabEntry tuples of their index and count, like the vocab dict of gensim models
+    """
+
+    def __init__(self, word_list, order, counts):
+        self._word_list = word_list
+        self._order = order
+        self._counts = counts
+
+    def __len__(self):
+        return len(self._word_list)
+
+    def __contains__(self, word):
+        return self.get_index(word) is not None
+
+    def __getitem__(self, word):
+        index = self.get_index(word)
+        if index is None:
+            raise KeyError(word)
+        return self._get_entry(index)
+
+    def get(self, word, default=None):
+        index = self.get_index(word)
+        return self._get_entry(index) if index is not None else default
+
+    def _get_entry(self, index):
+        return VocabEntry(index, int(self._counts[index]))
+
+    def __iter__(self):
+        return iter(self._word_list)
+
+    def get_index(self, word):
+        """ Returns the index of the word, None if it is not in the vocabulary
+        """
+        if not isinstance(word, str):
+            return None
+        encoded = word.encode('utf8')
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._word_list.get_bytes(self._order[middle]) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._order) and self._word_list.get_bytes(self._order[low]) == encoded:
+            return int(self._order[low])
+        return None
+
+
+class MappedVectors(object):
+
+    def __init__(self, vectors, vocab, index2word):
+        self.syn0norm = vectors
+        self.vocab = vocab
+        self.index2word = index2word
+
+
+class MappedWord2Vec(object):
+    """ Read-only word2vec model of the arrays saved by save_mapped
+    """
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        vectors = np.load(model_path + VECTORS_SUFFIX, mmap_mode='r')
+        words = np.load(model_path + WORDS_SUFFIX, mmap_mode='r')
+        offsets = np.load(model_path + WORD_OFFSETS_SUFFIX, mmap_mode='r')
+        order = np.load(model_path + WORD_ORDER_SUFFIX, mmap_mode='r')
+        counts = np.load(model_path + WORD_COUNTS_SUFFIX, mmap_mode='r')
+
+        index2word = WordList(words, offsets)
+        self.wv = MappedVectors(vectors, Vocabulary(index2word, order, counts), index2word)
+        self.nbytes = vectors.nbytes + words.nbytes + offsets.nbytes + order.nbytes + counts.nbytes
+
+    def init_sims(self):
+        # The vectors are saved normalized
+        pass
@@ -4,13 +4,24 @@ import numpy as np
 from six import string_types
 import gensim
 
+from .similarity_backend import get_backend, select_top_k
+from texta.settings import WORD2VEC_SIMILARITY
+
 class MaskedWord2Vec(object):
 
-    def __init__(self,word2vec_model):
+    def __init__(self,word2vec_model,ann_index_path=None):
         self.model = word2vec_model
         self.vocab = word2vec_model.wv.vocab
-    
-    def most_similar(self, positive=[], negative=[], topn=10, ignored_idxes=[], ignored_dist = -999999):
+        self.ann_index_path = ann_index_path
+        self._backend = None
+
+    def get_backend(self):
+        if self._backend is None:
+            self.model.init_sims()
+            self._backend = get_backend(self.model.wv.syn0norm, self.ann_index_path)
+        return self._backend
+
+    def most_similar(self, positive=[], negative=[], topn=10, ignored_idxes=[]):
         """
         Find the top-N most similar words. Positive words contribute positively towards the
         similarity, negative words negatively.
@@ -23,6 +34,29 @@ class MaskedWord2Vec(object):
         """
         self.model.init_sims()
 
+        mean, all_words = self._get_mean(positive, negative)
+        if not topn:
+            return np.dot(self.model.wv.syn0norm, mean)
+        return self._top_words(self.get_backend().top_k(mean[np.newaxis], topn + len(all_words), [ignored_idxes])[0], all_words, topn)
+
+    def most_similar_batch(self, positives, topn=10, ignored_idxes=[], extra_ignored_idxes=None):
+        """
+        Runs most_similar for each list of positive words in positives, the similarities of all the queries are
+        computed together.
+        :param ignored_idxes: indices ignored by all the queries.
+        :param extra_ignored_idxes: indices ignored additionally by each query.
+        :return: list of most_similar results.
+        """
+        self.model.init_sims()
+
+        means, all_words_list = zip(*[self._get_mean(positive, []) for positive in positives]) if positives else ([], [])
+        if not means:
+            return []
+        k = topn + max(len(all_words) for all_words in all_words_list)
+        top_k = self.get_backend().top_k(np.array(means), k, self._get_ignored_list(len(means), ignored_idxes, extra_ignored_idxes))
+        return [self._top_words(top, all_words, topn) for top, all_words in zip(top_k, all_words_list)]
+
+    def _get_mean(self, positive, negative):
         if isinstance(positive, string_types) and not negative:
             # allow calls like most_similar('dog'), as a shorthand for most_similar(['dog'])
             positive = [positive]
@@ -46,16 +80,21 @@ class MaskedWord2Vec(object):
         if not mean:
             raise ValueError("cannot compute similarity with no input")
         mean = gensim.matutils.unitvec(np.array(mean).mean(axis=0)).astype(np.float32)
-        dists = np.dot(self.model.wv.syn0norm, mean)
-        if not topn:
-            return dists
-        dists[ignored_idxes] = ignored_dist
-        best = np.argsort(dists)[::-1][:topn + len(all_words)]
+        return mean, all_words
+
+    @staticmethod
+    def _get_ignored_list(n_queries, ignored_idxes, extra_ignored_idxes):
+        if extra_ignored_idxes is None:
+            return [ignored_idxes] * n_queries
+        return [list(ignored_idxes) + list(extra) for extra in extra_ignored_idxes]
+
+    def _top_words(self, top, all_words, topn):
+        best, dists = top
         # ignore (don't return) words from the input
-        result = [(self.model.wv.index2word[sim], float(dists[sim])) for sim in best if sim not in all_words]
+        result = [(self.model.wv.index2word[sim], float(dist)) for sim, dist in zip(best, dists) if sim not in all_words]
         return result[:topn]
 
-    def most_similar_cosmul(self, positive=[], negative=[], topn=10, ignored_idxes=[], ignored_dist = -999999):
+    def most_similar_cosmul(self, positive=[], negative=[], topn=10, ignored_idxes=[]):
         """
         Find the top-N most similar words, using the multiplicative combination objective
         proposed by Omer Levy and Yoav Goldberg in [4]_. Positive words still contribute
@@ -79,6 +118,45 @@ class MaskedWord2Vec(object):
         """
         self.model.init_sims()
 
+        positive, negative, all_words = self._get_terms(positive, negative)
+        dists = self._cosmul_dists(np.dot(self.model.wv.syn0norm, np.array(positive + negative).T), len(positive))
+
+        if not topn:
+            return dists
+        return self._top_words(select_top_k(dists, topn + len(all_words), ignored_idxes), all_words, topn)
+
+    def most_similar_cosmul_batch(self, positives, topn=10, ignored_idxes=[], extra_ignored_idxes=None):
+        """
+        Runs most_similar_cosmul for each list of positive words in positives, the similarities of the queries'
+        words are computed with a matrix product per batch of queries.
+        :param ignored_idxes: indices ignored by all the queries.
+        :param extra_ignored_idxes: indices ignored additionally by each query.
+        :return: list of most_similar_cosmul results.
+        """
+        self.model.init_sims()
+
+        queries = [self._get_terms(positive, []) for positive in positives]
+        ignored_list = self._get_ignored_list(len(queries), ignored_idxes, extra_ignored_idxes)
+        results = []
+
+        batch = []
+        for i, query in enumerate(queries):
+            batch.append(query)
+            n_terms = sum(len(terms) for terms, _, _ in batch)
+            if i + 1 < len(queries) and n_terms + len(queries[i + 1][0]) <= WORD2VEC_SIMILARITY['batch_size']:
+                continue
+
+            sims = np.dot(self.model.wv.syn0norm, np.array([term for terms, _, _ in batch for term in terms]).T)
+            column = 0
+            for terms, _, all_words in batch:
+                dists = self._cosmul_dists(sims[:, column:column + len(terms)], len(terms))
+                column += len(terms)
+                results.append(self._top_words(select_top_k(dists, topn + len(all_words), ignored_list[len(results)]), all_words, topn))
+            batch = []
+
+        return results
+
+    def _get_terms(self, positive, negative):
         if isinstance(positive, string_types) and not negative:
             # allow calls like most_similar_cosmul('dog'), as a shorthand for most_similar_cosmul(['dog'])
             positive = [positive]
@@ -98,17 +176,12 @@ class MaskedWord2Vec(object):
         negative = [word_vec(word) for word in negative]
         if not positive:
             raise ValueError("cannot compute similarity with no input")
+        return positive, negative, all_words
 
+    @staticmethod
+    def _cosmul_dists(sims, n_positive):
         # equation (4) of Levy & Goldberg "Linguistic Regularities...",
         # with distances shifted to [0,1] per footnote (7)
-        pos_dists = [((1 + np.dot(self.model.wv.syn0norm, term)) / 2) for term in positive]
-        neg_dists = [((1 + np.dot(self.model.wv.syn0norm, term)) / 2) for term in negative]
-        dists = np.prod(pos_dists, axis=0) / (np.prod(neg_dists, axis=0) + 0.000001)
-
-        if not topn:
-            return dists
-        dists[ignored_idxes] = ignored_dist
-        best = np.argsort(dists)[::-1][:topn + len(all_words)]
-        # ignore (don't return) words from the input
-        result = [(self.model.wv.index2word[sim], float(dists[sim])) for sim in best if sim not in all_words]
-        return result[:topn]
+        pos_dists = (1 + sims[:, :n_positive]) / 2
+        neg_dists = (1 + sims[:, n_positive:]) / 2
+        return np.prod(pos_dists, axis=1) / (np.prod(neg_dists, axis=1) + 0.000001)
@@ -0,0 +1,133 @@
+""" Nearest neighbour search over the normalized word vectors of MaskedWord2Vec.
+
+ExactBackend computes the cosine similarities of several queries with one matrix product and selects the top-k
+with a partial sort, instead of sorting the whole vocabulary per query. AnnoyBackend searches an approximate
+nearest neighbour index built next to the model at training time and reranks the candidates exactly. Annoy is an
+optional dependency, models without an index or without the package installed use the exact search.
+"""
+import logging
+import os
+
+import numpy as np
+
+from texta.settings import ERROR_LOGGER, WORD2VEC_SIMILARITY
+
+try:
+    from annoy import AnnoyIndex
+except ImportError:
+    AnnoyIndex = None
+
+
+def get_ann_index_path(model_path):
+    # Model files share the model_<unique_id> prefix, so the index is exported and deleted with the model
+    return model_path + '.annoy'
+
+
+def build_ann_index(word2vec_model, model_path):
+    """ Builds the approximate nearest neighbour index of a trained model, if the annoy backend is enabled
+
+    :return: path of the index, None if no index was built.
+    """
+    if WORD2VEC_SIMILARITY['backend'] != 'annoy' or len(word2vec_model.wv.vocab) < WORD2VEC_SIMILARITY['ann_min_vocab']:
+        return None
+    if AnnoyIndex is None:
+        logging.getLogger(ERROR_LOGGER).error('The annoy package is not installed, the similarity index of the model was not built.')
+        return None
+
+    word2vec_model.init_sims()
+    vectors = word2vec_model.wv.syn0norm
+    index = AnnoyIndex(vectors.shape[1], 'angular')
+    for i, vector in enumerate(vectors):
+        index.add_item(i, vector)
+    index.build(WORD2VEC_SIMILARITY['ann_trees'])
+
+    index_path = get_ann_index_path(model_path)
+    index.save(index_path)
+    return index_path
+
+
+def get_backend(vectors, ann_index_path=None):
+    """ Returns the backend of the normalized vectors, using the index at ann_index_path if there is one
+    """
+    if WORD2VEC_SIMILARITY['backend'] == 'annoy' and AnnoyIndex is not None and ann_index_path and os.path.exists(ann_index_path):
+        try:
+            return AnnoyBackend(vectors, ann_index_path)
+        except Exception:
+            logging.getLogger(ERROR_LOGGER).exception('Loading the similarity index {} failed, using exact search.'.format(ann_index_path))
+    return ExactBackend(vectors)
+
+
+class ExactBackend(object):
+    """ Exact top-k cosine similarity search
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def similarities(self, queries):
+        """ Yields the (vocabulary size, number of queries) similarity matrices of consecutive batches of queries
+        """
+        for start in range(0, len(queries), WORD2VEC_SIMILARITY['batch_size']):
+            yield np.dot(self.vectors, queries[start:start + WORD2VEC_SIMILARITY['batch_size']].T)
+
+    def top_k(self, queries, k, ignored_idxes_list):
+        """ Returns the (indices, similarities) of the k most similar vectors of every query, in descending order
+
+        :param queries: (number of queries, dimensions) array of unit vectors.
+        :param ignored_idxes_list: indices excluded from the results, per query.
+        """
+        results = []
+        batches = self.similarities(queries)
+        for dists_batch in batches:
+            for column in range(dists_batch.shape[1]):
+                dists = dists_batch[:, column]
+                results.append(select_top_k(dists, k, ignored_idxes_list[len(results)]))
+        return results
+
+
+def select_top_k(dists, k, ignored_idxes=()):
+    """ Returns the (indices, similarities) of the k largest similarities, in descending order, without the ignored indices
+
+    The similarities of the ignored indices are overwritten.
+    """
+    if len(ignored_idxes):
+        dists[ignored_idxes] = -np.inf
+    k = min(k, len(dists))
+    if k < len(dists):
+        best = np.argpartition(-dists, k - 1)[:k]
+    else:
+        best = np.arange(len(dists))
+    best = best[np.argsort(-dists[best], kind='stable')]
+    best = best[dists[best] > -np.inf]
+    return best, dists[best]
+
+
+class AnnoyBackend(ExactBackend):
+    """ Approximate top-k search with an annoy index, the candidates of the index are reranked by their exact similarity
+    """
+
+    def __init__(self, vectors, index_path):
+        super(AnnoyBackend, self).__init__(vectors)
+        self.index = AnnoyIndex(vectors.shape[1], 'angular')
+        # Memory mapped, shared by the processes using the model
+        self.index.load(index_path)
+
+    def top_k(self, queries, k, ignored_idxes_list):
+        return [self._query(query, k, ignored_idxes) for query, ignored_idxes in zip(queries, ignored_idxes_list)]
+
+    def _query(self, query, k, ignored_idxes):
+        ignored = set(ignored_idxes)
+        n_candidates = (k + len(ignored)) * WORD2VEC_SIMILARITY['ann_candidates']
+
+        while True:
+            candidates = self.index.get_nns_by_vector(query, n_candidates, search_k=WORD2VEC_SIMILARITY['ann_search_k'])
+            candidates = np.array([candidate for candidate in candidates if candidate not in ignored], dtype=np.int64)
+            # The index returns fewer candidates than asked only if it has no more
+            if len(candidates) >= k or n_candidates >= len(self.vectors):
+                break
+            n_candidates = min(n_candidates * 2, len(self.vectors))
+
+        if not len(candidates):
+            return candidates, np.zeros(0, dtype=self.vectors.dtype)
+        best, dists = select_top_k(np.dot(self.vectors[candidates], query), k)
+        return candidates[best], dists
@@ -8,8 +8,10 @@ import gensim
 import traceback
 
 from .gensim_wrapper.masked_word2vec import MaskedWord2Vec
+from .gensim_wrapper.similarity_backend import get_ann_index_path
+from .gensim_wrapper.mapped_word2vec import MappedWord2Vec, is_mapped
 
-from texta.settings import USER_MODELS, MODELS_DIR
+from texta.settings import USER_MODELS, MODELS_DIR, MODEL_STORE
 import logging
 from texta.settings import ERROR_LOGGER
 from task_manager.tasks.task_types import TaskTypes
@@ -27,8 +29,9 @@ class NegativesEntry:
 
 class ModelEntry:
 
-    def __init__(self,model):
+    def __init__(self,model,nbytes):
         self.model = model
+        self.nbytes = nbytes
         self.access_time = time()
 
 class ModelManager(threading.Thread):
@@ -110,7 +113,8 @@ class ModelManager(threading.Thread):
             if model_uuid not in self._models:
                 model_path = os.path.join(MODELS_DIR,TaskTypes.TRAIN_MODEL, "model_%s"%model_uuid)
                 if os.path.exists(model_path):
-                    self._models[model_uuid] = ModelEntry(MaskedWord2Vec(gensim.models.Word2Vec.load(model_path)))
+                    self._models[model_uuid] = self._load_model(model_path)
+                    self._evict_models(model_uuid)
                 else:
                     log_dict = {'task': 'get_model', 'event': 'model_path does not exist!', 'arguments': {'model_uuid': model_uuid, 'model_path': model_path}}
                     logging.getLogger(ERROR_LOGGER).error("Model path does not exist", extra=log_dict)
@@ -118,6 +122,24 @@ class ModelManager(threading.Thread):
             self._models[model_uuid].access_time = time()
             return self._models[model_uuid].model
 
+    def _load_model(self,model_path):
+        if is_mapped(model_path):
+            # Shared with the other processes through the page cache
+            model = MappedWord2Vec(model_path)
+            nbytes = model.nbytes
+        else:
+            # Models trained before the arrays were saved
+            model = gensim.models.Word2Vec.load(model_path)
+            # The vectors, their normalized copy and the output weights
+            nbytes = 2*model.wv.syn0.nbytes + sum(getattr(model,weights).nbytes for weights in ('syn1','syn1neg') if hasattr(model,weights))
+        return ModelEntry(MaskedWord2Vec(model, ann_index_path=get_ann_index_path(model_path)),nbytes)
+
+    def _evict_models(self,keep_uuid):
+        # Least recently used models are removed until the loaded models fit in max_bytes
+        while sum(entry.nbytes for entry in self._models.values()) > MODEL_STORE['max_bytes'] and len(self._models) > 1:
+            model_uuid = min((entry.access_time,model_uuid) for model_uuid,entry in self._models.items() if model_uuid != keep_uuid)[1]
+            del self._models[model_uuid]
+
 
 
     def get_negatives(self,model_name,username,lexicon_id):
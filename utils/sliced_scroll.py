@@ -0,0 +1,86 @@
+""" Parallel reading of search results with a sliced scroll
+"""
+import copy
+import queue
+import threading
+
+from utils.es_transport import get_client
+
+# Marks the end of a slice in the page queue
+_SLICE_DONE = object()
+
+
+class SlicedScrollReader:
+    """ Reads the hits of a query page by page, scrolling several slices in parallel threads
+
+    Pages of the slices are interleaved, so the order of the hits is kept only with a single slice.
+    """
+
+    def __init__(self, index, query, n_slices=1, scroll_size=1000, time_out='5m', url=None):
+        self.index = index
+        self.query = query
+        self.n_slices = max(n_slices, 1)
+        self.scroll_size = scroll_size
+        self.time_out = time_out
+        self.client = get_client(url)
+        # Bounded, so that slices wait for the consumer instead of buffering the results
+        self._pages = queue.Queue(maxsize=2 * self.n_slices)
+        self._stop = threading.Event()
+
+    def __iter__(self):
+        threads = [threading.Thread(target=self._read_slice, args=(slice_id,), daemon=True) for slice_id in range(self.n_slices)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            slices_left = self.n_slices
+            while slices_left:
+                page = self._pages.get()
+                if page is _SLICE_DONE:
+                    slices_left -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            # Also reached when the consumer is closed, for example after the client disconnected
+            self._stop.set()
+
+    def _read_slice(self, slice_id):
+        body = copy.deepcopy(self.query)
+        body['size'] = self.scroll_size
+        if self.n_slices > 1:
+            body['slice'] = {'id': slice_id, 'max': self.n_slices}
+
+        scroll_id = None
+        try:
+            response = self.client.search(index=self.index, body=body, scroll=self.time_out)
+            # Set before checking for the stop, so that the context is cleared even if no page is read
+            scroll_id = response.get('_scroll_id')
+            while not self._stop.is_set():
+                scroll_id = response.get('_scroll_id', scroll_id)
+                hits = response['hits']['hits']
+                if not hits or not self._put(hits):
+                    break
+                response = self.client.scroll(scroll_id=scroll_id, scroll=self.time_out)
+        except Exception as e:
+            self._put(e)
+        finally:
+            if scroll_id:
+                try:
+                    self.client.clear_scroll(scroll_id=scroll_id, ignore=(404,))
+                except Exception:
+                    # The context expires after the scroll time out anyway
+                    pass
+            self._put(_SLICE_DONE)
+
+    def _put(self, item):
+        """ Waits for room in the page queue, returns False if reading was stopped
+        """
+        while not self._stop.is_set():
+            try:
+                self._pages.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -5,67 +5,130 @@ import os
 
 from texta.settings import MODELS_DIR
 
+# Beginning of a zip file, used to tell the array format from the old JSON format
+NPZ_MAGIC = b'PK'
+
+
 class WordCluster(object):
     """
     WordCluster object to cluster Word2Vec vectors using MiniBatchKMeans.
     : param embedding : Word2Vec object
     : param n_clusters, int, number of clusters in output
+
+    Every word is mapped to the etalon of its cluster, the vocabulary word most similar to the cluster center.
+    Clusters are stored as two arrays: the vocabulary and the vocabulary index of every word's etalon.
     """
-    def __init__(self):
-        self.word_to_cluster_dict = {}
-        self.cluster_dict = {}
-    
+    def __init__(self, chunk_size=10000, n_passes=3):
+        self.chunk_size = chunk_size
+        self.n_passes = n_passes
+        self.words = []
+        self.word_etalons = np.zeros(0, dtype=np.int32)
+        self._word_index = {}
+        self._cluster_order = None
+
     def cluster(self, embedding, n_clusters=None):
-        vocab = list(embedding.wv.vocab.keys())
-        vocab_vectors = np.array([embedding[word] for word in vocab])
-        
+        vocab = embedding.wv.index2word
+        # Chunks are views of the model's own vectors, which are not copied
+        vocab_vectors = embedding.wv.vectors
+
         if not n_clusters:
             # number of clusters = 10% of embedding vocabulary
             # if larger than 1000, limit to 1000
             n_clusters = int(len(vocab) * 0.1)
             if n_clusters > 1000:
                 n_clusters = 1000
+        n_clusters = max(n_clusters, 1)
+
+        chunk_size = max(self.chunk_size, n_clusters)
+        chunk_starts = np.arange(0, len(vocab), chunk_size)
+
+        clustering = MiniBatchKMeans(n_clusters=n_clusters)
+        random_state = np.random.RandomState(0)
+        for i in range(self.n_passes):
+            for start in random_state.permutation(chunk_starts):
+                # The last chunk is extended backwards to the full size, as the chunk
+                # initializing the centers must contain at least n_clusters vectors
+                chunk_start = max(min(start, len(vocab) - chunk_size), 0)
+                clustering.partial_fit(vocab_vectors[chunk_start:chunk_start + chunk_size])
+
+        # Etalon of a cluster is the word with the highest cosine similarity to its center
+        centers = clustering.cluster_centers_.astype(vocab_vectors.dtype)
+        centers /= np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+        best_similarities = np.full(n_clusters, -np.inf)
+        etalons = np.zeros(n_clusters, dtype=np.int32)
+        labels = np.zeros(len(vocab), dtype=np.int32)
+
+        for start in chunk_starts:
+            chunk = vocab_vectors[start:start + chunk_size]
+            labels[start:start + chunk_size] = clustering.predict(chunk)
+
+            similarities = chunk.dot(centers.T)
+            similarities /= np.maximum(np.linalg.norm(chunk, axis=1), 1e-12)[:, np.newaxis]
+            chunk_best = similarities.argmax(axis=0)
+            chunk_similarities = similarities[chunk_best, np.arange(n_clusters)]
+            improved = chunk_similarities > best_similarities
+            best_similarities[improved] = chunk_similarities[improved]
+            etalons[improved] = chunk_best[improved] + start
 
-        clustering = MiniBatchKMeans(n_clusters=n_clusters).fit(vocab_vectors)
-        cluster_labels = clustering.labels_
-        
-        for i,cluster_label in enumerate(cluster_labels):
-            word = vocab[i]
-            etalon = embedding.wv.most_similar(positive=[clustering.cluster_centers_[cluster_label]])[0][0]
-            
-            if etalon not in self.cluster_dict:
-                self.cluster_dict[etalon] = []
-                
-            self.cluster_dict[etalon].append(word)
-            self.word_to_cluster_dict[word] = etalon
-        
+        self._set_clusters(list(vocab), etalons[labels])
         return True
-    
+
+    def _set_clusters(self, words, word_etalons):
+        self.words = words
+        self.word_etalons = np.asarray(word_etalons, dtype=np.int32)
+        self._word_index = {word: i for i, word in enumerate(words)}
+        self._cluster_order = None
+
     def query(self, word):
-        try:
-            return self.cluster_dict[self.word_to_cluster_dict[word]]
-        except:
+        if word not in self._word_index:
             return []
-    
+        if self._cluster_order is None:
+            # Word indices grouped by etalon
+            self._cluster_order = np.argsort(self.word_etalons, kind='stable')
+        etalon = self.word_etalons[self._word_index[word]]
+        sorted_etalons = self.word_etalons[self._cluster_order]
+        start, end = np.searchsorted(sorted_etalons, [etalon, etalon + 1])
+        return [self.words[i] for i in self._cluster_order[start:end]]
+
     def text_to_clusters(self, text):
-        text = [str(self.word_to_cluster_dict[word]) for word in text if word in self.word_to_cluster_dict]
+        text = [self.words[self.word_etalons[self._word_index[word]]] for word in text if word in self._word_index]
         return ' '.join(text)
 
     def save(self, file_path):
         try:
-            data = {"word_to_cluster_dict": self.word_to_cluster_dict, "cluster_dict": self.cluster_dict}
-            with open(file_path, 'w') as fh:
-                fh.write(json.dumps(data))
+            # Words can not contain whitespace, so they are stored as a single newline separated string
+            words = np.frombuffer('\n'.join(self.words).encode('utf8'), dtype=np.uint8)
+            with open(file_path, 'wb') as fh:
+                np.savez_compressed(fh, words=words, word_etalons=self.word_etalons)
             return True
         except:
             return False
-    
-    def load(self, unique_id, task_type='train_tagger'):
-        file_path = os.path.join(MODELS_DIR, task_type, 'cluster_{}'.format(unique_id))
+
+    def load(self, unique_id, task_type='train_model'):
+        return self.load_file(os.path.join(MODELS_DIR, task_type, 'cluster_{}'.format(unique_id)))
+
+    def load_file(self, file_path):
         try:
-            with open(file_path) as fh:
-                data = json.loads(fh.read())
-            self.cluster_dict = data["cluster_dict"]
-            self.word_to_cluster_dict = data["word_to_cluster_dict"]
+            with open(file_path, 'rb') as fh:
+                is_npz = fh.read(len(NPZ_MAGIC)) == NPZ_MAGIC
+
+            if is_npz:
+                with np.load(file_path) as data:
+                    words = data['words'].tobytes().decode('utf8').split('\n') if data['words'].size else []
+                    self._set_clusters(words, data['word_etalons'])
+            else:
+                self._load_json(file_path)
+            return True
         except:
             return False
+
+    def _load_json(self, file_path):
+        """ Loads clusters saved in the old format of two JSON dicts
+        """
+        with open(file_path) as fh:
+            data = json.loads(fh.read())
+        words = list(data["word_to_cluster_dict"].keys())
+        word_index = {word: i for i, word in enumerate(words)}
+        # Etalons are vocabulary words
+        word_etalons = [word_index[data["word_to_cluster_dict"][word]] for word in words]
+        self._set_clusters(words, word_etalons)
@@ -0,0 +1,66 @@
+""" Benchmark of WordCluster on synthetic word vectors.
+
+Clusters random vocabularies of the given sizes and reports the clustering time, the size of the saved
+clusters and their loading time. Run from the project root:
+
+    python -m utils.word_cluster_benchmark --sizes 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from utils.word_cluster import WordCluster
+
+
+class SyntheticVectors(object):
+
+    def __init__(self, n_words, dimensions, random_state):
+        self.index2word = ['word_{}'.format(i) for i in range(n_words)]
+        self.vectors = random_state.standard_normal((n_words, dimensions)).astype(np.float32)
+
+
+class SyntheticEmbedding(object):
+    """ The part of a gensim Word2Vec model used by WordCluster.cluster
+    """
+
+    def __init__(self, n_words, dimensions, random_state):
+        self.wv = SyntheticVectors(n_words, dimensions, random_state)
+
+
+def benchmark(n_words, dimensions, n_clusters, directory):
+    embedding = SyntheticEmbedding(n_words, dimensions, np.random.RandomState(0))
+    word_cluster = WordCluster()
+
+    start = time.time()
+    word_cluster.cluster(embedding, n_clusters=n_clusters)
+    cluster_seconds = time.time() - start
+
+    file_path = os.path.join(directory, 'cluster_benchmark_{}'.format(n_words))
+    word_cluster.save(file_path)
+
+    start = time.time()
+    WordCluster().load_file(file_path)
+    load_seconds = time.time() - start
+
+    return cluster_seconds, os.path.getsize(file_path), load_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='vocabulary sizes')
+    parser.add_argument('--dimensions', type=int, default=100)
+    parser.add_argument('--clusters', type=int, default=1000)
+    args = parser.parse_args()
+
+    print('{:>10} {:>12} {:>10} {:>10}'.format('words', 'cluster (s)', 'file (MB)', 'load (s)'))
+    with tempfile.TemporaryDirectory() as directory:
+        for n_words in args.sizes:
+            cluster_seconds, file_size, load_seconds = benchmark(n_words, args.dimensions, args.clusters, directory)
+            print('{:>10} {:>12.1f} {:>10.2f} {:>10.2f}'.format(n_words, cluster_seconds, file_size / 1024 / 1024, load_seconds))
+
+
+if __name__ == '__main__':
+    main()